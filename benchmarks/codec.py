@@ -0,0 +1,120 @@
+"""Compare the storage codec against the base64-encoded pickle it replaced
+
+Run with `python -m benchmarks.codec`, which prints a JSON report of the size
+of synthetic storages of a few sizes in each format, and the time taken to
+encode and decode them, along with the codec's text packing by itself."""
+
+import typing as t
+import argparse
+import json
+import pickle
+import random
+import sys
+import time
+from base64 import b64encode, b64decode
+
+from chronos import codec, zones
+from chronos.models import GuildStorage, HallOfFameRequirements, Storage
+
+from .replay import git_commit
+
+# Mostly whole hour offsets, with some IANA zones and half hour offsets mixed in
+ZONES = [zones.fixed_key(hours * 60) for hours in range(-12, 15)] + [
+    "America/New_York",
+    "Europe/London",
+    "Asia/Kolkata",
+    "+05:30",
+    "-03:30",
+]
+
+
+def synthetic_storage(guilds: int, parties: int, members: int) -> Storage:
+    rng = random.Random(guilds * parties * members)
+    storage = Storage()
+    for _ in range(guilds):
+        guild = GuildStorage(
+            hall_of_fame=HallOfFameRequirements(
+                reaction_emoji="star",
+                reaction_count=5,
+                hof_channel=rng.getrandbits(60),
+            )
+        )
+        for party in range(parties):
+            guild.parties[f"party{party}"] = {
+                rng.getrandbits(60): rng.choice(ZONES) for _ in range(members)
+            }
+        storage.guilds[rng.getrandbits(60)] = guild
+    return storage
+
+
+def _time(func: t.Callable[[], t.Any], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def compare(storage: Storage, repeat: int = 20) -> t.Dict[str, t.Dict[str, float]]:
+    legacy = b64encode(pickle.dumps(storage.dict())).decode("ascii")
+    compact = codec.encode_storage(storage)
+    assert codec.decode_storage(compact) == storage
+    packed = codec.from_text(compact)
+
+    return {
+        "pickle+base64": {
+            "chars": len(legacy),
+            "encode_ms": 1000
+            * _time(lambda: b64encode(pickle.dumps(storage.dict())), repeat),
+            "decode_ms": 1000
+            * _time(lambda: Storage(**pickle.loads(b64decode(legacy))), repeat),
+        },
+        "codec": {
+            "chars": len(compact),
+            "encode_ms": 1000 * _time(lambda: codec.encode_storage(storage), repeat),
+            "decode_ms": 1000 * _time(lambda: codec.decode_storage(compact), repeat),
+        },
+        # Just turning the codec's bytes into text and back
+        "text": {
+            "chars": len(compact),
+            "encode_ms": 1000 * _time(lambda: codec.to_text(packed), repeat),
+            "decode_ms": 1000 * _time(lambda: codec.from_text(compact), repeat),
+        },
+    }
+
+
+# (guilds, parties, members per party)
+SIZES = [(1, 3, 5), (10, 5, 10), (100, 10, 20)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "parameters": vars(args),
+        "results": [
+            {
+                "guilds": guilds,
+                "parties": parties,
+                "members": members,
+                "formats": compare(
+                    synthetic_storage(guilds, parties, members), args.repeat
+                ),
+            }
+            for guilds, parties, members in SIZES
+        ],
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
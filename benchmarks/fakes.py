@@ -0,0 +1,380 @@
+"""In-process stand-ins for the parts of discord.py the bot uses
+
+Anything the bot checks with isinstance subclasses the real discord.py class,
+skipping its constructor. Every method which would hit Discord's API counts
+the call in an API object, and can optionally sleep to simulate latency."""
+
+import typing as t
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+import discord
+
+
+class API:
+    "Counts simulated Discord API calls"
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: t.Counter[str] = Counter()
+        self._ids = itertools.count()
+        self._started = int(time.time() * 1000) - discord.utils.DISCORD_EPOCH
+
+    def next_id(self) -> int:
+        """Make a new snowflake
+
+        Like Discord's, its timestamp (the bits above the 22nd) increases from
+        about now, and jitter in it spreads guilds across gateway shards like
+        real IDs."""
+        n = next(self._ids)
+        timestamp = self._started + n * 1024 + (n * 2654435761) % 1024
+        return timestamp << 22
+
+    async def call(self, name: str) -> None:
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            # Still yield to the event loop, as a real request would
+            await asyncio.sleep(0)
+
+
+class FakeMember(discord.Member):
+    def __init__(
+        self,
+        id: int,
+        name: str,
+        guild: t.Optional["FakeGuild"] = None,
+        bot: bool = False,
+    ) -> None:
+        self._fake_id = id
+        self._fake_name = name
+        self._fake_bot = bot
+        self.guild = guild  # type: ignore
+        self.administrator = False
+
+    @property
+    def id(self) -> int:  # type: ignore
+        return self._fake_id
+
+    @property
+    def name(self) -> str:  # type: ignore
+        return self._fake_name
+
+    @property
+    def display_name(self) -> str:
+        return self._fake_name
+
+    @property
+    def bot(self) -> bool:  # type: ignore
+        return self._fake_bot
+
+    @property
+    def avatar_url(self) -> str:  # type: ignore
+        return ""
+
+    @property
+    def guild_permissions(self) -> discord.Permissions:
+        return discord.Permissions(administrator=self.administrator)
+
+    def __str__(self) -> str:
+        return self._fake_name
+
+    def __repr__(self) -> str:
+        return f"<FakeMember id={self.id} name={self.name!r}>"
+
+
+class FakeGuild:
+    def __init__(self, api: API, id: int) -> None:
+        self.api = api
+        self.id = id
+        self.name = f"guild-{id}"
+        self._members: t.Dict[int, FakeMember] = {}
+        # Members Discord knows about but hasn't sent the client, by name
+        self._offline: t.Dict[int, str] = {}
+        self.large = False
+        self.chunked = True
+        self.channels: t.Dict[int, "FakeTextChannel"] = {}
+
+    @property
+    def members(self) -> t.List[FakeMember]:
+        return list(self._members.values())
+
+    @property
+    def text_channels(self) -> t.List["FakeTextChannel"]:
+        return list(self.channels.values())
+
+    def get_channel(self, id: int) -> t.Optional["FakeTextChannel"]:
+        return self.channels.get(id)
+
+    def add_member(self, id: int, name: str) -> FakeMember:
+        member = self._members[id] = FakeMember(id, name, self)
+        return member
+
+    def add_offline_member(self, id: int, name: str) -> None:
+        "Add a member which is only cached once it's requested"
+        self._offline[id] = name
+        self.large = True
+        self.chunked = False
+
+    def chunk(self) -> None:
+        "Cache every member, like the member chunks sent on request"
+        for id, name in self._offline.items():
+            self.add_member(id, name)
+        self._offline.clear()
+        self.chunked = True
+
+    def _find_member(self, id: int, cache: bool) -> t.Optional[FakeMember]:
+        member = self._members.get(id)
+        if member is None and id in self._offline:
+            if cache:
+                member = self.add_member(id, self._offline.pop(id))
+            else:
+                member = FakeMember(id, self._offline[id], self)
+        return member
+
+    def add_channel(self) -> "FakeTextChannel":
+        channel = FakeTextChannel(self.api, self.api.next_id(), self)
+        self.channels[channel.id] = channel
+        return channel
+
+    def get_member(self, id: int) -> t.Optional[FakeMember]:
+        return self._members.get(id)
+
+    async def fetch_member(self, id: int) -> FakeMember:
+        await self.api.call("fetch_member")
+        member = self._find_member(id, cache=False)
+        if member is None:
+            raise _not_found("Unknown Member")
+        return member
+
+    async def query_members(
+        self,
+        query: t.Optional[str] = None,
+        *,
+        limit: int = 5,
+        user_ids: t.Optional[t.List[int]] = None,
+        cache: bool = True,
+    ) -> t.List[FakeMember]:
+        await self.api.call("query_members")
+        if user_ids is None:
+            assert query is not None
+            prefix = query.lower()
+            names = itertools.chain(
+                ((id, member.name) for id, member in self._members.items()),
+                self._offline.items(),
+            )
+            user_ids = [id for id, name in names if name.lower().startswith(prefix)]
+        found = [self._find_member(id, cache) for id in user_ids[:limit]]
+        return [member for member in found if member is not None]
+
+
+class _FakeResponse:
+    def __init__(self, status: int) -> None:
+        self.status = status
+        self.reason = "Fake"
+
+
+def _not_found(message: str) -> discord.NotFound:
+    response: t.Any = _FakeResponse(404)
+    return discord.NotFound(response, message)
+
+
+class FakeReaction:
+    def __init__(self, emoji: str, count: int) -> None:
+        self.emoji = emoji
+        self.count = count
+
+
+class FakeMessage:
+    def __init__(
+        self,
+        api: API,
+        channel: "FakeTextChannel",
+        author: FakeMember,
+        content: str = "",
+        embed: t.Optional[discord.Embed] = None,
+    ) -> None:
+        self.api = api
+        self.id = api.next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embed = embed
+        self.embeds: t.List[discord.Embed] = [embed] if embed is not None else []
+        self.reactions: t.List[FakeReaction] = []
+        self.attachments: t.List[t.Any] = []
+        self.pinned = False
+
+    @property
+    def jump_url(self) -> str:
+        guild_id = self.guild.id if self.guild is not None else "@me"
+        return f"https://discord.com/channels/{guild_id}/{self.channel.id}/{self.id}"
+
+    async def edit(self, *, content: t.Optional[str] = None, **_kwargs: t.Any) -> None:
+        await self.api.call("edit_message")
+        if self.id not in self.channel.messages:
+            raise _not_found("Unknown Message")
+        if content is not None:
+            self.content = content
+
+    async def delete(self) -> None:
+        await self.api.call("delete_message")
+        self.channel.messages.pop(self.id, None)
+
+    async def pin(self) -> None:
+        await self.api.call("pin_message")
+        self.pinned = True
+
+    def react(self, emoji: str) -> None:
+        "Record a reaction without going through the API"
+        for reaction in self.reactions:
+            if reaction.emoji == emoji:
+                reaction.count += 1
+                return
+        self.reactions.append(FakeReaction(emoji, 1))
+
+
+class FakeTextChannel(discord.TextChannel):
+    def __init__(self, api: API, id: int, guild: t.Optional[FakeGuild] = None) -> None:
+        self.api = api
+        self.id = id
+        self.name = f"channel-{id}"
+        self.guild = guild  # type: ignore
+        self.messages: t.Dict[int, FakeMessage] = {}
+        self.author: t.Optional[FakeMember] = None
+
+    def __repr__(self) -> str:
+        return f"<FakeTextChannel id={self.id}>"
+
+    async def send(  # type: ignore
+        self,
+        content: t.Optional[str] = None,
+        *,
+        embed: t.Optional[discord.Embed] = None,
+        file: t.Optional[discord.File] = None,
+        **_kwargs: t.Any,
+    ) -> FakeMessage:
+        await self.api.call("send_message")
+        if content is not None and len(content) > 2000:
+            response: t.Any = _FakeResponse(400)
+            raise discord.HTTPException(response, "Message too long")
+
+        assert self.author is not None, "The channel's client wasn't set up"
+        msg = FakeMessage(self.api, self, self.author, content or "", embed)
+        self.messages[msg.id] = msg
+        return msg
+
+    def post(self, author: FakeMember, content: str) -> FakeMessage:
+        "Create a message from someone other than the bot, without the API"
+        msg = FakeMessage(self.api, self, author, content)
+        self.messages[msg.id] = msg
+        return msg
+
+    async def fetch_message(self, id: int) -> FakeMessage:  # type: ignore
+        await self.api.call("fetch_message")
+        try:
+            return self.messages[id]
+        except KeyError:
+            raise _not_found("Unknown Message") from None
+
+    async def delete_messages(  # type: ignore
+        self, messages: t.Iterable[FakeMessage]
+    ) -> None:
+        messages = list(messages)
+        if len(messages) > 100:
+            response: t.Any = _FakeResponse(400)
+            raise discord.HTTPException(response, "Too many messages")
+        await self.api.call("delete_messages")
+        for msg in messages:
+            self.messages.pop(msg.id, None)
+
+    async def pins(self) -> t.List[FakeMessage]:  # type: ignore
+        await self.api.call("pins")
+        return [msg for msg in self.messages.values() if msg.pinned]
+
+    async def history(  # type: ignore
+        self,
+        *,
+        limit: t.Optional[int] = 100,
+        before: t.Any = None,
+        after: t.Any = None,
+        oldest_first: t.Optional[bool] = None,
+    ) -> t.AsyncIterator[FakeMessage]:
+        messages = sorted(self.messages.values(), key=lambda msg: msg.id)
+        if after is not None:
+            messages = [msg for msg in messages if msg.id > after.id]
+        if before is not None:
+            messages = [msg for msg in messages if msg.id < before.id]
+        if oldest_first is None:
+            oldest_first = after is not None
+        if not oldest_first:
+            messages.reverse()
+        if limit is not None:
+            messages = messages[:limit]
+
+        # Discord returns history in pages of 100 messages
+        for i, msg in enumerate(messages):
+            if i % 100 == 0:
+                await self.api.call("history")
+            yield msg
+
+
+class FakeClient:
+    def __init__(self, api: API) -> None:
+        self.api = api
+        self.user = FakeMember(api.next_id(), "chronos", bot=True)
+        self.guilds: t.Dict[int, FakeGuild] = {}
+        self.channels: t.Dict[int, FakeTextChannel] = {}
+
+    def add_guild(self) -> FakeGuild:
+        guild = FakeGuild(self.api, self.api.next_id())
+        self.guilds[guild.id] = guild
+        return guild
+
+    def add_channel(self, guild: t.Optional[FakeGuild] = None) -> FakeTextChannel:
+        if guild is None:
+            channel = FakeTextChannel(self.api, self.api.next_id())
+        else:
+            channel = guild.add_channel()
+        channel.author = self.user
+        self.channels[channel.id] = channel
+        return channel
+
+    def get_channel(self, id: int) -> t.Optional[FakeTextChannel]:
+        return self.channels.get(id)
+
+    async def fetch_channel(self, id: int) -> FakeTextChannel:
+        await self.api.call("fetch_channel")
+        return self.channels[id]
+
+    def get_user(self, id: int) -> t.Optional[FakeMember]:
+        for guild in self.guilds.values():
+            member = guild.get_member(id)
+            if member is not None:
+                return member
+        return None
+
+    async def request_offline_members(self, *guilds: FakeGuild) -> None:
+        await self.api.call("request_offline_members")
+        for guild in guilds:
+            guild.chunk()
+
+
+def reaction_event(
+    message: FakeMessage, user: FakeMember, emoji: str, event_type: str = "REACTION_ADD"
+) -> discord.RawReactionActionEvent:
+    data: t.Any = {
+        "message_id": message.id,
+        "channel_id": message.channel.id,
+        "user_id": user.id,
+        "guild_id": message.guild.id if message.guild is not None else None,
+    }
+    # The stubs don't know PartialEmoji's keyword-only constructor
+    partial_emoji = discord.PartialEmoji(name=emoji)  # type: ignore
+    return discord.RawReactionActionEvent(
+        data, partial_emoji, event_type  # type: ignore
+    )
@@ -0,0 +1,160 @@
+"""Measure the memory and time each member cache mode costs in a large guild
+
+Run with `python -m benchmarks.members`, which runs the bot in a fresh process
+for each `MEMBER_CACHE` mode, against one fake guild whose members are only
+known to the fake Discord until they're requested. Each mode is timed from
+connecting to being ready (including fetching every member in full mode), and
+to answering its first and later commands which look a member up by name,
+which is when lazy mode fetches the members and minimal mode queries them.
+The JSON report gives those times, the resident memory the bot grew by at
+each step, and the Discord API calls it would have made. Minimal mode's
+lookups include the fake searching its own member list, standing in for the
+query's round trip."""
+
+import typing as t
+import argparse
+import asyncio
+import gc
+import json
+import multiprocessing
+import sys
+import time
+
+import structlog  # type: ignore
+
+from chronos import logs
+
+from .replay import World, command, git_commit
+
+MODES = ["full", "lazy", "minimal"]
+
+
+def rss_mb() -> t.Optional[float]:
+    "This process' resident memory, where /proc is available"
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _grew(before: t.Optional[float], after: t.Optional[float]) -> t.Optional[float]:
+    if before is None or after is None:
+        return None
+    return after - before
+
+
+async def run_mode(args: argparse.Namespace, mode: str) -> t.Dict[str, t.Any]:
+    world = World(args.seed, args.latency, member_cache=mode)
+    guild = world.client.add_guild()
+    channel = world.client.add_channel(guild)
+    admin = guild.add_member(world.api.next_id(), "admin")
+    admin.administrator = True
+    names = []
+    for _ in range(args.members):
+        name = world.name()
+        guild.add_offline_member(world.api.next_id(), name)
+        names.append(name)
+    lookups = [
+        command(world, channel, admin, f"c!add-timezone p0 3 {name}")
+        for name in world.rng.sample(names, args.lookups + 1)
+    ]
+    await command(world, channel, admin, "c!create-party p0")()
+
+    gc.collect()
+    baseline = rss_mb()
+    calls_before = world.api.calls.copy()
+
+    start = time.perf_counter()
+    if mode == "full":
+        # What fetch_offline_members does before the client is ready
+        await world.client.request_offline_members(guild)
+    await world.bot.on_ready()
+    ready = time.perf_counter() - start
+    gc.collect()
+    ready_rss = rss_mb()
+
+    start = time.perf_counter()
+    await lookups[0]()
+    first = time.perf_counter() - start
+
+    samples = []
+    for lookup in lookups[1:]:
+        start = time.perf_counter()
+        await lookup()
+        samples.append(time.perf_counter() - start)
+    gc.collect()
+    lookups_rss = rss_mb()
+
+    await world.bot.outbox.drain()
+    await world.bot.close()
+
+    return {
+        "mode": mode,
+        "ready_ms": ready * 1000,
+        "first_lookup_ms": first * 1000,
+        "later_lookup_ms": {
+            "min": min(samples) * 1000,
+            "median": sorted(samples)[len(samples) // 2] * 1000,
+        },
+        "rss_mb": {
+            "baseline": baseline,
+            "grew_until_ready": _grew(baseline, ready_rss),
+            "grew_until_lookups": _grew(baseline, lookups_rss),
+        },
+        "cached_members": len(guild.members),
+        "api_calls": dict(world.api.calls - calls_before),
+    }
+
+
+def worker(job: t.Tuple[argparse.Namespace, str]) -> t.Dict[str, t.Any]:
+    args, mode = job
+    logs.configure("warning")
+    structlog.configure(logger_factory=structlog.PrintLoggerFactory(sys.stderr))
+    return asyncio.run(run_mode(args, mode))
+
+
+def run(args: argparse.Namespace) -> t.Dict[str, t.Any]:
+    # Spawned, so no mode's memory is shared with or left over from another's
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for mode in args.modes:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(worker, ((args, mode),)))
+
+    return {
+        "commit": git_commit(),
+        "parameters": vars(args),
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=50000)
+    parser.add_argument(
+        "--lookups", type=int, default=20, help="name lookups after the first"
+    )
+    parser.add_argument(
+        "--modes", nargs="+", choices=MODES, default=MODES, metavar="MODE"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="simulated API latency in seconds"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        sys.stdout.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
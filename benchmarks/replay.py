@@ -0,0 +1,278 @@
+"""Drive the bot with generated workloads against fake Discord objects
+
+Run with `python -m benchmarks.replay`, which prints a JSON report of each
+workload's throughput, handler latency percentiles, storage size and the
+Discord API calls it would have made."""
+
+import typing as t
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import structlog  # type: ignore
+
+from chronos import logs
+from chronos.bot import Bot, Settings
+
+from .fakes import API, FakeClient, FakeGuild, FakeMember, FakeTextChannel
+from .fakes import reaction_event
+
+HOF_EMOJI = "⭐"
+
+
+class World:
+    "A fake Discord with some guilds, members and a bot running in them"
+
+    def __init__(self, seed: int, latency: float, **settings: t.Any) -> None:
+        self.rng = random.Random(seed)
+        self.api = API(latency)
+        self.client = FakeClient(self.api)
+        self.storage_channel = self.client.add_channel()
+        self.guilds: t.List[
+            t.Tuple[FakeGuild, FakeTextChannel, t.List[FakeMember]]
+        ] = []
+
+        options: t.Dict[str, t.Any] = dict(
+            discord_token="",
+            storage_channel=self.storage_channel.id,
+            storage_flush_interval=0.01,
+        )
+        options.update(settings)
+        self.bot = Bot(Settings(**options), self.client)  # type: ignore
+
+    def populate(self, guilds: int, members: int) -> None:
+        for _ in range(guilds):
+            guild = self.client.add_guild()
+            channel = self.client.add_channel(guild)
+            guild_members = [
+                guild.add_member(self.api.next_id(), self.name())
+                for _ in range(members)
+            ]
+            guild_members[0].administrator = True
+            self.guilds.append((guild, channel, guild_members))
+
+    def name(self) -> str:
+        "Make up a member name"
+        syllables = ["ka", "ri", "to", "mo", "ne", "sa", "lu", "vi", "dor", "an"]
+        return "".join(
+            self.rng.choice(syllables) for _ in range(self.rng.randint(2, 4))
+        )
+
+    def storage_chars(self) -> int:
+        return sum(
+            len(msg.content)
+            for msg in self.storage_channel.messages.values()
+            if msg.author == self.client.user
+        )
+
+
+Event = t.Callable[[], t.Awaitable[None]]
+
+
+def command(
+    world: World, channel: FakeTextChannel, author: FakeMember, content: str
+) -> Event:
+    async def run() -> None:
+        await world.bot.on_message(channel.post(author, content))  # type: ignore
+
+    return run
+
+
+def setup_parties(world: World, parties: int) -> t.List[Event]:
+    "Create parties in every guild and fill them with every member"
+    events = []
+    for guild, channel, members in world.guilds:
+        admin = members[0]
+        for party in range(parties):
+            events.append(command(world, channel, admin, f"c!create-party p{party}"))
+        for i, member in enumerate(members):
+            offset = world.rng.randint(-12, 14)
+            events.append(
+                command(
+                    world,
+                    channel,
+                    admin,
+                    f"c!add-timezone p{i % parties} {offset} {member.id}",
+                )
+            )
+    return events
+
+
+def convert_burst(world: World, count: int) -> t.List[Event]:
+    events = []
+    for _ in range(count):
+        _guild, channel, members = world.rng.choice(world.guilds)
+        author = world.rng.choice(members)
+        hour = world.rng.randint(0, 23)
+        events.append(command(world, channel, author, f"c!convert {hour}:00"))
+    return events
+
+
+def add_timezone_by_name_burst(world: World, count: int) -> t.List[Event]:
+    events = []
+    for _ in range(count):
+        _guild, channel, members = world.rng.choice(world.guilds)
+        member = world.rng.choice(members)
+        offset = world.rng.randint(-12, 14)
+        events.append(
+            command(
+                world,
+                channel,
+                members[0],
+                f"c!add-timezone p0 {offset} {member.display_name}",
+            )
+        )
+    return events
+
+
+def list_parties(world: World, count: int) -> t.List[Event]:
+    events = []
+    for _ in range(count):
+        _guild, channel, members = world.rng.choice(world.guilds)
+        events.append(command(world, channel, members[0], "c!parties"))
+    return events
+
+
+def reaction_storm(world: World, messages: int, reactions: int) -> t.List[Event]:
+    "Configure a hall of fame everywhere, then react to some messages a lot"
+    events = []
+    targets = []
+    for guild, channel, members in world.guilds:
+        hof_channel = world.client.add_channel(guild)
+        events.append(
+            command(
+                world,
+                channel,
+                members[0],
+                f"c!hof-requirements {HOF_EMOJI} 3 {hof_channel.id}",
+            )
+        )
+        for _ in range(messages):
+            targets.append((channel.post(world.rng.choice(members), "hi"), members))
+
+    for _ in range(reactions):
+        message, members = world.rng.choice(targets)
+        # Most reactions in a storm aren't the hall of fame emoji
+        emoji = HOF_EMOJI if world.rng.random() < 0.2 else "😂"
+
+        async def react(message: t.Any = message, emoji: str = emoji) -> None:
+            message.react(emoji)
+            payload = reaction_event(message, world.rng.choice(members), emoji)
+            await world.bot.on_raw_reaction_add(payload)
+
+        events.append(react)
+    return events
+
+
+def _percentile(samples: t.List[float], q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+async def run_events(
+    world: World, name: str, events: t.List[Event]
+) -> t.Dict[str, t.Any]:
+    calls_before = world.api.calls.copy()
+    latencies = []
+
+    start = time.perf_counter()
+    for event in events:
+        event_start = time.perf_counter()
+        await event()
+        latencies.append(time.perf_counter() - event_start)
+    elapsed = time.perf_counter() - start
+
+    # Let the queued replies go out and the storage writer catch up, so their
+    # calls count towards this workload
+    await world.bot.outbox.drain()
+    await asyncio.sleep(world.bot.settings.storage_flush_interval * 3)
+
+    return {
+        "workload": name,
+        "events": len(events),
+        "seconds": elapsed,
+        "events_per_second": len(events) / elapsed if elapsed else None,
+        "latency_ms": {
+            "p50": _percentile(latencies, 0.5) * 1000,
+            "p99": _percentile(latencies, 0.99) * 1000,
+            "mean": statistics.mean(latencies) * 1000,
+        },
+        "storage_chars": world.storage_chars(),
+        "api_calls": dict(world.api.calls - calls_before),
+    }
+
+
+async def run(args: argparse.Namespace) -> t.Dict[str, t.Any]:
+    world = World(args.seed, args.latency, storage_journal=args.journal)
+    world.populate(args.guilds, args.members)
+    await world.bot.on_ready()
+
+    results = [
+        await run_events(world, "setup_parties", setup_parties(world, args.parties)),
+        await run_events(world, "convert_burst", convert_burst(world, args.events)),
+        await run_events(
+            world,
+            "add_timezone_by_name",
+            add_timezone_by_name_burst(world, args.events),
+        ),
+        await run_events(world, "list_parties", list_parties(world, args.events // 10)),
+        await run_events(
+            world, "reaction_storm", reaction_storm(world, 5, args.events)
+        ),
+    ]
+    await world.bot.close()
+
+    return {
+        "commit": git_commit(),
+        "parameters": vars(args),
+        "results": results,
+        "total_api_calls": dict(world.api.calls),
+    }
+
+
+def git_commit() -> t.Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--parties", type=int, default=5)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="simulated API latency in seconds"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--journal", action="store_true", help="write storage changes to a journal"
+    )
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    # Log like the bot does by default, but keep the logs out of the report
+    logs.configure()
+    structlog.configure(logger_factory=structlog.PrintLoggerFactory(sys.stderr))
+
+    report = json.dumps(
+        asyncio.get_event_loop().run_until_complete(run(args)), indent=2
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        sys.stdout.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
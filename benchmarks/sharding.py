@@ -0,0 +1,166 @@
+"""Run the bot sharded across worker processes against a fake gateway
+
+Run with `python -m benchmarks.sharding`, which splits the shards between the
+workers like the coordinator does, and runs each worker in its own process
+with a fake gateway that only delivers its own shards' guilds. Each worker
+keeps its shards' storage in SQLite databases in a temporary directory, which
+are checked afterwards to hold every guild exactly once, in its shard's
+database. The JSON report compares the throughput of each number of workers."""
+
+import typing as t
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import structlog  # type: ignore
+
+from chronos import logs
+from chronos.coordinator import assign
+from chronos.storage import shard_of
+
+from .replay import World, convert_burst, git_commit, setup_parties
+
+
+def connect_shards(world: World, shard_ids: t.List[int], shard_count: int) -> None:
+    "Make the fake gateway only deliver the guilds of the given shards"
+    world.guilds = [
+        entry
+        for entry in world.guilds
+        if shard_of(entry[0].id, shard_count) in shard_ids
+    ]
+    world.client.guilds = {guild.id: guild for guild, _channel, _m in world.guilds}
+
+
+async def run_worker(
+    args: argparse.Namespace, shard_ids: t.List[int], directory: str
+) -> t.Dict[str, t.Any]:
+    # Every worker generates the same guilds, and keeps only its own
+    world = World(
+        args.seed,
+        0.0,
+        storage_backend="sqlite",
+        storage_path=os.path.join(directory, "chronos.db"),
+        shard_count=args.shards,
+        shard_ids=shard_ids,
+    )
+    world.populate(args.guilds, args.members)
+    connect_shards(world, shard_ids, args.shards)
+    await world.bot.on_ready()
+
+    events = setup_parties(world, args.parties)
+    events += convert_burst(
+        world, args.events * len(world.guilds) // max(args.guilds, 1)
+    )
+    start = time.perf_counter()
+    for event in events:
+        await event()
+    # Replies are paced by Discord's rate limits rather than the CPU, so they
+    # go out after the handlers are timed
+    elapsed = time.perf_counter() - start
+    await world.bot.close()
+
+    return {
+        "shards": shard_ids,
+        "guilds": [guild.id for guild, _channel, _members in world.guilds],
+        "events": len(events),
+        "seconds": elapsed,
+    }
+
+
+def worker(job: t.Tuple[argparse.Namespace, t.List[int], str]) -> t.Dict[str, t.Any]:
+    args, shard_ids, directory = job
+    logs.configure("warning")
+    structlog.configure(logger_factory=structlog.PrintLoggerFactory(sys.stderr))
+    return asyncio.run(run_worker(args, shard_ids, directory))
+
+
+def check_partitions(
+    directory: str, shard_count: int, expected: t.Set[int]
+) -> t.List[str]:
+    "Check every guild is stored once, in its own shard's database"
+    problems = []
+    seen: t.Set[int] = set()
+    for shard in range(shard_count):
+        path = os.path.join(directory, f"chronos-{shard}.db")
+        if not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(path)
+        try:
+            guild_ids = [row[0] for row in conn.execute("SELECT guild_id FROM guilds")]
+        finally:
+            conn.close()
+        for guild_id in guild_ids:
+            if shard_of(guild_id, shard_count) != shard:
+                problems.append(f"guild {guild_id} is stored in shard {shard}")
+            if guild_id in seen:
+                problems.append(f"guild {guild_id} is stored more than once")
+            seen.add(guild_id)
+    problems += [f"guild {guild_id} wasn't stored" for guild_id in expected - seen]
+    return problems
+
+
+def run(args: argparse.Namespace, workers: int) -> t.Dict[str, t.Any]:
+    with tempfile.TemporaryDirectory() as directory:
+        jobs = [
+            (args, shard_ids, directory) for shard_ids in assign(args.shards, workers)
+        ]
+        start = time.perf_counter()
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.map(worker, jobs)
+        elapsed = time.perf_counter() - start
+
+        guilds = {guild_id for result in results for guild_id in result["guilds"]}
+        events = sum(result["events"] for result in results)
+        # The workers run at once, so they're done when the slowest one is
+        slowest = max(result["seconds"] for result in results)
+        return {
+            "workers": len(jobs),
+            "guilds": len(guilds),
+            "events": events,
+            "wall_seconds": elapsed,
+            "slowest_worker_seconds": slowest,
+            "events_per_second": events / slowest if slowest else None,
+            "problems": check_partitions(directory, args.shards, guilds),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=400)
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--parties", type=int, default=3)
+    parser.add_argument("--events", type=int, default=4000)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, min(os.cpu_count() or 1, 4)],
+        help="the numbers of worker processes to compare",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "commit": git_commit(),
+        "parameters": vars(args),
+        "results": [run(args, workers) for workers in args.workers],
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
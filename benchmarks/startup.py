@@ -0,0 +1,152 @@
+"""Measure how long the bot takes to start
+
+Run with `python -m benchmarks.startup`, which prints a JSON report of the
+time taken to import the bot in a fresh interpreter, which of the lazily
+imported modules got imported anyway, and the time taken to load a large
+synthetic storage from fake storage messages, both in the storage codec and in
+the base64-encoded pickle it replaced."""
+
+import typing as t
+import argparse
+import asyncio
+import json
+import pickle
+import subprocess
+import sys
+import time
+from base64 import b64encode
+
+import structlog  # type: ignore
+
+from chronos import logs
+from chronos.models import Storage
+from chronos.storage import MessageStore
+
+from .codec import synthetic_storage
+from .fakes import API, FakeClient, FakeTextChannel
+from .replay import git_commit
+
+# Modules which shouldn't be imported until the bot first needs them
+LAZY_MODULES = ["fuzzywuzzy", "HumanTime", "aiohttp.web"]
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import chronos.__main__
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_import(repeat: int) -> t.Dict[str, t.Any]:
+    "Time importing the bot's entry point in fresh interpreters"
+    samples = []
+    modules: t.List[str] = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", _IMPORT_SCRIPT],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        report = json.loads(result.stdout)
+        samples.append(report["seconds"])
+        modules = report["modules"]
+
+    return {
+        "import_ms": {
+            "min": min(samples) * 1000,
+            "median": sorted(samples)[len(samples) // 2] * 1000,
+        },
+        "eagerly_imported": [module for module in LAZY_MODULES if module in modules],
+    }
+
+
+async def _time_load(
+    client: FakeClient, channel: FakeTextChannel, storage: Storage, repeat: int
+) -> t.Dict[str, float]:
+    "Time loading the storage kept in a fake storage channel"
+    samples = []
+    for _ in range(repeat):
+        store = MessageStore(client, channel.id)  # type: ignore
+        start = time.perf_counter()
+        loaded = await store.load()
+        samples.append(time.perf_counter() - start)
+    assert loaded == storage
+
+    return {
+        "min": min(samples) * 1000,
+        "median": sorted(samples)[len(samples) // 2] * 1000,
+    }
+
+
+async def measure_load(
+    guilds: int, parties: int, members: int, repeat: int
+) -> t.Dict[str, t.Any]:
+    """Time loading a large storage saved to fake storage messages, and saved
+    as the single base64-encoded pickle message the codec replaced"""
+    storage = synthetic_storage(guilds, parties, members)
+
+    client = FakeClient(API())
+    channel = client.add_channel()
+    writer = MessageStore(client, channel.id)  # type: ignore
+    await writer.save(storage, set(storage.guilds))
+
+    # Posted directly, since a storage this large never fit in one message
+    legacy_channel = client.add_channel()
+    legacy = b64encode(pickle.dumps(storage.dict())).decode("ascii")
+    legacy_channel.post(client.user, legacy)
+
+    # What validating the loaded storage again would cost on top of that
+    start = time.perf_counter()
+    Storage(**storage.dict())
+    validate = time.perf_counter() - start
+
+    return {
+        "guilds": guilds,
+        "shards": len(channel.messages) - 1,
+        "storage_chars": {
+            "pickle+base64": len(legacy),
+            "codec": sum(len(msg.content) for msg in channel.messages.values()),
+        },
+        "load_ms": {
+            "pickle+base64": await _time_load(client, legacy_channel, storage, repeat),
+            "codec": await _time_load(client, channel, storage, repeat),
+        },
+        "skipped_validation_ms": validate * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--parties", type=int, default=5)
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    # Log like the bot does by default, but keep the logs out of the report
+    logs.configure()
+    structlog.configure(logger_factory=structlog.PrintLoggerFactory(sys.stderr))
+
+    load = asyncio.get_event_loop().run_until_complete(
+        measure_load(args.guilds, args.parties, args.members, args.repeat)
+    )
+    report = {
+        "commit": git_commit(),
+        "parameters": vars(args),
+        "import": measure_import(args.repeat),
+        "load": load,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,92 @@
 import typing as t
-import os
+import asyncio
+import signal
 
 import discord
-import structlog  # type: ignore
 
+from . import logs
 from .bot import Bot, Settings
 
-settings = Settings()
-client = discord.Client()
-bot = Bot(settings, client)
 
+def create_client(settings: Settings) -> t.Tuple[discord.Client, Bot]:
+    "Create the Discord client and the bot handling its events"
+    options: t.Dict[str, t.Any] = dict(
+        max_messages=settings.max_messages,
+        fetch_offline_members=settings.member_cache == "full",
+        guild_subscriptions=settings.member_cache != "minimal",
+    )
+    client: discord.Client
+    if settings.shard_count is None:
+        client = discord.Client(**options)
+    else:
+        # One connection per shard, all on this process's event loop
+        client = discord.AutoShardedClient(
+            shard_ids=settings.shard_ids, shard_count=settings.shard_count, **options
+        )
+    bot = Bot(settings, client)
+    bot.metrics.instrument(client)
 
-structlog.configure(
-    processors=[
-        structlog.processors.StackInfoRenderer(),
-        structlog.dev.set_exc_info,
-        structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.KeyValueRenderer(key_order=["event"]),
-    ],
-)
+    @client.event
+    async def on_ready() -> None:
+        await bot.on_ready()
 
+    @client.event
+    async def on_message(message: discord.Message) -> None:
+        await bot.on_message(message)
 
-@client.event
-async def on_message(message: discord.Message) -> None:
-    await bot.on_message(message)
+    @client.event
+    async def on_raw_reaction_add(payload: discord.RawReactionActionEvent) -> None:
+        await bot.on_raw_reaction_add(payload)
 
+    @client.event
+    async def on_raw_reaction_remove(
+        payload: discord.RawReactionActionEvent,
+    ) -> None:
+        await bot.on_raw_reaction_remove(payload)
 
-@client.event
-async def on_reaction_add(
-    reaction: discord.Reaction,
-    user: t.Union[discord.User, discord.Member],
-) -> None:
-    await bot.on_reaction_add(reaction, user)
+    @client.event
+    async def on_member_join(member: discord.Member) -> None:
+        await bot.on_member_join(member)
 
+    @client.event
+    async def on_member_remove(member: discord.Member) -> None:
+        await bot.on_member_remove(member)
 
-client.run(settings.discord_token)
+    @client.event
+    async def on_member_update(before: discord.Member, after: discord.Member) -> None:
+        await bot.on_member_update(before, after)
+
+    return client, bot
+
+
+async def run(client: discord.Client, bot: Bot, token: str) -> None:
+    async def shutdown() -> None:
+        # Flush pending storage while the HTTP session is still open
+        await bot.close()
+        await client.close()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            client.loop.add_signal_handler(
+                sig, lambda: asyncio.ensure_future(shutdown())
+            )
+        except NotImplementedError:
+            # Signal handlers aren't available on Windows event loops
+            pass
+
+    try:
+        await client.start(token)
+    finally:
+        if not client.is_closed():
+            await shutdown()
+
+
+def main() -> None:
+    settings = Settings()
+    logs.configure(settings.log_level, settings.log_sample_rates)
+    client, bot = create_client(settings)
+    client.loop.run_until_complete(run(client, bot, settings.discord_token))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,299 @@
 import typing as t
-from datetime import datetime
-import pickle
-import os
-from base64 import b64encode, b64decode
+import asyncio
+import io
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
 
 import discord
 import structlog  # type: ignore
-import HumanTime as human_time  # type: ignore
 import pydantic
-from fuzzywuzzy.process import extractOne as fuzzy_find  # type: ignore
 
-from .utils import utc
+from . import listing, overlap, partyfile, zones
+from .convert import RenderCache, paginate, render as render_conversion
+from .hof import Backfill, CandidateCache, posted_messages, window_start
+from .logs import Level, summarize_parties
+from .metrics import Metrics, serve as serve_metrics
+from .models import (
+    GuildStorage,
+    HallOfFameBackfill,
+    HallOfFameRequirements,
+    Reminder,
+    Storage,
+)
+from .names import NameIndex
+from .outbox import BACKGROUND, Outbox
+from .scheduler import Scheduler
+from .storage import (
+    MessageStore,
+    PartitionedStore,
+    ShardCountChanged,
+    Store,
+    StorageTooLarge,
+)
+from .utils import parse_time
+
+if t.TYPE_CHECKING:
+    from aiohttp import web
 
 
 COMMAND_PREFIX = "c!"
 
+# How many rendered conversions are kept for repeated requests
+CONVERSION_CACHE_SIZE = 256
 
-class HallOfFameRequirements(pydantic.BaseModel):
-    reaction_emoji: str
-    reaction_count: int
-    hof_channel: int
+# How many guilds' rendered party listings are kept
+LISTING_CACHE_SIZE = 256
 
+# The most members Discord finds with one query
+QUERY_MEMBERS_LIMIT = 100
 
-# per-guild storage
-class GuildStorage(pydantic.BaseModel):
-    parties: t.Dict[str, t.Dict[int, int]] = {}
-    hall_of_fame: t.Optional[HallOfFameRequirements] = None
+# How many queries for names are made at once when no member list is kept
+NAME_QUERY_CONCURRENCY = 8
 
+# How many members missing from an overlap are mentioned by name
+OVERLAP_MAX_MISSING = 10
 
-class Storage(pydantic.BaseModel):
-    guilds: t.Dict[int, GuildStorage] = {}
+# Limits on reminders, which have to fit in the guild's storage
+MAX_REMINDERS_PER_GUILD = 25
+MAX_REMINDER_TEXT = 200
+
+# Reminders going off later than this, like after downtime, are sent together
+LATE_REMINDER_SECONDS = 300
+
+# How many members are mentioned on each line of a reminder
+MENTIONS_PER_LINE = 40
+
+# The largest party file c!import-party reads, in bytes
+MAX_IMPORT_BYTES = 256 * 1024
+
+# How many problems with a party file are listed before giving up
+MAX_IMPORT_ERRORS = 10
+
+# How long, in seconds, the writer waits before retrying a failed write, at
+# first and at most, as the wait doubles with each failure in a row
+WRITER_RETRY_DELAY = 1.0
+WRITER_MAX_RETRY_DELAY = 300.0
 
 
 class Settings(pydantic.BaseSettings):
     discord_token: str
-    storage_channel: int
+
+    # Where the bot's storage is kept:
+    # - "discord" keeps it in messages in the storage channel
+    # - "sqlite" keeps it in a SQLite database at storage_path
+    storage_backend: t.Literal["discord", "sqlite"] = "discord"
+    storage_channel: t.Optional[int] = None
+    storage_path: str = "chronos.db"
+
+    # The ID of the storage manifest message, to skip searching for it on boot
+    storage_message: t.Optional[int] = None
+
+    # How many gateway shards the bot runs as, and which of them this process
+    # runs, all of them by default. Each shard's guilds are stored apart
+    shard_count: t.Optional[int] = None
+    shard_ids: t.Optional[t.List[int]] = None
+
+    # How often, in seconds, pending storage changes are written to Discord
+    storage_flush_interval: float = 5.0
+
+    # Whether changes are written to Discord as a journal of small messages,
+    # which is compacted into the storage shards after this many messages
+    storage_journal: bool = False
+    storage_compact_after: int = 50
+
+    # The lowest score (out of 100) a fuzzy name match needs to be accepted
+    name_match_threshold: int = 70
+
+    # How many messages discord.py keeps in its cache, None meaning no cache.
+    # The bot doesn't need any, since hall of fame reactions are tracked below
+    max_messages: t.Optional[int] = None
+
+    # How much of each guild's member list to keep in memory:
+    # - "full" fetches every member when connecting, like discord.py does
+    # - "lazy" only fetches a guild's members the first time a name is looked up
+    # - "minimal" keeps no member list, and asks Discord on every name lookup
+    member_cache: t.Literal["full", "lazy", "minimal"] = "lazy"
+
+    # How many messages with hall of fame reactions are tracked at once
+    hof_candidate_cache_size: int = 10000
+
+    # How many channels' histories c!hof-backfill reads from at once
+    hof_backfill_concurrency: int = 4
+
+    # How many days a message's reactions count towards the hall of fame for,
+    # if limited. Messages inducted by reactions are then forgotten once
+    # they're older, so storage stays bounded
+    hof_reaction_window_days: t.Optional[int] = None
+
+    # How many days ahead c!overlap looks for times when a party is free
+    overlap_horizon_days: int = 14
+
+    # Where to serve metrics over HTTP, if anywhere
+    metrics_host: str = "127.0.0.1"
+    metrics_port: t.Optional[int] = None
+
+    # The lowest level of log events which are written
+    log_level: Level = "info"
+
+    # The fraction of events to log, keyed by event name or a dotted prefix of
+    # it, e.g. {"hof.reaction.": 0.01}. Events not listed are always logged
+    log_sample_rates: t.Dict[str, float] = {}
+
+    @pydantic.validator("shard_ids")
+    def _shards_in_range(
+        cls, shard_ids: t.Optional[t.List[int]], values: t.Dict[str, t.Any]
+    ) -> t.Optional[t.List[int]]:
+        count: t.Optional[int] = values.get("shard_count")
+        if shard_ids is None:
+            return None
+        if count is None:
+            raise ValueError("shard IDs need a shard count")
+        if any(not 0 <= id_ < count for id_ in shard_ids):
+            raise ValueError(f"shard IDs must be between 0 and {count - 1}")
+        return shard_ids
+
+    @pydantic.validator("storage_channel", always=True)
+    def _channel_for_discord(
+        cls, channel: t.Optional[int], values: t.Dict[str, t.Any]
+    ) -> t.Optional[int]:
+        if channel is None and values.get("storage_backend") == "discord":
+            raise ValueError("a storage channel is needed to store data in Discord")
+        return channel
 
 
 class Bot:
     def __init__(self, settings: Settings, client: discord.Client) -> None:
         self.client = client
         self.settings = settings
+        self.metrics = Metrics()
+        self._metrics_runner: t.Optional["web.AppRunner"] = None
 
-        self._storage_msg: t.Optional[discord.Message] = None
-        self._loaded_storage = False
+        self._store: Store
+        if settings.shard_count is None:
+            self._store = self._create_store()
+        else:
+            shard_ids = settings.shard_ids or range(settings.shard_count)
+            self._store = PartitionedStore(
+                {shard: self._create_store(shard) for shard in shard_ids},
+                settings.shard_count,
+            )
+        self._load_task: t.Optional["asyncio.Task[None]"] = None
+
+        # Replies are queued, so commands don't wait on Discord's rate limits
+        self.outbox = Outbox(self.metrics)
 
         self._storage = Storage()
 
-    async def _storage_channel(self) -> discord.TextChannel:
-        chan = await self.client.fetch_channel(self.settings.storage_channel)
-        assert isinstance(chan, discord.TextChannel)
-        return chan
+        # Commands changing a guild's storage run one at a time per guild
+        self._guild_locks: t.DefaultDict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+        # IDs of the guilds whose storage changed, consumed by the writer task.
+        # None tells the writer to do a last write and stop
+        self._save_queue: "asyncio.Queue[t.Optional[int]]" = asyncio.Queue()
+        self._writer_task: t.Optional["asyncio.Task[None]"] = None
+        # Set on close, cutting short the writer's wait to retry a failed write
+        self._closing = asyncio.Event()
+
+        # guild ID -> name of its hall of fame emoji, for guilds which set one
+        self._hof_emoji: t.Dict[int, str] = {}
+        self._hof_candidates = CandidateCache(settings.hof_candidate_cache_size)
+        # guild ID -> its running scan of older messages for the hall of fame
+        self._backfills: t.Dict[int, "asyncio.Task[None]"] = {}
+
+        # Recently rendered conversions, keyed by party version and instant
+        self._conversions = RenderCache(CONVERSION_CACHE_SIZE)
+        # Recently rendered party listings, kept until the parties change
+        self._listings = listing.ListingCache(LISTING_CACHE_SIZE)
+
+        # Pending reminders, as (guild ID, reminder ID)
+        self._reminders: Scheduler[t.Tuple[int, int]] = Scheduler(self._fire_reminders)
+
+        # guild ID -> index of its members' display names, built on first use
+        self._names: t.Dict[int, NameIndex] = {}
+
+    def _create_store(self, partition: t.Optional[int] = None) -> Store:
+        "Create the configured store, or the store of one partition of it"
+        settings = self.settings
+        if settings.storage_backend == "sqlite":
+            # SQLite is only imported when it's used
+            from .sqlstore import SQLiteStore, partition_path
+
+            if partition is None:
+                return SQLiteStore(settings.storage_path)
+            assert settings.shard_count is not None
+            return SQLiteStore(
+                partition_path(settings.storage_path, partition),
+                settings.shard_count,
+                [
+                    partition_path(settings.storage_path, shard)
+                    for shard in range(settings.shard_count)
+                    if shard != partition
+                ],
+            )
 
-    def _parse_identifier(self, in_message: discord.Message, ident: str) -> int:
+        assert settings.storage_channel is not None
+        return MessageStore(
+            self.client,
+            settings.storage_channel,
+            settings.storage_message,
+            self.metrics,
+            journal=settings.storage_journal,
+            compact_after=settings.storage_compact_after,
+            partition=partition,
+            shard_count=settings.shard_count,
+        )
+
+    async def on_ready(self) -> None:
+        if self.settings.metrics_port is not None and self._metrics_runner is None:
+            self._metrics_runner = await serve_metrics(
+                self.metrics, self.settings.metrics_host, self.settings.metrics_port
+            )
+
+        # Load the storage up front, so the first command doesn't wait on it
+        try:
+            await self._ensure_loaded()
+        except ShardCountChanged as e:
+            # Running anyway would lose the guilds which moved to other shards
+            structlog.get_logger().error("load.shard_count_changed", error=str(e))
+            await self.close()
+            await self.client.close()
+            return
+        self._reminders.start()
+
+        # Scans which were interrupted carry on from their checkpoint
+        for guild_id, guild in self._storage.guilds.items():
+            if (
+                guild.hall_of_fame_backfill is not None
+                and guild_id not in self._backfills
+            ):
+                self._start_backfill(guild_id)
+
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._writer())
+
+    async def close(self) -> None:
+        "Send queued messages, write out any pending changes and close the store"
+        await self._reminders.close()
+        # Running scans stop at their last checkpoint, and resume on restart
+        for task in list(self._backfills.values()):
+            task.cancel()
+        await asyncio.gather(*self._backfills.values(), return_exceptions=True)
+        await self.outbox.drain()
+
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+            self._metrics_runner = None
+
+        if self._writer_task is not None or not self._save_queue.empty():
+            if self._writer_task is None:
+                self._writer_task = asyncio.create_task(self._writer())
+            self._closing.set()
+            self._save_queue.put_nowait(None)
+            await self._writer_task
+
+        await self._store.close()
+
+    async def _parse_identifier(self, in_message: discord.Message, ident: str) -> int:
         "Convert an identifier (a name or an ID string) to an ID"
 
         # Try to parse the given identifier as a numeric ID
@@ -63,76 +304,258 @@ class Bot:
 
         # Try to match it to someone's display name in the current guild
         if in_message.guild is not None:
-            members = {
-                member.id: member.display_name for member in in_message.guild.members
-            }
-            _key, _score, member_id = fuzzy_find(ident, members)
-            return t.cast(int, member_id)
+            with self.metrics.time(self.metrics.identifier_latency, op="one"):
+                index = await self._name_index(in_message.guild, ident)
+                match = index.find(ident)
+            if match is not None and match[1] >= self.settings.name_match_threshold:
+                return match[0]
 
         # If none of the checks succeeded, this identifier is (probably) invalid
         raise ValueError(f"Invalid identifier {ident!r}")
 
-    async def _find_storage_message(self) -> bool:
-        "Look for the storage message and return if it was found"
-        if self._storage_msg is not None:
-            return True
+    async def _resolve_identifiers(
+        self, guild: discord.Guild, idents: t.Iterable[str]
+    ) -> t.Dict[str, int]:
+        """Convert many identifiers to IDs at once, leaving out invalid ones
+
+        Names are all matched against one index of the guild's members, or
+        when no index is kept, looked up with a few concurrent queries."""
+        ids: t.Dict[str, int] = {}
+        names = set()
+        for ident in idents:
+            try:
+                ids[ident] = int(ident)
+            except ValueError:
+                names.add(ident)
+        if not names:
+            return ids
+
+        with self.metrics.time(self.metrics.identifier_latency, op="many"):
+            if guild.id in self._names or self.settings.member_cache != "minimal":
+                index = await self._name_index(guild, "")
+                indexes = {name: index for name in names}
+            else:
+                ordered = sorted(names)
+                # A large file would otherwise send a query for every name at once
+                semaphore = asyncio.Semaphore(NAME_QUERY_CONCURRENCY)
+
+                async def query(name: str) -> NameIndex:
+                    async with semaphore:
+                        return await self._name_index(guild, name)
+
+                found = await asyncio.gather(*(query(name) for name in ordered))
+                indexes = dict(zip(ordered, found))
+
+            for name, index in indexes.items():
+                match = index.find(name)
+                if match is not None and match[1] >= self.settings.name_match_threshold:
+                    ids[name] = match[0]
+        return ids
+
+    async def _name_index(self, guild: discord.Guild, query: str) -> NameIndex:
+        "Get an index of the guild's members whose names may match the query"
+
+        index = self._names.get(guild.id)
+        if index is not None:
+            return index
+
+        if self.settings.member_cache == "minimal":
+            # Without member events an index can't be kept up to date, so
+            # only index the members Discord finds for this query
+            try:
+                members = await guild.query_members(
+                    query, limit=QUERY_MEMBERS_LIMIT, cache=False
+                )
+            except asyncio.TimeoutError:
+                # Nothing matches, so the name is reported as invalid
+                structlog.get_logger().warning(
+                    "names.query_timeout", guild_id=guild.id, query=query
+                )
+                members = []
+            return NameIndex((member.id, member.display_name) for member in members)
 
-        # Search for the storage message in its channel's history
-        async for msg in (await self._storage_channel()).history():
-            if msg.author == self.client.user:
-                self._storage_msg = msg
-                return True
+        if guild.large and not guild.chunked:
+            # Large guilds' members are only fetched the first time we need them
+            await self.client.request_offline_members(guild)
 
-        # If we get here, we didn't find anything
-        return False
+        index = self._names[guild.id] = NameIndex(
+            (member.id, member.display_name) for member in guild.members
+        )
+        return index
+
+    async def _member_names(
+        self, guild: discord.Guild, member_ids: t.Iterable[int]
+    ) -> t.Dict[int, str]:
+        """Get many members' names, querying for the members who aren't cached
+        in batches rather than fetching them one by one
+
+        Members who aren't in the guild anymore are left out."""
+        names = {}
+        missing = []
+        for member_id in member_ids:
+            member = guild.get_member(member_id)
+            if member is None:
+                missing.append(member_id)
+            else:
+                names[member_id] = str(member)
+
+        batches = [
+            missing[i : i + QUERY_MEMBERS_LIMIT]  # noqa
+            for i in range(0, len(missing), QUERY_MEMBERS_LIMIT)
+        ]
+
+        async def query(batch: t.List[int]) -> t.List[discord.Member]:
+            try:
+                return await guild.query_members(
+                    user_ids=batch,
+                    limit=QUERY_MEMBERS_LIMIT,
+                    cache=self.settings.member_cache != "minimal",
+                )
+            except asyncio.TimeoutError:
+                # Their IDs are shown instead
+                return []
+
+        found = await asyncio.gather(*(query(batch) for batch in batches))
+        for members in found:
+            names.update((member.id, str(member)) for member in members)
+        return names
+
+    async def on_member_join(self, member: discord.Member) -> None:
+        index = self._names.get(member.guild.id)
+        if index is not None:
+            index.add(member.id, member.display_name)
+
+    async def on_member_remove(self, member: discord.Member) -> None:
+        index = self._names.get(member.guild.id)
+        if index is not None:
+            index.remove(member.id)
+
+    async def on_member_update(
+        self, before: discord.Member, after: discord.Member
+    ) -> None:
+        index = self._names.get(after.guild.id)
+        if index is not None and before.display_name != after.display_name:
+            index.add(after.id, after.display_name)
 
     async def _load_storage(self) -> None:
         logger = structlog.get_logger().bind()
 
-        if await self._find_storage_message():
-            logger.debug("load.found_storage")
-            assert self._storage_msg is not None
-            try:
-                self._storage = Storage(
-                    **pickle.loads(b64decode(self._storage_msg.content))
-                )
-            except pydantic.ValidationError as e:
-                logger.error(
-                    "load.invalid_storage", content=self._storage_msg.content, error=e
-                )
-                return
+        try:
+            with self.metrics.time(self.metrics.storage_latency, op="load"):
+                self._storage = await self._store.load()
+        except pydantic.ValidationError as e:
+            self.metrics.storage_errors.inc(op="load")
+            logger.error("load.invalid_storage", error=e)
+            return
+        except Exception:
+            self.metrics.storage_errors.inc(op="load")
+            raise
+
+        for guild_id, guild in self._storage.guilds.items():
+            guild.reindex()
+            if guild.hall_of_fame is not None:
+                self._hof_emoji[guild_id] = guild.hall_of_fame.reaction_emoji
+
+        self._reminders.extend(
+            (reminder.due, (guild_id, reminder_id))
+            for guild_id, guild in self._storage.guilds.items()
+            for reminder_id, reminder in guild.reminders.items()
+        )
 
-            logger.info("load.storage", storage=self._storage)
-        else:
-            logger.debug("load.no_storage")
+    async def _ensure_loaded(self) -> None:
+        # Every caller waits on the same load, so it only ever happens once
+        if self._load_task is None:
+            self._load_task = asyncio.create_task(self._load_storage())
+        try:
+            await asyncio.shield(self._load_task)
+        except Exception:
+            # Let the next event try loading again
+            self._load_task = None
+            raise
 
-    async def _save_storage(self) -> None:
-        logger = structlog.get_logger().bind(storage=self._storage)
+    async def _save_storage(self, dirty: t.Set[int]) -> None:
+        try:
+            with self.metrics.time(self.metrics.storage_latency, op="save"):
+                await self._store.save(self._storage, dirty)
+        except Exception:
+            self.metrics.storage_errors.inc(op="save")
+            raise
 
-        content = b64encode(pickle.dumps(self._storage.dict())).decode("ascii")
-        logger.debug("store.content", content=content)
+    def _mark_dirty(self, guild_id: int) -> None:
+        "Schedule a guild's storage to be written by the writer task"
+        self._save_queue.put_nowait(guild_id)
 
-        # If there's no storage message to be found, create it
-        if not (await self._find_storage_message()):
-            logger.info("store.created_message")
-            self._storage_msg = await (await self._storage_channel()).send(content)
-            return
+    async def _write(self, dirty: t.Set[int]) -> t.Set[int]:
+        """Write out the given guilds, returning those to try again later
 
-        logger.info("store.edited_message")
-        assert self._storage_msg is not None
+        A guild too large to store is dropped, since trying again can't help,
+        and its changes are only kept in memory until it changes again."""
+
+        logger = structlog.get_logger().bind()
 
         try:
-            await self._storage_msg.edit(content=content)
+            await self._save_storage(dirty)
+        except StorageTooLarge as e:
+            if len(dirty) == 1:
+                logger.error("writer.dropped", guild_id=min(dirty), error=e)
+                return set()
+            # Find which guilds don't fit by writing each by itself, so they
+            # don't hold back the others
+            failed: t.Set[int] = set()
+            for guild_id in sorted(dirty):
+                failed |= await self._write({guild_id})
+            return failed
         except Exception as e:
-            logger.error("storage.edit_failed", error=e)
-            self._storage_msg = None
+            logger.error("writer.failed", error=e, dirty_guilds=len(dirty))
+            return dirty
 
-            # If the reported error was a 404, the message was probably pulled
-            # out from under us, so let's just try again with some simple
-            # recursion
-            if isinstance(e, discord.NotFound):
-                logger.debug("storage.retrying")
-                await self._save_storage()
+        logger.debug("writer.saved", dirty_guilds=len(dirty))
+        return set()
+
+    async def _writer(self) -> None:
+        "Write out changed guilds, batching the changes made close together"
+
+        logger = structlog.get_logger().bind()
+
+        stopping = False
+        # Guilds whose last write failed, and how long to wait before retrying
+        retry: t.Set[int] = set()
+        delay = 0.0
+        while not stopping:
+            pending: t.List[t.Optional[int]] = []
+            if retry:
+                # Changes made in the meantime are written along with the retry
+                try:
+                    await asyncio.wait_for(self._closing.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                first = await self._save_queue.get()
+                if first is not None:
+                    # Give any other changes a chance to make it into this write
+                    await asyncio.sleep(self.settings.storage_flush_interval)
+                pending.append(first)
+
+            dirty, retry = retry, set()
+            while not self._save_queue.empty():
+                pending.append(self._save_queue.get_nowait())
+            for guild_id in pending:
+                if guild_id is None:
+                    stopping = True
+                else:
+                    dirty.add(guild_id)
+
+            if not dirty:
+                continue
+
+            retry = await self._write(dirty)
+            if not retry:
+                delay = 0.0
+            elif stopping:
+                logger.error("writer.gave_up", dirty_guilds=len(retry))
+            else:
+                delay = min(max(delay * 2, WRITER_RETRY_DELAY), WRITER_MAX_RETRY_DELAY)
+                logger.warning("writer.retrying", dirty_guilds=len(retry), delay=delay)
 
     async def _createparty(self, message: discord.Message) -> None:
         "Create a new party"
@@ -147,16 +570,24 @@ class Bot:
         partyname = message.content.split()[1]
 
         if partyname in guild.parties:
-            logger.debug("party.already_exists", party=partyname, parties=guild.parties)
-            await message.channel.send(
-                f"<@{message.author.id}>: Party **{partyname}** already exists"
+            logger.debug(
+                "party.already_exists",
+                party=partyname,
+                parties=summarize_parties(guild.parties),
+            )
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Party **{partyname}** already exists",
             )
             return
 
-        guild.parties[partyname] = {}
-        logger.info("party.created", party=partyname, parties=guild.parties)
-        await message.channel.send(
-            f"<@{message.author.id}>: Created party **{partyname}**"
+        guild.create_party(partyname)
+        self._mark_dirty(message.guild.id)
+        logger.info(
+            "party.created", party=partyname, parties=summarize_parties(guild.parties)
+        )
+        self.outbox.send(
+            message.channel, f"<@{message.author.id}>: Created party **{partyname}**"
         )
 
     async def _deleteparty(self, message: discord.Message) -> None:
@@ -172,23 +603,30 @@ class Bot:
         partyname = message.content.split()[1]
 
         if partyname in guild.parties:
-            del guild.parties[partyname]
-            logger.debug("party.deleted", party=partyname, parties=guild.parties)
-            await message.channel.send(
-                f"<@{message.author.id}>: Party **{partyname}** was deleted"
+            guild.delete_party(partyname)
+            self._mark_dirty(message.guild.id)
+            logger.debug(
+                "party.deleted",
+                party=partyname,
+                parties=summarize_parties(guild.parties),
+            )
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Party **{partyname}** was deleted",
             )
         else:
             logger.info(
                 "party.unexisting",
                 party=partyname,
-                parties=guild.parties,
+                parties=summarize_parties(guild.parties),
             )
-            await message.channel.send(
-                f"<@{message.author.id}>: Party **{partyname}** does not exist"
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Party **{partyname}** does not exist",
             )
 
     async def _addtimezone(self, message: discord.Message) -> None:
-        "Add yourself to a party, with your UTC offset"
+        "Add yourself to a party, with your UTC offset or timezone name"
 
         logger = structlog.get_logger().bind(
             member_id=message.author.id, member_name=message.author.name
@@ -199,83 +637,87 @@ class Bot:
 
         parts = message.content.split()
         if len(parts) != 3 and len(parts) != 4:
-            await message.channel.send(
+            self.outbox.send(
+                message.channel,
                 f"<@{message.author.id}>: "
-                "USAGE: !addtimezone PARTY_NAME UTC_OFFSET [MEMBER_IDENTIFIER]"
+                "USAGE: !addtimezone PARTY_NAME TIMEZONE [MEMBER_IDENTIFIER]",
             )
             return
 
         partyname = parts[1]
-        offset = parts[2]
+        zone_str = parts[2]
 
         if partyname not in guild.parties:
-            await message.channel.send(
-                f"<@{message.author.id}>: Party **{partyname}** does not exist"
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Party **{partyname}** does not exist",
             )
             return
 
         try:
             id_ = (
-                self._parse_identifier(message, parts[3])
+                await self._parse_identifier(message, parts[3])
                 if len(parts) == 4
                 else message.author.id
             )
         except ValueError:
-            await message.channel.send(
+            self.outbox.send(
+                message.channel,
                 f"<@{message.author.id}>: "
-                "USAGE: !addtimezone PARTY_NAME UTC_OFFSET [MEMBER_IDENTIFIER]"
+                "USAGE: !addtimezone PARTY_NAME TIMEZONE [MEMBER_IDENTIFIER]",
             )
             return
 
         logger = logger.bind(party_member_id=id_)
 
-        for partyname, party in guild.parties.items():
-            if id_ in party:
-                del party[id_]
-                logger.info("party.removed", party=partyname, parties=guild.parties)
-
         try:
-            guild.parties[partyname][id_] = int(offset)
+            zone = zones.parse(zone_str)
         except ValueError:
-            await message.channel.send(
-                f"<@{message.author.id}>: Invalid offset {offset}"
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Invalid offset or timezone {zone_str}",
             )
-        else:
-            await message.channel.send(f"Added <@{id_}> to **{partyname}**")
+            return
+
+        oldname = guild.add_member(partyname, id_, zone)
+        if oldname is not None:
             logger.info(
-                "party.added",
-                party=partyname,
-                utc_offset=int(offset),
-                parties=guild.parties,
+                "party.removed", party=oldname, parties=summarize_parties(guild.parties)
             )
+        self._mark_dirty(message.guild.id)
+        self.outbox.send(message.channel, f"Added <@{id_}> to **{partyname}**")
+        logger.info(
+            "party.added",
+            party=partyname,
+            zone=zone,
+            parties=summarize_parties(guild.parties),
+        )
 
-    def _party_of(
-        self, guild_id: int, user: int
-    ) -> t.Tuple[int, str, t.Dict[int, int]]:
-        guild = self._storage.guilds.setdefault(guild_id, GuildStorage())
+    def _party_of(self, guild_id: int, user: int) -> t.Tuple[str, str]:
+        guild = self._storage.guilds.get(guild_id)
+        partyname = guild.party_of(user) if guild is not None else None
 
-        offset = None
-        for partyname, party in guild.parties.items():
-            if user in party:
-                offset = party[user]
-                return (offset, partyname, party)
+        if guild is not None and partyname is not None:
+            return (guild.parties[partyname][user], partyname)
 
         raise LookupError(f"Could not find party for user with ID {user}")
 
-    async def _do_convert(
+    def _do_convert(
         self,
         channel: discord.TextChannel,
-        party: t.Dict[int, int],
+        guild_id: int,
+        partyname: str,
         dt: datetime,
     ) -> None:
+        guild = self._storage.guilds[guild_id]
+        key = (guild_id, partyname, guild.version(), dt)
+        pages = self._conversions.get(key)
+        if pages is None:
+            pages = render_conversion(guild.parties[partyname], dt)
+            self._conversions.put(key, pages)
 
-        await channel.send(
-            "\n".join(
-                f"For <@{id_}>, in UTC{offset:+03}, "
-                f"it's {dt.astimezone(utc(offset)).strftime('%A at %H:%M')}"
-                for id_, offset in party.items()
-            )
-        )
+        for page in pages:
+            self.outbox.send(channel, page)
 
     async def _convert(self, message: discord.Message) -> None:
         "Convert a given timestamp from your timezone to your party's timezones"
@@ -288,45 +730,42 @@ class Bot:
             _, time = message.content.split(" ", maxsplit=1)
         except ValueError:
             logger.debug("invalid_usage", content=message.content)
-            await message.channel.send(
-                f"<@{message.author.id}>: USAGE: c!_convert TIME"
+            self.outbox.send(
+                message.channel, f"<@{message.author.id}>: USAGE: c!_convert TIME"
             )
             return
 
         # Parse the time given by the message sender and
         # make sure it's not timezone-aware
         try:
-            dt: datetime = human_time.parseTime(time)
+            dt = parse_time(time)
         except ValueError:
             logger.debug("invalid_time", time=time)
-            await message.channel.send(
-                f"<@{message.author.id}>: Invalid timestamp {time!r}"
+            self.outbox.send(
+                message.channel, f"<@{message.author.id}>: Invalid timestamp {time!r}"
             )
             return
 
         assert dt.tzinfo is None
         logger.info("parsed_time", from_=time, to=dt)
 
-        # Find the message sender's party and UTC offset
+        # Find the message sender's party and timezone
         try:
             assert message.guild is not None
-            offset, partyname, party = self._party_of(
-                message.guild.id, message.author.id
-            )
+            zone, partyname = self._party_of(message.guild.id, message.author.id)
         except LookupError:
-            await message.channel.send(
-                f"<@{message.author.id}>: You're not in any party!"
+            self.outbox.send(
+                message.channel, f"<@{message.author.id}>: You're not in any party!"
             )
             return
-        logger.info("found_party", party=partyname, offset=offset)
+        logger.info("found_party", party=partyname, zone=zone)
 
         # Make the parsed datetime timezone-aware
-        tz = utc(offset)
-        dt = dt.replace(tzinfo=tz)
+        dt = dt.replace(tzinfo=zones.get(zone))
 
         # Calculate the correct datetime for each party member and show it
         assert isinstance(message.channel, discord.TextChannel)
-        await self._do_convert(message.channel, party, dt)
+        self._do_convert(message.channel, message.guild.id, partyname, dt)
 
     async def _convert_as(self, message: discord.Message) -> None:
         "Convert a given timestamp from someone's timezone to their party's timezones"
@@ -337,69 +776,592 @@ class Bot:
 
         try:
             _, as_str, time = message.content.split(" ", maxsplit=2)
-            as_ = self._parse_identifier(message, as_str)
+            as_ = await self._parse_identifier(message, as_str)
         except ValueError:
             logger.debug("invalid_usage", content=message.content)
-            await message.channel.send(
-                f"<@{message.author.id}>: USAGE: c!_convert-as MEMBER_IDENTIFIER TIME"
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: USAGE: c!_convert-as MEMBER_IDENTIFIER TIME",
             )
             return
 
         # Parse the time given by the message sender and
         # make sure it's not timezone-aware
         try:
-            dt: datetime = human_time.parseTime(time)
+            dt = parse_time(time)
         except ValueError:
             logger.debug("invalid_time", time=time)
-            await message.channel.send(
-                f"<@{message.author.id}>: Invalid timestamp {time!r}"
+            self.outbox.send(
+                message.channel, f"<@{message.author.id}>: Invalid timestamp {time!r}"
             )
             return
         assert dt.tzinfo is None
         logger.info("parsed_time", from_=time, to=dt)
 
-        # Find the message sender's party and UTC offset
+        # Find the message sender's party and timezone
         try:
             assert message.guild is not None
-            offset, partyname, party = self._party_of(message.guild.id, as_)
+            zone, partyname = self._party_of(message.guild.id, as_)
         except LookupError:
-            await message.channel.send(
-                f"<@{message.author.id}>: <@{as_}> is not in any party!"
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: <@{as_}> is not in any party!",
             )
             return
-        logger.info("found_party", as_=as_, party=partyname, offset=offset)
+        logger.info("found_party", as_=as_, party=partyname, zone=zone)
 
         # Make the parsed datetime timezone-aware
-        tz = utc(offset)
-        dt = dt.replace(tzinfo=tz)
+        dt = dt.replace(tzinfo=zones.get(zone))
 
         # Calculate the correct datetime for each party member and show it
         assert isinstance(message.channel, discord.TextChannel)
-        await self._do_convert(message.channel, party, dt)
+        self._do_convert(message.channel, message.guild.id, partyname, dt)
 
     async def _list_parties(self, message: discord.Message) -> None:
-        "List the known parties"
+        "List the known parties, a page at a time"
+
+        parts = message.content.split()
+        try:
+            page = int(parts[1]) if len(parts) > 1 else 1
+        except ValueError:
+            self.outbox.send(
+                message.channel, f"<@{message.author.id}>: USAGE: c!parties [PAGE]"
+            )
+            return
 
         assert message.guild is not None
         guild = self._storage.guilds.setdefault(message.guild.id, GuildStorage())
 
+        # Offsets change with daylight saving time, so listings are also
+        # rendered again every hour
+        now = datetime.now(timezone.utc)
+        key = (guild.version(), int(now.timestamp()) // 3600)
+        pages = self._listings.get(message.guild.id, key)
+        if pages is None:
+            names = await self._member_names(
+                message.guild,
+                {member for party in guild.parties.values() for member in party},
+            )
+            pages = listing.render(guild.parties, names, now)
+            self._listings.put(message.guild.id, key, pages)
+
+        page = min(max(page, 1), len(pages))
         embed = discord.Embed(
             title="Parties",
             color=discord.Color.from_rgb(0x91, 0xD1, 0x8B),
-        ).set_footer(
-            text=f"{len(guild.parties)} found",
         )
+        for name, value in pages[page - 1]:
+            embed.add_field(name=name, value=value)
+        footer = f"{len(guild.parties)} found"
+        if len(pages) > 1:
+            footer += f", page {page} of {len(pages)} (c!parties PAGE for others)"
+        embed.set_footer(text=footer)
 
-        for partyname, party in guild.parties.items():
-            embed.add_field(
-                name=partyname,
-                value=", ".join(
-                    f"{self.client.get_user(id_)} (UTC{offset:+03})"
-                    for id_, offset in party.items()
-                ),
+        self.outbox.send(message.channel, f"<@{message.author.id}>", embed=embed)
+
+    async def _import_party(self, message: discord.Message) -> None:
+        "Add the members listed in an attached CSV or JSON file to a party"
+
+        logger = structlog.get_logger().bind(
+            member_id=message.author.id, member_name=message.author.name
+        )
+
+        assert message.guild is not None
+        guild = self._storage.guilds.setdefault(message.guild.id, GuildStorage())
+
+        parts = message.content.split()
+        if len(parts) != 2 or len(message.attachments) != 1:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: USAGE: c!import-party PARTY_NAME, "
+                "with a CSV or JSON file of members and timezones attached",
+            )
+            return
+        partyname = parts[1]
+        attachment = message.attachments[0]
+
+        if attachment.size > MAX_IMPORT_BYTES:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Party files can be at most "
+                f"{MAX_IMPORT_BYTES // 1024} KiB",
             )
+            return
 
-        await message.channel.send(f"<@{message.author.id}>", embed=embed)
+        try:
+            rows = partyfile.read(attachment.filename, await attachment.read())
+        except ValueError as e:
+            self.outbox.send(message.channel, f"<@{message.author.id}>: {e}")
+            return
+
+        # Check every row before changing anything, so a bad file changes nothing
+        ids = await self._resolve_identifiers(
+            message.guild, {ident for _row, ident, _zone in rows}
+        )
+        errors = []
+        members: t.Dict[int, str] = {}
+        for row, ident, zone_str in rows:
+            try:
+                zone = zones.parse(zone_str)
+            except ValueError as e:
+                errors.append(f"{row}: {e}")
+                continue
+            id_ = ids.get(ident)
+            if id_ is None:
+                errors.append(f"{row}: Invalid identifier {ident!r}")
+            elif id_ in members:
+                errors.append(f"{row}: <@{id_}> is listed more than once")
+            else:
+                members[id_] = zone
+
+        if errors or not members:
+            logger.info("party.import_rejected", party=partyname, errors=len(errors))
+            shown = "\n".join(errors[:MAX_IMPORT_ERRORS])
+            if len(errors) > MAX_IMPORT_ERRORS:
+                shown += f"\n...and {len(errors) - MAX_IMPORT_ERRORS} more"
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Nothing was imported"
+                + (f", since some rows are invalid:\n{shown}" if errors else ""),
+            )
+            return
+
+        def add_members(guild: GuildStorage) -> int:
+            "Add the members to the party, returning how many were moved"
+            if partyname not in guild.parties:
+                guild.create_party(partyname)
+            moved = 0
+            for id_, zone in members.items():
+                oldname = guild.add_member(partyname, id_, zone)
+                if oldname is not None and oldname != partyname:
+                    moved += 1
+            return moved
+
+        # Import into a copy first, so a party too large to store changes nothing
+        imported = guild.copy(deep=True)
+        add_members(imported)
+        try:
+            self._store.check_fits(message.guild.id, imported)
+        except StorageTooLarge:
+            logger.info("party.import_too_large", party=partyname, members=len(members))
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Nothing was imported, since the server's "
+                "storage would be too large",
+            )
+            return
+
+        moved = add_members(guild)
+        self._mark_dirty(message.guild.id)
+
+        logger.info(
+            "party.imported",
+            party=partyname,
+            members=len(members),
+            moved=moved,
+            parties=summarize_parties(guild.parties),
+        )
+        self.outbox.send(
+            message.channel,
+            f"<@{message.author.id}>: Added {len(members)} members to "
+            f"**{partyname}**"
+            + (f", moving {moved} from other parties" if moved else ""),
+        )
+
+    async def _export_party(self, message: discord.Message) -> None:
+        "Export a party as a CSV or JSON file"
+
+        assert message.guild is not None
+        guild = self._storage.guilds.setdefault(message.guild.id, GuildStorage())
+
+        parts = message.content.split()
+        if len(parts) not in (2, 3) or parts[2:] not in ([], ["csv"], ["json"]):
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: USAGE: c!export-party PARTY_NAME [csv|json]",
+            )
+            return
+        partyname = parts[1]
+        format = parts[2] if len(parts) == 3 else "csv"
+
+        party = guild.parties.get(partyname)
+        if party is None:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Party **{partyname}** does not exist",
+            )
+            return
+
+        # Only cached names are included, since they're just for reading
+        members = []
+        for id_, zone in party.items():
+            member = message.guild.get_member(id_)
+            members.append((id_, zone, str(member) if member is not None else ""))
+
+        data = partyfile.write(members, format)
+        self.outbox.send(
+            message.channel,
+            f"<@{message.author.id}>: **{partyname}** has {len(party)} members",
+            file=discord.File(io.BytesIO(data), filename=f"{partyname}.{format}"),
+        )
+
+    async def _availability(self, message: discord.Message) -> None:
+        "Set when you're free each week, like `mon-fri 18-23, sat 10-14`"
+
+        logger = structlog.get_logger().bind(
+            member_id=message.author.id, member_name=message.author.name
+        )
+
+        assert message.guild is not None
+        guild = self._storage.guilds.setdefault(message.guild.id, GuildStorage())
+
+        parts = message.content.split(" ", 1)
+        if len(parts) == 1:
+            windows = guild.availability.get(message.author.id)
+            if windows is None:
+                self.outbox.send(
+                    message.channel,
+                    f"<@{message.author.id}>: You haven't set your availability, "
+                    "so you're assumed free from 09:00 to 23:00 every day",
+                )
+            else:
+                self.outbox.send(
+                    message.channel,
+                    f"<@{message.author.id}>: You're free on "
+                    f"{overlap.format_windows(windows)}",
+                )
+            return
+
+        if parts[1].strip().lower() == "clear":
+            guild.availability.pop(message.author.id, None)
+            self._mark_dirty(message.guild.id)
+            logger.info("availability.cleared")
+            self.outbox.send(
+                message.channel, f"<@{message.author.id}>: Cleared your availability"
+            )
+            return
+
+        try:
+            windows = overlap.parse_windows(parts[1])
+        except ValueError as e:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: {e}. "
+                "USAGE: c!availability [DAYS START-END, ...|clear]",
+            )
+            return
+
+        guild.availability[message.author.id] = windows
+        self._mark_dirty(message.guild.id)
+        logger.info("availability.set", windows=len(windows))
+        self.outbox.send(
+            message.channel,
+            f"<@{message.author.id}>: You're free on {overlap.format_windows(windows)}",
+        )
+
+    async def _overlap(self, message: discord.Message) -> None:
+        "Find when everyone in a party is free, for an hour or the given duration"
+
+        logger = structlog.get_logger().bind(
+            member_id=message.author.id, member_name=message.author.name
+        )
+
+        parts = message.content.split()
+        try:
+            if len(parts) not in (2, 3):
+                raise ValueError("Wrong number of arguments")
+            partyname = parts[1]
+            duration = overlap.parse_duration(parts[2]) if len(parts) == 3 else 60
+        except ValueError:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: USAGE: c!overlap PARTY_NAME [DURATION]",
+            )
+            return
+
+        assert message.guild is not None
+        guild = self._storage.guilds.setdefault(message.guild.id, GuildStorage())
+        party = guild.parties.get(partyname)
+        if not party:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Party **{partyname}** does not exist "
+                "or has no members",
+            )
+            return
+
+        now = datetime.now(timezone.utc)
+        days = self.settings.overlap_horizon_days
+        found = overlap.find(party, guild.availability, now, days * 24 * 60, duration)
+        logger.info(
+            "overlap.found",
+            party=partyname,
+            members=len(party),
+            duration=duration,
+            found=len(found),
+        )
+
+        # Show the times in the asker's timezone, or UTC if they have none
+        try:
+            zone, _partyname = self._party_of(message.guild.id, message.author.id)
+        except LookupError:
+            zone = zones.fixed_key(0)
+
+        wanted = overlap.format_duration(duration)
+        if not found:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: No time in the next {days} days works "
+                f"for **{partyname}** for {wanted}",
+            )
+            return
+
+        if not found[0].missing:
+            header = f"Everyone in **{partyname}** is free for {wanted} on"
+        else:
+            header = (
+                f"Not everyone in **{partyname}** is free together for {wanted} "
+                f"in the next {days} days. The most of them are on"
+            )
+        lines = [
+            f"<@{message.author.id}>: {header} " f"(in {zones.describe(zone, now)}):"
+        ]
+        for window in found:
+            start = zones.local_time(zone, window.start)
+            end = zones.local_time(
+                zone, window.start + timedelta(minutes=window.minutes)
+            )
+            line = (
+                f"- {start:%A %d %B, %H:%M} to {end:%H:%M} "
+                f"({overlap.format_duration(window.minutes)})"
+            )
+            if window.missing:
+                missing = ", ".join(
+                    f"<@{id_}>" for id_ in window.missing[:OVERLAP_MAX_MISSING]
+                )
+                more = len(window.missing) - OVERLAP_MAX_MISSING
+                if more > 0:
+                    missing += f" and {more} more"
+                line += f", without {missing}"
+            lines.append(line)
+
+        for page in paginate(lines):
+            self.outbox.send(message.channel, page)
+
+    async def _schedule(self, message: discord.Message) -> None:
+        "Remind a party at a time in your timezone, e.g. `party 20:00 | Session!`"
+
+        logger = structlog.get_logger().bind(
+            member_id=message.author.id, member_name=message.author.name
+        )
+
+        usage = "USAGE: c!schedule PARTY_NAME TIME [| MESSAGE]"
+        parts = message.content.split(" ", 2)
+        if len(parts) != 3:
+            self.outbox.send(message.channel, f"<@{message.author.id}>: {usage}")
+            return
+        partyname = parts[1]
+        time, _, text = parts[2].partition("|")
+        text = text.strip()
+
+        assert message.guild is not None
+        guild = self._storage.guilds.setdefault(message.guild.id, GuildStorage())
+        if partyname not in guild.parties:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Party **{partyname}** does not exist",
+            )
+            return
+        if len(guild.reminders) >= MAX_REMINDERS_PER_GUILD:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: This server already has "
+                f"{MAX_REMINDERS_PER_GUILD} reminders pending",
+            )
+            return
+        if len(text) > MAX_REMINDER_TEXT:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Reminder messages can be at most "
+                f"{MAX_REMINDER_TEXT} characters long",
+            )
+            return
+
+        try:
+            dt = parse_time(time.strip())
+        except ValueError:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Invalid timestamp {time.strip()!r}",
+            )
+            return
+
+        # The time is in the author's timezone, or UTC if they have none
+        try:
+            zone, _partyname = self._party_of(message.guild.id, message.author.id)
+        except LookupError:
+            zone = zones.fixed_key(0)
+        dt = dt.replace(tzinfo=zones.get(zone))
+        due = int(dt.timestamp())
+        if due <= datetime.now(timezone.utc).timestamp():
+            self.outbox.send(
+                message.channel, f"<@{message.author.id}>: That time has already passed"
+            )
+            return
+
+        reminder_id = max(guild.reminders, default=0) + 1
+        guild.reminders[reminder_id] = Reminder(
+            due=due,
+            channel=message.channel.id,
+            party=partyname,
+            author=message.author.id,
+            text=text,
+        )
+        self._mark_dirty(message.guild.id)
+        self._reminders.schedule(due, (message.guild.id, reminder_id))
+        logger.info(
+            "reminder.scheduled", party=partyname, reminder=reminder_id, due=due
+        )
+
+        self.outbox.send(
+            message.channel,
+            f"<@{message.author.id}>: Reminder #{reminder_id} for **{partyname}** "
+            f"is set for {dt:%A %d %B at %H:%M} ({zones.describe(zone, dt)})",
+        )
+
+    async def _list_reminders(self, message: discord.Message) -> None:
+        "List the pending reminders"
+
+        assert message.guild is not None
+        guild = self._storage.guilds.setdefault(message.guild.id, GuildStorage())
+        if not guild.reminders:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: There are no pending reminders",
+            )
+            return
+
+        lines = [f"<@{message.author.id}>: Pending reminders (times in UTC):"]
+        for reminder_id, reminder in sorted(
+            guild.reminders.items(), key=lambda item: item[1].due
+        ):
+            due = datetime.fromtimestamp(reminder.due, timezone.utc)
+            line = (
+                f"- #{reminder_id} for **{reminder.party}** "
+                f"on {due:%A %d %B at %H:%M}, by <@{reminder.author}>"
+            )
+            if reminder.text:
+                line += f": {reminder.text}"
+            lines.append(line)
+
+        for page in paginate(lines):
+            self.outbox.send(message.channel, page)
+
+    async def _unschedule(self, message: discord.Message) -> None:
+        "Cancel a reminder you set (or any, if you're an administrator)"
+
+        parts = message.content.split()
+        try:
+            reminder_id = int(parts[1].lstrip("#"))
+        except (IndexError, ValueError):
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: USAGE: c!unschedule REMINDER_ID",
+            )
+            return
+
+        assert message.guild is not None
+        guild = self._storage.guilds.setdefault(message.guild.id, GuildStorage())
+        reminder = guild.reminders.get(reminder_id)
+        if reminder is None:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Reminder #{reminder_id} does not exist",
+            )
+            return
+
+        is_admin = (
+            isinstance(message.author, discord.Member)
+            and message.author.guild_permissions.administrator
+        )
+        if reminder.author != message.author.id and not is_admin:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Only the member who set a reminder "
+                "or an administrator can cancel it",
+            )
+            return
+
+        # Its entry in the scheduler is skipped once it finds the reminder gone
+        del guild.reminders[reminder_id]
+        self._mark_dirty(message.guild.id)
+        self.outbox.send(
+            message.channel,
+            f"<@{message.author.id}>: Cancelled reminder #{reminder_id}",
+        )
+
+    async def _fire_reminders(
+        self, due: t.List[t.Tuple[float, t.Tuple[int, int]]]
+    ) -> None:
+        "Send the reminders which came due, sending late ones together"
+
+        logger = structlog.get_logger().bind()
+
+        now = datetime.now(timezone.utc).timestamp()
+        # channel ID -> reminders which went off late there
+        late: t.DefaultDict[int, t.List[Reminder]] = defaultdict(list)
+
+        for due_at, (guild_id, reminder_id) in due:
+            guild = self._storage.guilds.get(guild_id)
+            reminder = guild.reminders.get(reminder_id) if guild is not None else None
+            # Cancelled reminders, and reminders whose ID was reused since,
+            # leave entries behind in the scheduler
+            if guild is None or reminder is None or reminder.due != due_at:
+                continue
+
+            del guild.reminders[reminder_id]
+            self._mark_dirty(guild_id)
+
+            if now - reminder.due > LATE_REMINDER_SECONDS:
+                late[reminder.channel].append(reminder)
+                continue
+
+            mentions = [
+                f"<@{member}>" for member in guild.parties.get(reminder.party, {})
+            ]
+            lines = [
+                f"Reminder for **{reminder.party}**: {reminder.text or 'it is time!'}"
+            ]
+            lines += [
+                " ".join(mentions[i : i + MENTIONS_PER_LINE])  # noqa
+                for i in range(0, len(mentions), MENTIONS_PER_LINE)
+            ]
+            self._send_reminder(reminder.channel, lines)
+            logger.info("reminder.sent", guild=guild_id, reminder=reminder_id)
+
+        for channel_id, reminders in late.items():
+            lines = ["These reminders went off while I was away:"]
+            for reminder in reminders:
+                due_dt = datetime.fromtimestamp(reminder.due, timezone.utc)
+                line = f"- **{reminder.party}** on {due_dt:%A %d %B at %H:%M} UTC"
+                if reminder.text:
+                    line += f": {reminder.text}"
+                lines.append(line)
+            self._send_reminder(channel_id, lines)
+            logger.info(
+                "reminder.sent_late", channel=channel_id, reminders=len(reminders)
+            )
+
+    def _send_reminder(self, channel_id: int, lines: t.List[str]) -> None:
+        logger = structlog.get_logger().bind(channel=channel_id)
+
+        channel = self.client.get_channel(channel_id)
+        if not isinstance(channel, discord.TextChannel):
+            logger.error("reminder.channel_not_found")
+            return
+
+        for page in paginate(lines):
+            self.outbox.send(channel, page)
 
     async def _show_help(self, message: discord.Message) -> None:
         "Show the installed commands"
@@ -412,36 +1374,46 @@ class Bot:
             if func.__doc__:
                 embed.add_field(name=f"!{command}", value=func.__doc__)
 
-        await message.channel.send(f"<@{message.author.id}>", embed=embed)
+        self.outbox.send(message.channel, f"<@{message.author.id}>", embed=embed)
 
     async def _manual_hof(self, message: discord.Message) -> None:
         "Manually add a message to the HOF"
 
         parts = message.content.split()
         if len(parts) != 2:
-            await message.channel.send(
-                f"<@{message.author.id}>: USAGE: !hof MESSAGE_ID"
+            self.outbox.send(
+                message.channel, f"<@{message.author.id}>: USAGE: !hof MESSAGE_ID"
             )
             return
 
         try:
             message_id = int(parts[1])
         except ValueError:
-            await message.channel.send(
-                f"<@{message.author.id}>: USAGE: !hof MESSAGE_ID"
+            self.outbox.send(
+                message.channel, f"<@{message.author.id}>: USAGE: !hof MESSAGE_ID"
             )
             return
 
         try:
-            message = await message.channel.fetch_message(message_id)
+            target = await message.channel.fetch_message(message_id)
         except discord.NotFound:
-            await message.channel.send(f"<@{message.author.id}>: Message not found.")
+            self.outbox.send(
+                message.channel, f"<@{message.author.id}>: Message not found."
+            )
             return
 
-        await self._add_to_hof(message)
-        await message.channel.send(
-            f"<@{message.author.id}>: Added message to the Hall of Fame"
-        )
+        if await self._add_to_hof(target, manual=True):
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Added message to the Hall of Fame",
+            )
+        else:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: "
+                "That message is already in the Hall of Fame, "
+                "or the Hall of Fame isn't set up",
+            )
 
     async def _hof_reqs(self, message: discord.Message) -> None:
         "Specify hall-of-fame requirements"
@@ -457,9 +1429,10 @@ class Bot:
             reaction_count = int(reaction_count_str)
             hof_channel = int(hof_channel_str)
         except ValueError:
-            await message.channel.send(
-                f"<@{message.author.id}>: "
-                "USAGE: c!hof-requirements REACTION_EMOJI REACTION_COUNT HOF_CHANNEL_ID"
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: USAGE: c!hof-requirements "
+                "REACTION_EMOJI REACTION_COUNT HOF_CHANNEL_ID",
             )
             return
 
@@ -470,10 +1443,23 @@ class Bot:
             reaction_count=reaction_count,
             hof_channel=hof_channel,
         )
-        logger.info("hof.requirements.set", guild=guild)
-        await message.channel.send(f"<@{message.author.id}>: Set HOF requirements")
+        self._hof_emoji[message.guild.id] = reaction_emoji
+        self._mark_dirty(message.guild.id)
+        logger.info(
+            "hof.requirements.set",
+            emoji=reaction_emoji,
+            count=reaction_count,
+            channel=hof_channel,
+        )
+        self.outbox.send(
+            message.channel, f"<@{message.author.id}>: Set HOF requirements"
+        )
+
+    async def _add_to_hof(self, message: discord.Message, manual: bool = False) -> bool:
+        """Add a message to the HOF, returning whether it was added
 
-    async def _add_to_hof(self, message: discord.Message) -> None:
+        Messages added manually are remembered for good, rather than until
+        they're past the reaction window."""
         author = message.author
 
         logger = structlog.get_logger().bind(
@@ -485,40 +1471,350 @@ class Bot:
         guild = self._storage.guilds.setdefault(message.guild.id, GuildStorage())
         if guild.hall_of_fame is None:
             logger.error("hof.notconfigured")
-            return
+            return False
+
+        if guild.is_inducted(message.id):
+            logger.info("hof.already_inducted")
+            return False
 
         hof_channel = self.client.get_channel(guild.hall_of_fame.hof_channel)
         if hof_channel is None:
             logger.error("hof.notfound")
-            return
+            return False
         assert isinstance(hof_channel, discord.TextChannel)
 
+        oldest = self._hof_window_start()
+        if manual and message.id < oldest:
+            # Messages this old which were inducted by reactions may have been
+            # forgotten, so the hall of fame's own posts tell if it's in there.
+            # Backfills read them once for all the messages they add instead
+            assert self.client.user is not None
+            if message.id in await posted_messages(hof_channel, self.client.user.id):
+                logger.info("hof.already_posted")
+                guild.hall_of_fame_manual.add(message.id)
+                self._mark_dirty(message.guild.id)
+                return False
+            if guild.is_inducted(message.id):
+                logger.info("hof.already_inducted")
+                return False
+
+        # Record the message before yielding to the event loop, so concurrent
+        # reactions can't induct it twice
+        inducted = guild.hall_of_fame_manual if manual else guild.hall_of_fame_inducted
+        inducted.add(message.id)
+        # Reactions to messages past the window don't count, so there's no need
+        # to remember that those messages were inducted by them
+        guild.hall_of_fame_inducted.difference_update(
+            [
+                other
+                for other in guild.hall_of_fame_inducted
+                if other < oldest and other != message.id
+            ]
+        )
+        self._mark_dirty(message.guild.id)
+
         embed = (
             discord.Embed(url=message.jump_url, description=message.content)
             .set_author(name=author.name, icon_url=str(author.avatar_url))
             .set_footer(text=message.jump_url)
         )
 
-        for embed in message.embeds:
-            logger.debug("hof.embed.image", embed=embed, image=embed.image)
-            if embed.image is not discord.Embed.Empty:  # type: ignore
-                embed.set_image(url=embed.image.url)
+        for attached in message.embeds:
+            logger.debug("hof.embed.image", image=attached.image.url)
+            if attached.image is not discord.Embed.Empty:  # type: ignore
+                embed.set_image(url=attached.image.url)
                 break
 
-        await hof_channel.send(embed=embed)
+        def sent(future: "asyncio.Future[discord.Message]") -> None:
+            if future.cancelled() or future.exception() is not None:
+                # Let a later reaction try again
+                inducted.discard(message.id)
+                self._mark_dirty(message.guild.id)  # type: ignore
+
+        # Posts wait behind replies to commands, since nobody is waiting on them
+        post = self.outbox.send(hof_channel, embed=embed, priority=BACKGROUND)
+        post.add_done_callback(sent)
+        return True
+
+    async def _hof_backfill(self, message: discord.Message) -> None:
+        "Add older messages to the HOF (administrators only)"
+
+        if not isinstance(message.author, discord.Member) or not (
+            message.author.guild_permissions.administrator
+        ):
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Only administrators can scan for the "
+                "Hall of Fame",
+            )
+            return
+
+        assert message.guild is not None
+        guild = self._storage.guilds.setdefault(message.guild.id, GuildStorage())
+        if guild.hall_of_fame is None:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: The Hall of Fame isn't set up, "
+                "use c!hof-requirements first",
+            )
+            return
+        if message.guild.id in self._backfills:
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: A scan for the Hall of Fame is already "
+                "running",
+            )
+            return
+
+        parts = message.content.split(" ", 2)[1:]
+        if not parts and guild.hall_of_fame_backfill is not None:
+            # Carry on with the scan which was stopped
+            self._start_backfill(message.guild.id, message.channel)
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Resuming the scan for the Hall of Fame",
+            )
+            return
+
+        channels = [
+            channel
+            for channel in message.guild.text_channels
+            if channel.id != guild.hall_of_fame.hof_channel
+        ]
+        if parts:
+            channel_id = parts[0].strip("<#>")
+            channel = (
+                message.guild.get_channel(int(channel_id))
+                if channel_id.isdigit()
+                else None
+            )
+            if isinstance(channel, discord.TextChannel):
+                channels = [channel]
+                parts = parts[1:]
+
+        after = 0
+        if parts:
+            since = parts[0].strip()
+            try:
+                after = int(since)
+            except ValueError:
+                try:
+                    after = discord.utils.time_snowflake(parse_time(since))
+                except ValueError:
+                    self.outbox.send(
+                        message.channel,
+                        f"<@{message.author.id}>: USAGE: c!hof-backfill "
+                        "[CHANNEL] [SINCE], where SINCE is a time or a message ID",
+                    )
+                    return
+
+        guild.hall_of_fame_backfill = HallOfFameBackfill(
+            channels=[channel.id for channel in channels], after=after
+        )
+        self._mark_dirty(message.guild.id)
+        self._start_backfill(message.guild.id, message.channel)
+        self.outbox.send(
+            message.channel,
+            f"<@{message.author.id}>: Scanning {len(channels)} channels for the "
+            "Hall of Fame",
+        )
+
+    def _start_backfill(
+        self, guild_id: int, reply_to: t.Optional[discord.abc.Messageable] = None
+    ) -> None:
+        "Run a guild's scan for the HOF in the background"
+        task = asyncio.create_task(self._backfill(guild_id, reply_to))
+        self._backfills[guild_id] = task
+        task.add_done_callback(lambda _task: self._backfills.pop(guild_id, None))
+
+    async def _backfill(
+        self, guild_id: int, reply_to: t.Optional[discord.abc.Messageable]
+    ) -> None:
+        """Scan a guild's channels for older messages with enough reactions,
+        adding them to the HOF oldest first and checkpointing as it goes"""
+
+        logger = structlog.get_logger().bind(guild=guild_id)
+
+        guild = self._storage.guilds[guild_id]
+        backfill = guild.hall_of_fame_backfill
+        assert backfill is not None
+        channel_ids = backfill.channels
+        channels = [
+            channel
+            for channel in map(self.client.get_channel, channel_ids)
+            if isinstance(channel, discord.TextChannel)
+        ]
+        logger.info("hof.backfill.start", channels=len(channels), after=backfill.after)
+
+        def qualifies(message: discord.Message) -> bool:
+            hof = guild.hall_of_fame
+            return (
+                hof is not None
+                and not guild.is_inducted(message.id)
+                and message.id not in posted
+                and any(
+                    getattr(reaction.emoji, "name", reaction.emoji)
+                    == hof.reaction_emoji
+                    and reaction.count >= hof.reaction_count
+                    for reaction in message.reactions
+                )
+            )
+
+        added = 0
+
+        async def found(messages: t.List[discord.Message], after: int) -> None:
+            nonlocal added
+            async with self._guild_locks[guild_id]:
+                for message in messages:
+                    added += await self._add_to_hof(message)
+                # The checkpoint only moves past messages once they're inducted,
+                # so a resumed scan never posts them again
+                guild.hall_of_fame_backfill = HallOfFameBackfill(
+                    channels=channel_ids, after=after
+                )
+                self._mark_dirty(guild_id)
+
+        posted: t.Set[int] = set()
+        scan = Backfill(channels, backfill.after, qualifies, found)
+        try:
+            hof = guild.hall_of_fame
+            hof_channel = hof and self.client.get_channel(hof.hof_channel)
+            if backfill.after < self._hof_window_start() and isinstance(
+                hof_channel, discord.TextChannel
+            ):
+                # Inducted messages past the reaction window were forgotten, so
+                # the hall of fame's own posts tell which of them are in it
+                assert self.client.user is not None
+                posted = await posted_messages(hof_channel, self.client.user.id)
+            await scan.run(self.settings.hof_backfill_concurrency)
+        except discord.HTTPException as e:
+            logger.error("hof.backfill.failed", error=e, scanned=scan.scanned)
+            if reply_to is not None:
+                self.outbox.send(
+                    reply_to,
+                    f"Scanning for the Hall of Fame stopped after {scan.scanned} "
+                    "messages, use c!hof-backfill to resume it",
+                )
+            return
+
+        guild.hall_of_fame_backfill = None
+        self._mark_dirty(guild_id)
+        logger.info("hof.backfill.done", scanned=scan.scanned, added=added)
+        if reply_to is not None:
+            self.outbox.send(
+                reply_to,
+                f"Finished scanning {scan.scanned} messages for the Hall of Fame, "
+                f"and added {added}",
+            )
+
+    async def _stats(self, message: discord.Message) -> None:
+        "Show the bot's performance statistics (administrators only)"
+
+        if not isinstance(message.author, discord.Member) or not (
+            message.author.guild_permissions.administrator
+        ):
+            self.outbox.send(
+                message.channel,
+                f"<@{message.author.id}>: Only administrators can see statistics",
+            )
+            return
+
+        metrics = self.metrics
+        embed = discord.Embed(
+            title="Statistics", color=discord.Color.from_rgb(0x5B, 0xC0, 0xEB)
+        )
+
+        def describe(
+            series: t.Any, p50: t.Optional[float], p99: t.Optional[float]
+        ) -> str:
+            mean = series.sum / series.count * 1000
+            return (
+                f"{series.count} calls, mean {mean:.1f}ms, "
+                f"p50 ≤{(p50 or 0) * 1000:g}ms, p99 ≤{(p99 or 0) * 1000:g}ms"
+            )
+
+        for labels, series in sorted(metrics.command_latency.series.items()):
+            command = dict(labels)["command"]
+            errors = metrics.command_errors.values.get(labels, 0)
+            embed.add_field(
+                name=f"{COMMAND_PREFIX}{command}",
+                value=describe(
+                    series,
+                    metrics.command_latency.quantile(0.5, command=command),
+                    metrics.command_latency.quantile(0.99, command=command),
+                )
+                + f", {errors:g} errors",
+            )
+
+        for labels, series in sorted(metrics.identifier_latency.series.items()):
+            op = dict(labels)["op"]
+            embed.add_field(
+                name="Batch name lookup" if op == "many" else "Name lookup",
+                value=describe(
+                    series,
+                    metrics.identifier_latency.quantile(0.5, op=op),
+                    metrics.identifier_latency.quantile(0.99, op=op),
+                ),
+            )
+
+        for labels, series in sorted(metrics.storage_latency.series.items()):
+            op = dict(labels)["op"]
+            embed.add_field(
+                name=f"Storage {op}",
+                value=describe(
+                    series,
+                    metrics.storage_latency.quantile(0.5, op=op),
+                    metrics.storage_latency.quantile(0.99, op=op),
+                )
+                + f", {metrics.storage_errors.values.get(labels, 0):g} errors",
+            )
+
+        embed.add_field(
+            name="Discord API",
+            value=f"{metrics.api_requests.total():g} requests, "
+            f"{metrics.api_errors.total():g} errors, "
+            f"{metrics.api_rate_limits.total():g} rate limits",
+        )
+
+        self.outbox.send(message.channel, f"<@{message.author.id}>", embed=embed)
 
     COMMANDS = {
         "create-party": _createparty,
         "delete-party": _deleteparty,
         "parties": _list_parties,
         "add-timezone": _addtimezone,
+        "import-party": _import_party,
+        "export-party": _export_party,
         "hof": _manual_hof,
         "convert": _convert,
         "convert-as": _convert_as,
         "help": _show_help,
         "hof-requirements": _hof_reqs,
+        "hof-backfill": _hof_backfill,
+        "stats": _stats,
+        "availability": _availability,
+        "overlap": _overlap,
+        "schedule": _schedule,
+        "reminders": _list_reminders,
+        "unschedule": _unschedule,
     }
 
+    # The commands which change storage, and so need the guild's lock
+    MUTATING_COMMANDS = frozenset(
+        {
+            "create-party",
+            "delete-party",
+            "add-timezone",
+            "import-party",
+            "hof",
+            "hof-requirements",
+            "hof-backfill",
+            "availability",
+            "schedule",
+            "unschedule",
+        }
+    )
+
     async def on_message(self, message: discord.Message) -> None:
         if message.author.bot or message.author == self.client.user:
             return
@@ -526,9 +1822,7 @@ class Bot:
         if not message.content.startswith(COMMAND_PREFIX):
             return
 
-        if not self._loaded_storage:
-            await self._load_storage()
-            self._loaded_storage = True
+        await self._ensure_loaded()
 
         logger = structlog.get_logger().bind(
             member_id=message.author.id, member_name=message.author.name
@@ -543,36 +1837,95 @@ class Bot:
         meth = self.__class__.COMMANDS[command]
 
         try:
-            await meth(self, message)
+            with self.metrics.time(self.metrics.command_latency, command=command):
+                if message.guild is not None and command in self.MUTATING_COMMANDS:
+                    async with self._guild_locks[message.guild.id]:
+                        await meth(self, message)
+                else:
+                    await meth(self, message)
         except Exception as e:
+            self.metrics.command_errors.inc(command=command)
             logger.error("error", error=e)
 
-        await self._save_storage()
+    def _hof_window_start(self) -> int:
+        "Find the oldest message whose reactions count towards the HOF"
+        days = self.settings.hof_reaction_window_days
+        if days is None:
+            return 0
+        return window_start(days, datetime.now(timezone.utc).timestamp())
+
+    def _hof_reaction(
+        self, payload: discord.RawReactionActionEvent
+    ) -> t.Optional[HallOfFameRequirements]:
+        "Get the HOF requirements a reaction counts towards, if any"
+        # Most reactions aren't for the hall of fame, so turn those away
+        # before looking at any storage
+        if payload.guild_id is None:
+            return None
+        emoji = self._hof_emoji.get(payload.guild_id)
+        if emoji is None or payload.emoji.name != emoji:
+            return None
+
+        guild = self._storage.guilds[payload.guild_id]
+        if (
+            guild.is_inducted(payload.message_id)
+            or payload.message_id < self._hof_window_start()
+        ):
+            return None
+        return guild.hall_of_fame
 
-    async def on_reaction_add(
-        self,
-        reaction: discord.Reaction,
-        _user: t.Union[discord.User, discord.Member],
+    async def on_raw_reaction_add(
+        self, payload: discord.RawReactionActionEvent
     ) -> None:
-        logger = structlog.get_logger().bind(message_id=reaction.message.id)
+        await self._ensure_loaded()
 
-        if not self._loaded_storage:
-            await self._load_storage()
-            self._loaded_storage = True
+        hof = self._hof_reaction(payload)
+        if hof is None:
+            return
 
-        assert reaction.message.guild is not None
-        guild = self._storage.guilds.setdefault(
-            reaction.message.guild.id, GuildStorage()
-        )
-        hof = guild.hall_of_fame
+        count = self._hof_candidates.add(payload.message_id)
+        logger = structlog.get_logger().bind(message_id=payload.message_id)
+        logger.debug("hof.reaction.counted", count=count)
+        if count < hof.reaction_count:
+            return
 
-        if (
-            hof is None
-            or getattr(reaction.emoji, "name", reaction.emoji) != hof.reaction_emoji
-            or reaction.count != hof.reaction_count
-        ):
+        # Only now is the message worth fetching, to check the real count
+        channel = self.client.get_channel(payload.channel_id)
+        if not isinstance(channel, discord.TextChannel):
+            return
+        try:
+            message = await channel.fetch_message(payload.message_id)
+        except discord.NotFound:
+            self._hof_candidates.discard(payload.message_id)
+            return
+
+        count = max(
+            (
+                reaction.count
+                for reaction in message.reactions
+                if getattr(reaction.emoji, "name", reaction.emoji) == payload.emoji.name
+            ),
+            default=0,
+        )
+        if count < hof.reaction_count:
+            logger.debug("hof.reaction.count_corrected", count=count)
+            self._hof_candidates.set(payload.message_id, count)
             return
 
-        logger.info("hof.reaction_reached")
+        logger.info("hof.reaction.reached")
+        self._hof_candidates.discard(payload.message_id)
 
-        await self._add_to_hof(reaction.message)
+        assert payload.guild_id is not None
+        async with self._guild_locks[payload.guild_id]:
+            await self._add_to_hof(message)
+
+    async def on_raw_reaction_remove(
+        self, payload: discord.RawReactionActionEvent
+    ) -> None:
+        await self._ensure_loaded()
+
+        if (
+            self._hof_reaction(payload) is not None
+            and payload.message_id in self._hof_candidates
+        ):
+            self._hof_candidates.add(payload.message_id, -1)
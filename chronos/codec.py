@@ -0,0 +1,691 @@
+"""Compact encoding for the storage kept in Discord messages
+
+Payloads are encoded as a small binary format, optionally zlib-compressed, and
+then turned into text by packing 14 bits into each character, using a block of
+CJK ideographs which Discord accepts in messages. A character counts once
+towards Discord's message limit no matter its code point, so this fits over
+twice as much data in a message as base64 does.
+
+The binary format starts with a header holding a magic number, the format
+version, some flags and a CRC32 of the rest of the payload. Each guild's data
+is a sequence of tagged records, so that newer fields can be added without
+breaking older payloads.
+
+The same records make up journal deltas, which only hold the records of a
+guild which were written or removed since the last save.
+
+Payloads whose checksum matches were written by the bot from already valid
+models, so they're decoded without running pydantic's validation again.
+Payloads without one, from before checksums were added or from the legacy
+pickle format, are validated.
+"""
+
+import typing as t
+import io
+import pickle
+import struct
+import zlib
+from base64 import b64decode
+
+from . import zones
+from .models import (
+    GuildStorage,
+    HallOfFameBackfill,
+    HallOfFameRequirements,
+    Reminder,
+    Storage,
+)
+
+MAGIC = b"CHR"
+# Version 3 replaced TAG_PARTY's whole hour offsets with timezone keys, so
+# older versions must not read it and silently drop every party. Version 4
+# manifests list the messages each shard carries on into instead of its guilds
+VERSION = 4
+# The first version whose header has a checksum
+CHECKSUM_VERSION = 2
+# The first version whose manifests don't list each shard's guilds
+CHAINED_MANIFEST_VERSION = 4
+
+FLAG_ZLIB = 1 << 0
+
+# The first character of an encoded payload tells how many padding bytes were
+# added to the last block. None of these characters can start a base64 payload
+TEXT_MARKER_BASE = 0x2460
+TEXT_BASE = 0x4E00
+BITS_PER_CHAR = 14
+BLOCK_BYTES = 7  # 56 bits, so four characters
+BLOCK_CHARS = 4
+
+# Guild record tags
+TAG_END = 0
+TAG_PARTY = 1
+TAG_HALL_OF_FAME = 2
+TAG_HALL_OF_FAME_INDUCTED = 3
+TAG_PARTY_ZONES = 4
+TAG_AVAILABILITY = 5
+TAG_REMINDER = 6
+# Only in journal deltas, removing a record written before
+TAG_REMOVED = 7
+TAG_HALL_OF_FAME_BACKFILL = 8
+TAG_HALL_OF_FAME_MANUAL = 9
+
+# Identifies a record in a guild's storage which can be replaced by itself:
+# its tag, and the party name, message, member or reminder ID it's for
+RecordKey = t.Tuple[int, t.Union[str, int, None]]
+
+
+class CodecError(ValueError):
+    pass
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """Unpickles the legacy storage format, which only ever held builtin
+    containers, strings and numbers. Anything else could run arbitrary code
+    when loaded, so it's refused"""
+
+    ALLOWED = {("builtins", "set"), ("builtins", "frozenset")}
+
+    def find_class(self, module: str, name: str) -> t.Any:
+        if (module, name) not in self.ALLOWED:
+            raise CodecError(f"legacy payload references {module}.{name}")
+        return super().find_class(module, name)
+
+
+def _legacy_loads(text: str) -> t.Any:
+    "Load a base64-encoded pickle written before this codec existed"
+    return _LegacyUnpickler(io.BytesIO(b64decode(text))).load()
+
+
+class Writer:
+    def __init__(self) -> None:
+        self.buf = bytearray()
+
+    def uint(self, value: int) -> None:
+        "Write an unsigned LEB128 varint"
+        if value < 0x80:
+            if value < 0:
+                raise CodecError(f"Can't encode negative value {value} as unsigned")
+            self.buf.append(value)
+            return
+        while True:
+            byte = value & 0x7F
+            value >>= 7
+            if value:
+                self.buf.append(byte | 0x80)
+            else:
+                self.buf.append(byte)
+                return
+
+    def uints(self, values: t.List[int]) -> None:
+        "Write many unsigned varints, all at once if they each fit in a byte"
+        if values and 0 <= min(values) and max(values) < 0x80:
+            self.buf += bytes(values)
+            return
+        for value in values:
+            self.uint(value)
+
+    def sint(self, value: int) -> None:
+        "Write a zigzag-encoded signed varint"
+        self.uint(value * 2 if value >= 0 else -value * 2 - 1)
+
+    def bytes(self, value: bytes) -> None:
+        self.uint(len(value))
+        self.buf += value
+
+    def str(self, value: str) -> None:
+        self.bytes(value.encode("utf-8"))
+
+    def ids(self, values: t.Iterable[int]) -> None:
+        "Write a set of IDs, sorted and packed as 64-bit integers"
+        ids = sorted(values)
+        self.uint(len(ids))
+        self.buf += struct.pack(f">{len(ids)}Q", *ids)
+
+    def deltas(self, values: t.Iterable[int]) -> None:
+        """Write a set of IDs, sorted and delta-encoded as varints
+
+        This is smaller than ids() for IDs created close together in time,
+        since Discord IDs start with their creation timestamp."""
+        ids = sorted(values)
+        self.uint(len(ids))
+        last = 0
+        for id_ in ids:
+            self.uint(id_ - last)
+            last = id_
+
+    def record(self, tag: int, body: "Writer") -> None:
+        self.uint(tag)
+        self.bytes(bytes(body.buf))
+
+
+class Reader:
+    def __init__(self, buf: bytes) -> None:
+        self.buf = buf
+        self.pos = 0
+
+    def uint(self) -> int:
+        try:
+            byte = self.buf[self.pos]
+        except IndexError:
+            raise CodecError("Truncated varint") from None
+        if not byte & 0x80:
+            self.pos += 1
+            return byte
+
+        value = 0
+        shift = 0
+        while True:
+            try:
+                byte = self.buf[self.pos]
+            except IndexError:
+                raise CodecError("Truncated varint") from None
+            self.pos += 1
+            value |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    def uints(self, count: int) -> t.List[int]:
+        "Read many unsigned varints, all at once if they each fit in a byte"
+        chunk = self.buf[self.pos : self.pos + count]  # noqa
+        if len(chunk) == count and max(chunk, default=0) < 0x80:
+            self.pos += count
+            return list(chunk)
+        return [self.uint() for _ in range(count)]
+
+    def sint(self) -> int:
+        value = self.uint()
+        return value // 2 if not value & 1 else -(value + 1) // 2
+
+    def bytes(self) -> bytes:
+        length = self.uint()
+        if self.pos + length > len(self.buf):
+            raise CodecError("Truncated byte string")
+        value = self.buf[self.pos : self.pos + length]  # noqa
+        self.pos += length
+        return value
+
+    def str(self) -> str:
+        return self.bytes().decode("utf-8")
+
+    def ids(self) -> t.List[int]:
+        count = self.uint()
+        end = self.pos + count * 8
+        if end > len(self.buf):
+            raise CodecError("Truncated ID list")
+        ids = struct.unpack_from(f">{count}Q", self.buf, self.pos)
+        self.pos = end
+        return list(ids)
+
+    def deltas(self) -> t.List[int]:
+        ids = []
+        last = 0
+        for _ in range(self.uint()):
+            last += self.uint()
+            ids.append(last)
+        return ids
+
+    def record(self) -> t.Tuple[int, "Reader"]:
+        tag = self.uint()
+        if tag == TAG_END:
+            return tag, Reader(b"")
+        return tag, Reader(self.bytes())
+
+
+TEXT_END = TEXT_BASE + (1 << BITS_PER_CHAR)
+
+
+def _table(mask: int, shift: int) -> bytes:
+    "A translation table masking bytes, then shifting them left or right"
+    return bytes(
+        ((byte & mask) << shift if shift >= 0 else byte >> -shift) & 0xFF
+        for byte in range(256)
+    )
+
+
+# A block's seven bytes make four characters, each written as the two bytes of
+# its UTF-16 encoding. Each of those is made of the bits of at most two of the
+# block's bytes, so a payload is converted a column at a time: the same byte of
+# every block is picked out by slicing, moved into place with a translation
+# table, and merged with another column by a bitwise or over one big integer.
+# This lists the (byte of a block, table) pairs making each byte of its text
+_ENCODE = [
+    [(column, _table(mask, shift)) for column, mask, shift in parts]
+    for parts in [
+        [(0, 0xFF, -2)],
+        [(0, 0x03, 6), (1, 0xFF, -2)],
+        [(1, 0x03, 4), (2, 0xFF, -4)],
+        [(2, 0x0F, 4), (3, 0xFF, -4)],
+        [(3, 0x0F, 2), (4, 0xFF, -6)],
+        [(4, 0x3F, 2), (5, 0xFF, -6)],
+        [(5, 0x3F, 0)],
+        [(6, 0xFF, 0)],
+    ]
+]
+# And the (byte of its text, table) pairs making each byte of a block
+_DECODE = [
+    [(column, _table(mask, shift)) for column, mask, shift in parts]
+    for parts in [
+        [(0, 0xFF, 2), (1, 0xFF, -6)],
+        [(1, 0x3F, 2), (2, 0xFF, -4)],
+        [(2, 0x0F, 4), (3, 0xFF, -4)],
+        [(3, 0x0F, 4), (4, 0xFF, -2)],
+        [(4, 0x03, 6), (5, 0xFF, -2)],
+        [(5, 0x03, 6), (6, 0xFF, 0)],
+        [(7, 0xFF, 0)],
+    ]
+]
+
+# TEXT_BASE's low byte is zero, so it only adds to each character's high byte
+_HIGH_BASE = TEXT_BASE >> 8
+_HIGH_END = TEXT_END >> 8
+_ADD_BASE = bytes((byte + _HIGH_BASE) & 0xFF for byte in range(256))
+_REMOVE_BASE = bytes((byte - _HIGH_BASE) & 0xFF for byte in range(256))
+
+
+def _convert(
+    data: t.Union[bytes, bytearray],
+    width: int,
+    spec: t.List[t.List[t.Tuple[int, bytes]]],
+) -> bytearray:
+    "Rebuild every block of the given width as described by the spec"
+    columns = [data[i::width] for i in range(width)]
+    blocks = len(columns[0])
+    out = bytearray(blocks * len(spec))
+    for i, parts in enumerate(spec):
+        merged = 0
+        for column, table in parts:
+            merged |= int.from_bytes(columns[column].translate(table), "big")
+        out[i :: len(spec)] = merged.to_bytes(blocks, "big")  # noqa
+    return out
+
+
+def to_text(data: bytes) -> str:
+    "Turn bytes into text which is safe to put in a Discord message"
+    padding = -len(data) % BLOCK_BYTES
+    encoded = _convert(data + bytes(padding), BLOCK_BYTES, _ENCODE)
+    encoded[0::2] = encoded[0::2].translate(_ADD_BASE)
+    return chr(TEXT_MARKER_BASE + padding) + encoded.decode("utf-16-be")
+
+
+def from_text(text: str) -> bytes:
+    "Turn text produced by to_text back into bytes"
+    if not is_encoded(text) or (len(text) - 1) % BLOCK_CHARS:
+        raise CodecError("Not an encoded payload")
+    padding = ord(text[0]) - TEXT_MARKER_BASE
+
+    # Characters outside the block, even ones taking two UTF-16 code units,
+    # have a high byte outside of it
+    encoded = bytearray(text[1:].encode("utf-16-be", "surrogatepass"))
+    high = encoded[0::2]
+    if high and not _HIGH_BASE <= min(high) <= max(high) < _HIGH_END:
+        raise CodecError("Invalid character in payload")
+    encoded[0::2] = high.translate(_REMOVE_BASE)
+
+    out = _convert(encoded, BLOCK_CHARS * 2, _DECODE)
+    return bytes(out[: len(out) - padding])
+
+
+def is_encoded(text: str) -> bool:
+    "Check whether the given text was produced by this codec"
+    return bool(text) and 0 <= ord(text[0]) - TEXT_MARKER_BASE < BLOCK_BYTES
+
+
+def _pack(body: Writer, compress: bool) -> str:
+    payload = bytes(body.buf)
+    flags = 0
+    if compress:
+        # Higher levels take several times as long for under 1% smaller payloads
+        compressed = zlib.compress(payload)
+        if len(compressed) < len(payload):
+            payload = compressed
+            flags |= FLAG_ZLIB
+    checksum = struct.pack(">I", zlib.crc32(payload))
+    return to_text(MAGIC + bytes((VERSION, flags)) + checksum + payload)
+
+
+def _unpack(text: str) -> t.Tuple[Reader, int]:
+    "Unpack a payload, also returning the version it was written with"
+    data = from_text(text)
+    if data[: len(MAGIC)] != MAGIC:
+        raise CodecError("Bad magic number")
+    version, flags = data[len(MAGIC) : len(MAGIC) + 2]  # noqa
+    if version > VERSION:
+        raise CodecError(f"Unsupported storage version {version}")
+
+    payload = data[len(MAGIC) + 2 :]  # noqa
+    if version >= CHECKSUM_VERSION:
+        (checksum,) = struct.unpack(">I", payload[:4])
+        payload = payload[4:]
+        if zlib.crc32(payload) != checksum:
+            raise CodecError("Payload checksum mismatch")
+
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return Reader(payload), version
+
+
+def _party_record(partyname: str, party: t.Dict[int, str]) -> Writer:
+    record = Writer()
+    record.str(partyname)
+    # Member IDs are written sorted, so their zones follow in that order.
+    # Members often share zones, so each zone is only written once and
+    # members refer to it by its index
+    members = sorted(party)
+    record.ids(members)
+    zone_keys = sorted(set(party.values()))
+    record.uint(len(zone_keys))
+    for zone in zone_keys:
+        record.str(zone)
+    zone_indices = {zone: i for i, zone in enumerate(zone_keys)}
+    record.uints([zone_indices[party[member]] for member in members])
+    return record
+
+
+def _hall_of_fame_record(hof: HallOfFameRequirements) -> Writer:
+    record = Writer()
+    record.str(hof.reaction_emoji)
+    record.uint(hof.reaction_count)
+    record.uint(hof.hof_channel)
+    return record
+
+
+def _inducted_record(inducted: t.Iterable[int]) -> Writer:
+    record = Writer()
+    record.deltas(inducted)
+    return record
+
+
+def _backfill_record(backfill: HallOfFameBackfill) -> Writer:
+    record = Writer()
+    record.ids(backfill.channels)
+    record.uint(backfill.after)
+    return record
+
+
+def _availability_record(
+    availability: t.Dict[int, t.List[t.Tuple[int, int]]]
+) -> Writer:
+    record = Writer()
+    members = sorted(availability)
+    record.ids(members)
+    for member in members:
+        windows = availability[member]
+        record.uint(len(windows))
+        for start, length in windows:
+            record.uint(start)
+            record.uint(length)
+    return record
+
+
+def _reminder_record(reminder_id: int, reminder: Reminder) -> Writer:
+    record = Writer()
+    record.uint(reminder_id)
+    record.uint(reminder.due)
+    record.uint(reminder.channel)
+    record.str(reminder.party)
+    record.uint(reminder.author)
+    record.str(reminder.text)
+    return record
+
+
+def _write_guild(w: Writer, guild: GuildStorage) -> None:
+    for partyname, party in guild.parties.items():
+        w.record(TAG_PARTY_ZONES, _party_record(partyname, party))
+    if guild.hall_of_fame is not None:
+        w.record(TAG_HALL_OF_FAME, _hall_of_fame_record(guild.hall_of_fame))
+    if guild.hall_of_fame_inducted:
+        w.record(
+            TAG_HALL_OF_FAME_INDUCTED, _inducted_record(guild.hall_of_fame_inducted)
+        )
+    if guild.hall_of_fame_manual:
+        w.record(TAG_HALL_OF_FAME_MANUAL, _inducted_record(guild.hall_of_fame_manual))
+    if guild.hall_of_fame_backfill is not None:
+        w.record(
+            TAG_HALL_OF_FAME_BACKFILL, _backfill_record(guild.hall_of_fame_backfill)
+        )
+    if guild.availability:
+        w.record(TAG_AVAILABILITY, _availability_record(guild.availability))
+    for reminder_id, reminder in guild.reminders.items():
+        w.record(TAG_REMINDER, _reminder_record(reminder_id, reminder))
+    w.uint(TAG_END)
+
+
+def guild_records(guild: GuildStorage) -> t.Dict[RecordKey, bytes]:
+    """Split a guild's storage into the smallest records which can be replaced
+    by themselves, to find what changed between two versions of it"""
+    records: t.Dict[RecordKey, Writer] = {
+        (TAG_PARTY_ZONES, partyname): _party_record(partyname, party)
+        for partyname, party in guild.parties.items()
+    }
+    if guild.hall_of_fame is not None:
+        records[TAG_HALL_OF_FAME, None] = _hall_of_fame_record(guild.hall_of_fame)
+    for message in guild.hall_of_fame_inducted:
+        records[TAG_HALL_OF_FAME_INDUCTED, message] = _inducted_record([message])
+    for message in guild.hall_of_fame_manual:
+        records[TAG_HALL_OF_FAME_MANUAL, message] = _inducted_record([message])
+    if guild.hall_of_fame_backfill is not None:
+        records[TAG_HALL_OF_FAME_BACKFILL, None] = _backfill_record(
+            guild.hall_of_fame_backfill
+        )
+    for member, windows in guild.availability.items():
+        records[TAG_AVAILABILITY, member] = _availability_record({member: windows})
+    for reminder_id, reminder in guild.reminders.items():
+        records[TAG_REMINDER, reminder_id] = _reminder_record(reminder_id, reminder)
+    return {key: bytes(record.buf) for key, record in records.items()}
+
+
+def _read_guild(
+    r: Reader, trusted: bool, base: t.Optional[GuildStorage] = None
+) -> GuildStorage:
+    """Read a guild's records, skipping validation of trusted payloads
+
+    Records read on top of a base guild, like a journal delta's, replace its
+    records with the same key."""
+    fields: t.Dict[str, t.Any] = {
+        "parties": {},
+        "hall_of_fame": None,
+        "hall_of_fame_inducted": set(),
+        "hall_of_fame_manual": set(),
+        "hall_of_fame_backfill": None,
+        "availability": {},
+        "reminders": {},
+    }
+    if base is not None:
+        fields = {
+            "parties": dict(base.parties),
+            "hall_of_fame": base.hall_of_fame,
+            "hall_of_fame_inducted": set(base.hall_of_fame_inducted),
+            "hall_of_fame_manual": set(base.hall_of_fame_manual),
+            "hall_of_fame_backfill": base.hall_of_fame_backfill,
+            "availability": dict(base.availability),
+            "reminders": dict(base.reminders),
+        }
+    while True:
+        tag, record = r.record()
+        if tag == TAG_END:
+            if trusted:
+                return GuildStorage.construct(**fields)
+            return GuildStorage(**fields)
+        elif tag == TAG_PARTY_ZONES:
+            partyname = record.str()
+            members = record.ids()
+            zone_keys = [record.str() for _ in range(record.uint())]
+            fields["parties"][partyname] = dict(
+                zip(members, [zone_keys[i] for i in record.uints(len(members))])
+            )
+        elif tag == TAG_PARTY:
+            # Before version 3, members had an offset in whole hours
+            partyname = record.str()
+            members = record.ids()
+            fields["parties"][partyname] = {
+                member: zones.fixed_key(record.sint() * 60) for member in members
+            }
+        elif tag == TAG_HALL_OF_FAME:
+            hof_fields: t.Dict[str, t.Any] = {
+                "reaction_emoji": record.str(),
+                "reaction_count": record.uint(),
+                "hof_channel": record.uint(),
+            }
+            fields["hall_of_fame"] = (
+                HallOfFameRequirements.construct(**hof_fields)
+                if trusted
+                else HallOfFameRequirements(**hof_fields)
+            )
+        elif tag == TAG_HALL_OF_FAME_INDUCTED:
+            fields["hall_of_fame_inducted"].update(record.deltas())
+        elif tag == TAG_HALL_OF_FAME_MANUAL:
+            fields["hall_of_fame_manual"].update(record.deltas())
+        elif tag == TAG_HALL_OF_FAME_BACKFILL:
+            backfill_fields: t.Dict[str, t.Any] = {
+                "channels": record.ids(),
+                "after": record.uint(),
+            }
+            fields["hall_of_fame_backfill"] = (
+                HallOfFameBackfill.construct(**backfill_fields)
+                if trusted
+                else HallOfFameBackfill(**backfill_fields)
+            )
+        elif tag == TAG_AVAILABILITY:
+            fields["availability"].update(
+                (member, [(record.uint(), record.uint()) for _ in range(record.uint())])
+                for member in record.ids()
+            )
+        elif tag == TAG_REMINDER:
+            reminder_id = record.uint()
+            reminder_fields: t.Dict[str, t.Any] = {
+                "due": record.uint(),
+                "channel": record.uint(),
+                "party": record.str(),
+                "author": record.uint(),
+                "text": record.str(),
+            }
+            fields["reminders"][reminder_id] = (
+                Reminder.construct(**reminder_fields)
+                if trusted
+                else Reminder(**reminder_fields)
+            )
+        elif tag == TAG_REMOVED:
+            removed = record.uint()
+            if removed == TAG_PARTY_ZONES:
+                fields["parties"].pop(record.str(), None)
+            elif removed == TAG_HALL_OF_FAME:
+                fields["hall_of_fame"] = None
+            elif removed == TAG_HALL_OF_FAME_INDUCTED:
+                fields["hall_of_fame_inducted"].discard(record.uint())
+            elif removed == TAG_HALL_OF_FAME_MANUAL:
+                fields["hall_of_fame_manual"].discard(record.uint())
+            elif removed == TAG_HALL_OF_FAME_BACKFILL:
+                fields["hall_of_fame_backfill"] = None
+            elif removed == TAG_AVAILABILITY:
+                fields["availability"].pop(record.uint(), None)
+            elif removed == TAG_REMINDER:
+                fields["reminders"].pop(record.uint(), None)
+        # Records with unknown tags come from a newer version and are skipped
+
+
+def encode_storage(storage: Storage, *, compress: bool = True) -> str:
+    w = Writer()
+    w.uint(len(storage.guilds))
+    for guild_id, guild in storage.guilds.items():
+        w.uint(guild_id)
+        _write_guild(w, guild)
+    return _pack(w, compress)
+
+
+def decode_storage(text: str) -> Storage:
+    """Decode storage produced by encode_storage
+
+    Storage from before this codec existed, a base64-encoded pickle of the
+    storage's dict, is also accepted so it can be migrated."""
+
+    if not is_encoded(text):
+        return Storage(**_legacy_loads(text))
+
+    r, version = _unpack(text)
+    trusted = version >= CHECKSUM_VERSION
+    storage = Storage()
+    for _ in range(r.uint()):
+        guild_id = r.uint()
+        storage.guilds[guild_id] = _read_guild(r, trusted)
+    return storage
+
+
+def encode_delta(
+    deltas: t.Dict[int, t.Tuple[t.Dict[RecordKey, bytes], t.List[RecordKey]]],
+    *,
+    compress: bool = True,
+) -> str:
+    """Encode the records written and removed in each guild, as found by
+    comparing their guild_records"""
+    w = Writer()
+    w.uint(len(deltas))
+    for guild_id, (written, removed) in deltas.items():
+        w.uint(guild_id)
+        for tag, key in removed:
+            record = Writer()
+            record.uint(tag)
+            if isinstance(key, str):
+                record.str(key)
+            elif key is not None:
+                record.uint(key)
+            w.record(TAG_REMOVED, record)
+        for (tag, _key), body in written.items():
+            w.uint(tag)
+            w.bytes(body)
+        w.uint(TAG_END)
+    return _pack(w, compress)
+
+
+def apply_delta(storage: Storage, text: str) -> t.Set[int]:
+    "Apply a delta to the storage in place, returning the guilds it changed"
+    r, version = _unpack(text)
+    trusted = version >= CHECKSUM_VERSION
+    changed = set()
+    for _ in range(r.uint()):
+        guild_id = r.uint()
+        storage.guilds[guild_id] = _read_guild(r, trusted, storage.guilds.get(guild_id))
+        changed.add(guild_id)
+    return changed
+
+
+def encode_manifest(
+    shards: t.Dict[int, t.List[int]],
+    journal_after: t.Optional[int] = None,
+    shard_count: t.Optional[int] = None,
+    *,
+    compress: bool = True,
+) -> str:
+    """Encode a manifest of the shards, in order, each with the messages it
+    carries on into. Those are sent in order, so sorting their IDs keeps it"""
+    w = Writer()
+    w.uint(len(shards))
+    for shard_id, continuations in shards.items():
+        w.uint(shard_id)
+        w.ids(continuations)
+    # Added after the shards, so older versions can still read the shards
+    w.uint(journal_after or 0)
+    # The gateway shard count a partition's storage was written for
+    w.uint(shard_count or 0)
+    return _pack(w, compress)
+
+
+def decode_manifest(
+    text: str,
+) -> t.Tuple[t.Dict[int, t.List[int]], t.Optional[int], bool, t.Optional[int]]:
+    """Decode a manifest into its shards, the message its journal starts after,
+    whether it lists each shard's guilds rather than its messages, as manifests
+    before version 4 did, and the shard count it was written for"""
+    if not is_encoded(text):
+        shards = _legacy_loads(text)["shards"]
+        return t.cast(t.Dict[int, t.List[int]], shards), None, True, None
+
+    r, version = _unpack(text)
+    shards = {}
+    for _ in range(r.uint()):
+        shard_id = r.uint()
+        shards[shard_id] = r.ids()
+    journal_after = r.uint() if r.pos < len(r.buf) else 0
+    shard_count = r.uint() if r.pos < len(r.buf) else 0
+    listed = version < CHAINED_MANIFEST_VERSION
+    return shards, journal_after or None, listed, shard_count or None
@@ -0,0 +1,89 @@
+"""Rendering of a party's time conversions
+
+Members sharing a timezone are grouped, so each zone's local time is only
+computed and formatted once, and the result is split into as many messages as
+it takes to stay under Discord's message limit."""
+
+import typing as t
+from collections import OrderedDict
+from datetime import datetime
+
+from . import zones
+from .storage import MESSAGE_LIMIT
+
+# (guild ID, party name, guild storage version, instant)
+Key = t.Tuple[int, str, int, datetime]
+
+
+def _group_lines(members: t.List[int], suffix: str, limit: int) -> t.Iterator[str]:
+    "Mention the members in as few lines ending with the suffix as will fit"
+    line = ""
+    for member in members:
+        mention = f"<@{member}>"
+        longer = f"{line}, {mention}" if line else mention
+        if line and len(f"For {longer}, {suffix}") > limit:
+            yield f"For {line}, {suffix}"
+            line = mention
+        else:
+            line = longer
+    yield f"For {line}, {suffix}"
+
+
+def paginate(lines: t.Iterable[str], limit: int = MESSAGE_LIMIT) -> t.List[str]:
+    "Join lines into as few messages as will fit under the limit"
+    pages = []
+    page = ""
+    for line in lines:
+        if page and len(page) + 1 + len(line) > limit:
+            pages.append(page)
+            page = line
+        else:
+            page = f"{page}\n{line}" if page else line
+    if page:
+        pages.append(page)
+    return pages
+
+
+def render(
+    party: t.Dict[int, str], when: datetime, limit: int = MESSAGE_LIMIT
+) -> t.List[str]:
+    "Render the time in each party member's timezone, as a list of messages"
+    by_zone: t.Dict[str, t.List[int]] = {}
+    for member, zone in party.items():
+        by_zone.setdefault(zone, []).append(member)
+
+    groups = []
+    for zone, members in by_zone.items():
+        local = zones.local_time(zone, when)
+        suffix = f"in {zones.describe(zone, when)}, it's {local:%A at %H:%M}"
+        groups.append((local, suffix, members))
+    groups.sort(key=lambda group: group[0])
+
+    return paginate(
+        (
+            line
+            for _local, suffix, members in groups
+            for line in _group_lines(members, suffix, limit)
+        ),
+        limit,
+    )
+
+
+class RenderCache:
+    "A bounded, least-recently-used cache of rendered conversions"
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._pages: "OrderedDict[Key, t.List[str]]" = OrderedDict()
+
+    def get(self, key: Key) -> t.Optional[t.List[str]]:
+        pages = self._pages.get(key)
+        if pages is not None:
+            self._pages.move_to_end(key)
+        return pages
+
+    def put(self, key: Key, pages: t.List[str]) -> None:
+        self._pages[key] = pages
+        self._pages.move_to_end(key)
+        if len(self._pages) > self.size:
+            self._pages.popitem(last=False)
@@ -0,0 +1,169 @@
+"""Run the bot as several worker processes, each running some of its shards
+
+The gateway shards are split into contiguous ranges, one per worker, and each
+worker runs `python -m chronos` with SHARD_COUNT and SHARD_IDS set, so it
+connects its own shards and keeps only their guilds' storage. Workers which
+exit are restarted, backing off if they keep failing."""
+
+import typing as t
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+
+import discord
+import structlog  # type: ignore
+
+from . import logs
+from .bot import Settings
+
+# Discord allows one shard to identify every five seconds, so workers are
+# started that far apart for each shard started before them
+IDENTIFY_INTERVAL = 5.0
+
+# The longest a failing worker waits before being restarted
+MAX_BACKOFF = 300.0
+
+
+def assign(shard_count: int, workers: int) -> t.List[t.List[int]]:
+    "Split the shards into contiguous ranges, as even as possible"
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for worker in range(workers):
+        end = start + size + (worker < extra)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+async def recommended_shards(token: str) -> int:
+    "Ask Discord how many shards the bot should run as"
+    http = discord.http.HTTPClient()
+    try:
+        await http.static_login(token, bot=True)
+        shards: int
+        shards, _url = await http.get_bot_gateway()
+    finally:
+        await http.close()
+    return shards
+
+
+class Worker:
+    def __init__(self, index: int, env: t.Dict[str, str], delay: float) -> None:
+        self.index = index
+        self.env = env
+        self.delay = delay
+        self.process: t.Optional[asyncio.subprocess.Process] = None
+
+    async def supervise(self, stopping: asyncio.Event) -> None:
+        "Run the worker until stopping is set, restarting it if it exits"
+        logger = structlog.get_logger().bind(worker=self.index)
+
+        backoff = 1.0
+        delay = self.delay
+        while True:
+            try:
+                await asyncio.wait_for(stopping.wait(), delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+            started = time.monotonic()
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "chronos", env=self.env
+            )
+            logger.info("coordinator.worker_started", pid=self.process.pid)
+            code = await self.process.wait()
+            if stopping.is_set():
+                return
+
+            logger.error("coordinator.worker_exited", code=code)
+            # Only back off from workers which fail soon after starting
+            if time.monotonic() - started > MAX_BACKOFF:
+                backoff = 1.0
+            delay = backoff
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def stop(self) -> None:
+        if self.process is not None and self.process.returncode is None:
+            self.process.send_signal(signal.SIGTERM)
+
+
+def worker_env(
+    index: int, shard_ids: t.List[int], shard_count: int, settings: Settings
+) -> t.Dict[str, str]:
+    env = dict(os.environ)
+    env["SHARD_COUNT"] = str(shard_count)
+    env["SHARD_IDS"] = json.dumps(shard_ids)
+    if settings.metrics_port is not None:
+        # Each worker serves its own metrics, on consecutive ports
+        env["METRICS_PORT"] = str(settings.metrics_port + index)
+    return env
+
+
+async def run(settings: Settings, workers: int, shard_count: t.Optional[int]) -> None:
+    logger = structlog.get_logger().bind()
+
+    # The storage is partitioned by shard, so a count set in the environment
+    # is kept to rather than following Discord's recommendation as it changes
+    if shard_count is None:
+        shard_count = settings.shard_count
+    if shard_count is None:
+        shard_count = await recommended_shards(settings.discord_token)
+
+    procs = []
+    started = 0
+    for index, shard_ids in enumerate(assign(shard_count, workers)):
+        env = worker_env(index, shard_ids, shard_count, settings)
+        procs.append(Worker(index, env, started * IDENTIFY_INTERVAL))
+        started += len(shard_ids)
+        logger.info("coordinator.assigned", worker=index, shards=shard_ids)
+
+    stopping = asyncio.Event()
+
+    def stop() -> None:
+        stopping.set()
+        for worker in procs:
+            worker.stop()
+
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop)
+        except NotImplementedError:
+            # Signal handlers aren't available on Windows event loops
+            pass
+
+    await asyncio.gather(*(worker.supervise(stopping) for worker in procs))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="how many worker processes to run (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        help="how many shards to run (default: SHARD_COUNT, or as many as Discord "
+        "recommends)",
+    )
+    args = parser.parse_args()
+
+    settings = Settings()
+    logs.configure(settings.log_level, settings.log_sample_rates)
+    asyncio.get_event_loop().run_until_complete(
+        run(settings, args.workers, args.shards)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import typing as t
+import asyncio
+import heapq
+from collections import OrderedDict
+
+import discord
+import structlog  # type: ignore
+
+# How many messages are read from a channel's history at once, the most
+# Discord returns in one request
+HISTORY_PAGE = 100
+
+
+def window_start(days: int, now: float) -> int:
+    """Find the lowest ID of the messages sent in the given number of days
+    before now, a UNIX timestamp"""
+    millis = int((now - days * 86400) * 1000) - discord.utils.DISCORD_EPOCH
+    return max(millis, 0) << 22
+
+
+async def posted_messages(channel: discord.TextChannel, user_id: int) -> t.Set[int]:
+    """Find the messages a hall of fame channel has posts for, from the links
+    in the embeds the bot posted there"""
+    posted = set()
+    async for post in channel.history(limit=None):
+        if post.author.id != user_id:
+            continue
+        for embed in post.embeds:
+            _jump, _slash, message_id = str(embed.url).rpartition("/")
+            if message_id.isdigit():
+                posted.add(int(message_id))
+    return posted
+
+
+class CandidateCache:
+    """A bounded, least-recently-used record of hall of fame candidates
+
+    This maps the IDs of the messages which got the hall of fame emoji to how
+    many of those reactions they've been seen getting. Once full, the message
+    which went longest without such a reaction is forgotten."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._counts: "OrderedDict[int, int]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __contains__(self, message_id: object) -> bool:
+        return message_id in self._counts
+
+    def add(self, message_id: int, delta: int = 1) -> int:
+        "Change a message's reaction count, returning the new count"
+        count = max(self._counts.pop(message_id, 0) + delta, 0)
+        self._counts[message_id] = count
+        if len(self._counts) > self.size:
+            self._counts.popitem(last=False)
+        return count
+
+    def set(self, message_id: int, count: int) -> None:
+        "Correct a message's reaction count with its real value"
+        if message_id in self._counts:
+            self._counts[message_id] = count
+
+    def discard(self, message_id: int) -> None:
+        self._counts.pop(message_id, None)
+
+
+class Backfill:
+    """A scan of channels' histories, oldest first, for messages which qualify
+    for the hall of fame
+
+    Each worker reads the next page of whichever channel's scan is furthest
+    behind, so the channels are scanned at about the same pace. No channel can
+    then turn up a message older than where that one is, so the qualifying
+    messages up to it are handed on in order, with it as the checkpoint."""
+
+    def __init__(
+        self,
+        channels: t.Iterable[discord.TextChannel],
+        after: int,
+        qualifies: t.Callable[[discord.Message], bool],
+        found: t.Callable[[t.List[discord.Message], int], t.Awaitable[None]],
+    ) -> None:
+        # (ID of the last message scanned, channel ID, channel) for the
+        # channels waiting for their next page to be read
+        self._waiting = [(after, channel.id, channel) for channel in channels]
+        heapq.heapify(self._waiting)
+        # channel ID -> ID of the last message scanned, for the pages being read
+        self._reading: t.Dict[int, int] = {}
+        # (message ID, message) for the qualifying messages not handed on yet
+        self._found: t.List[t.Tuple[int, discord.Message]] = []
+        self._handing = asyncio.Lock()
+
+        self._qualifies = qualifies
+        self._on_found = found
+        self.after = after
+        self.scanned = 0
+        self.qualified = 0
+
+    async def run(self, concurrency: int) -> None:
+        """Scan every channel, reading at most `concurrency` pages at once
+
+        The found callback gets each batch of qualifying messages, oldest
+        first, and the ID every channel has been scanned up to. If a page
+        can't be read, the scan stops there and the error is raised."""
+        workers = [asyncio.ensure_future(self._work()) for _ in range(concurrency)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+        await self._hand_on()
+
+    async def _work(self) -> None:
+        logger = structlog.get_logger().bind()
+
+        while self._waiting:
+            after, channel_id, channel = heapq.heappop(self._waiting)
+            self._reading[channel_id] = after
+            try:
+                messages = [
+                    message
+                    async for message in channel.history(
+                        limit=HISTORY_PAGE,
+                        after=discord.Object(after),
+                        oldest_first=True,
+                    )
+                ]
+            except (discord.Forbidden, discord.NotFound):
+                # The bot can't read this channel, so there's nothing to find
+                logger.info("hof.backfill.forbidden", channel=channel_id)
+                messages = []
+            except BaseException:
+                # Put the channel back, so the checkpoint stays behind it
+                heapq.heappush(self._waiting, (after, channel_id, channel))
+                raise
+            finally:
+                del self._reading[channel_id]
+
+            self.scanned += len(messages)
+            for message in messages:
+                if self._qualifies(message):
+                    heapq.heappush(self._found, (message.id, message))
+            if len(messages) == HISTORY_PAGE:
+                heapq.heappush(self._waiting, (messages[-1].id, channel_id, channel))
+            await self._hand_on()
+
+    async def _hand_on(self) -> None:
+        "Hand on the qualifying messages older than every channel's scan"
+        async with self._handing:
+            pending = [after for after, _id, _channel in self._waiting]
+            pending += self._reading.values()
+            checkpoint = min(pending, default=None)
+
+            ready = []
+            while self._found and (
+                checkpoint is None or self._found[0][0] <= checkpoint
+            ):
+                ready.append(heapq.heappop(self._found)[1])
+            if checkpoint is None:
+                # Every channel has been scanned to its end
+                checkpoint = max([self.after] + [message.id for message in ready])
+
+            if ready or checkpoint > self.after:
+                self.after = checkpoint
+                self.qualified += len(ready)
+                await self._on_found(ready, checkpoint)
@@ -0,0 +1,104 @@
+"""Rendering of the listing of a guild's parties
+
+The listing is split into pages, each holding as many parties as fit in one
+embed. Parties with too many members for one field carry on in more fields,
+and pages are rendered once per version of the guild's parties, so repeated
+listings don't resolve any names or format anything again."""
+
+import typing as t
+from collections import OrderedDict
+from datetime import datetime
+
+from . import zones
+
+# Discord's limits on embeds
+EMBED_FIELDS = 25
+FIELD_NAME_LIMIT = 256
+FIELD_VALUE_LIMIT = 1024
+# The limit is on all of an embed's text, so leave room for its title and footer
+EMBED_TEXT_LIMIT = 6000 - 200
+
+# (name, value)
+Field = t.Tuple[str, str]
+# (guild storage version, hour the offsets were described at)
+Key = t.Tuple[int, int]
+
+
+def _split_value(entries: t.List[str]) -> t.List[str]:
+    "Join entries into as few field values as will fit"
+    values = []
+    value = ""
+    for entry in entries:
+        if value and len(value) + 2 + len(entry) > FIELD_VALUE_LIMIT:
+            values.append(value)
+            value = entry
+        else:
+            value = f"{value}, {entry}" if value else entry
+    values.append(value or "No members")
+    return values
+
+
+def _fields(
+    parties: t.Dict[str, t.Dict[int, str]], names: t.Dict[int, str], now: datetime
+) -> t.Iterator[Field]:
+    # Members often share zones, so each zone is only described once
+    described: t.Dict[str, str] = {}
+    for partyname, party in parties.items():
+        entries = []
+        for member, zone in party.items():
+            description = described.get(zone)
+            if description is None:
+                description = described[zone] = zones.describe(zone, now)
+            entries.append(f"{names.get(member, member)} ({description})")
+
+        name = partyname[:FIELD_NAME_LIMIT]
+        for i, value in enumerate(_split_value(entries)):
+            if i:
+                name = f"{partyname[:FIELD_NAME_LIMIT - 12]} (continued)"
+            yield name, value
+
+
+def render(
+    parties: t.Dict[str, t.Dict[int, str]], names: t.Dict[int, str], now: datetime
+) -> t.List[t.List[Field]]:
+    "Render the parties with their members' names, as pages of embed fields"
+    pages: t.List[t.List[Field]] = []
+    page: t.List[Field] = []
+    size = 0
+    for name, value in _fields(parties, names, now):
+        if page and (
+            len(page) == EMBED_FIELDS
+            or size + len(name) + len(value) > EMBED_TEXT_LIMIT
+        ):
+            pages.append(page)
+            page = []
+            size = 0
+        page.append((name, value))
+        size += len(name) + len(value)
+    pages.append(page)
+    return pages
+
+
+class ListingCache:
+    """The latest rendered listing of each guild's parties, for the most
+    recently listed guilds"""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._listings: "OrderedDict[int, t.Tuple[Key, t.List[t.List[Field]]]]" = (
+            OrderedDict()
+        )
+
+    def get(self, guild_id: int, key: Key) -> t.Optional[t.List[t.List[Field]]]:
+        listing = self._listings.get(guild_id)
+        if listing is None or listing[0] != key:
+            return None
+        self._listings.move_to_end(guild_id)
+        return listing[1]
+
+    def put(self, guild_id: int, key: Key, pages: t.List[t.List[Field]]) -> None:
+        # A guild's older listing is replaced, since it can't be used again
+        self._listings[guild_id] = (key, pages)
+        self._listings.move_to_end(guild_id)
+        if len(self._listings) > self.size:
+            self._listings.popitem(last=False)
@@ -0,0 +1,118 @@
+"""Structured logging setup
+
+Events below the configured level are turned away by the logger itself,
+before their context is merged or any processor runs. Expensive fields can be
+wrapped in Lazy so they're only computed for events which get rendered, and
+high-frequency events can be sampled."""
+
+import typing as t
+import random
+import zlib
+
+import structlog  # type: ignore
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "critical": 50}
+
+Level = t.Literal["debug", "info", "warning", "error", "critical"]
+EventDict = t.Dict[str, t.Any]
+
+
+class Lazy:
+    "A log field which is only computed if its event is rendered"
+
+    __slots__ = ("func",)
+
+    def __init__(self, func: t.Callable[[], t.Any]) -> None:
+        self.func = func
+
+
+def summarize_parties(parties: t.Dict[str, t.Dict[int, str]]) -> Lazy:
+    "Summarize a guild's parties by their size and a hash of their contents"
+
+    def summary() -> t.Dict[str, t.Any]:
+        state = repr(
+            sorted((name, sorted(party.items())) for name, party in parties.items())
+        )
+        return {
+            "parties": len(parties),
+            "members": sum(len(party) for party in parties.values()),
+            "hash": format(zlib.crc32(state.encode()), "08x"),
+        }
+
+    return Lazy(summary)
+
+
+def _evaluate_lazy(_logger: t.Any, _method: str, event_dict: EventDict) -> EventDict:
+    for key, value in event_dict.items():
+        if isinstance(value, Lazy):
+            event_dict[key] = value.func()
+    return event_dict
+
+
+class Sampler:
+    """Keep only a fraction of some events
+
+    Rates are keyed by event name or by a prefix of it ending in a dot, like
+    "hof." for every hall of fame event. Kept events note their sample rate,
+    so counts of them can be scaled back up."""
+
+    def __init__(self, rates: t.Dict[str, float]) -> None:
+        self.rates = rates
+
+    def _rate(self, event: str) -> t.Optional[float]:
+        rate = self.rates.get(event)
+        while rate is None and "." in event:
+            event = event.rsplit(".", 1)[0]
+            rate = self.rates.get(event + ".")
+        return rate
+
+    def __call__(
+        self, _logger: t.Any, _method: str, event_dict: EventDict
+    ) -> EventDict:
+        rate = self._rate(str(event_dict.get("event")))
+        if rate is not None:
+            if random.random() >= rate:
+                raise structlog.DropEvent
+            event_dict["sample_rate"] = rate
+        return event_dict
+
+
+def _filtering_logger(level: Level) -> type:
+    "Make a bound logger class whose methods below the level do nothing"
+
+    def make_method(name: str) -> t.Callable[..., t.Any]:
+        if LEVELS[name] < LEVELS[level]:
+
+            def dropped(
+                self: t.Any, event: t.Optional[str] = None, **kw: t.Any
+            ) -> None:
+                return None
+
+            return dropped
+
+        def proxied(self: t.Any, event: t.Optional[str] = None, **kw: t.Any) -> t.Any:
+            return self._proxy_to_logger(name, event, **kw)
+
+        return proxied
+
+    methods = {name: make_method(name) for name in LEVELS}
+    return type("FilteringBoundLogger", (structlog.BoundLoggerBase,), methods)
+
+
+def configure(level: Level = "info", sample_rates: t.Dict[str, float] = {}) -> None:
+    processors: t.List[t.Any] = []
+    if sample_rates:
+        processors.append(Sampler(sample_rates))
+    processors += [
+        _evaluate_lazy,
+        structlog.processors.StackInfoRenderer(),
+        structlog.dev.set_exc_info,
+        structlog.processors.format_exc_info,
+        structlog.processors.UnicodeDecoder(),
+        structlog.processors.KeyValueRenderer(key_order=["event"]),
+    ]
+
+    structlog.configure(
+        processors=processors,
+        wrapper_class=_filtering_logger(level),
+    )
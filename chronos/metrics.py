@@ -0,0 +1,230 @@
+"""In-process metrics, exposed in the Prometheus text format
+
+Metrics are identified by name and a set of labels, and are either counters,
+which only go up, or histograms, which count observations into buckets."""
+
+import typing as t
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+
+import discord
+
+if t.TYPE_CHECKING:
+    from aiohttp import web
+
+Labels = t.Tuple[t.Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (100, 250, 500, 1000, 1500, 2000, 5000, 10000)
+
+
+def _labels(labels: t.Dict[str, t.Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: t.Optional[t.Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra is not None else [])
+    if not pairs:
+        return ""
+    escaped = (
+        (key, value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n"))
+        for key, value in pairs
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.values: t.Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: t.Any) -> None:
+        key = _labels(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> t.Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{_format_labels(labels)} {value}"
+
+
+class _Series:
+    def __init__(self, buckets: int) -> None:
+        self.counts = [0] * (buckets + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: t.Sequence[float]) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series: t.Dict[Labels, _Series] = {}
+
+    def observe(self, value: float, **labels: t.Any) -> None:
+        key = _labels(labels)
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = _Series(len(self.buckets))
+        series.counts[bisect.bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    def quantile(self, q: float, **labels: t.Any) -> t.Optional[float]:
+        "Estimate a quantile as the upper bound of the bucket it falls in"
+        series = self.series.get(_labels(labels))
+        if series is None or not series.count:
+            return None
+
+        rank = q * series.count
+        seen = 0
+        for bound, count in zip(self.buckets, series.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self) -> t.Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                le = _format_labels(labels, ("le", str(bound)))
+                yield f"{self.name}_bucket{le} {cumulative}"
+            le = _format_labels(labels, ("le", "+Inf"))
+            yield f"{self.name}_bucket{le} {series.count}"
+            yield f"{self.name}_sum{_format_labels(labels)} {series.sum}"
+            yield f"{self.name}_count{_format_labels(labels)} {series.count}"
+
+
+class Metrics:
+    "All of the bot's metrics"
+
+    def __init__(self) -> None:
+        self.command_latency = Histogram(
+            "chronos_command_latency_seconds",
+            "Time taken to handle a command",
+            LATENCY_BUCKETS,
+        )
+        self.command_errors = Counter(
+            "chronos_command_errors_total", "Commands which raised an exception"
+        )
+        self.identifier_latency = Histogram(
+            "chronos_identifier_latency_seconds",
+            "Time taken to resolve a member identifier",
+            LATENCY_BUCKETS,
+        )
+        self.storage_latency = Histogram(
+            "chronos_storage_latency_seconds",
+            "Time taken to load or save the storage",
+            LATENCY_BUCKETS,
+        )
+        self.storage_errors = Counter(
+            "chronos_storage_errors_total", "Storage loads or saves which failed"
+        )
+        self.storage_payload = Histogram(
+            "chronos_storage_payload_chars",
+            "Size of the storage messages written",
+            SIZE_BUCKETS,
+        )
+        self.api_requests = Counter(
+            "chronos_discord_api_requests_total", "Requests made to Discord's API"
+        )
+        self.api_errors = Counter(
+            "chronos_discord_api_errors_total",
+            "Requests to Discord's API which failed",
+        )
+        self.api_rate_limits = Counter(
+            "chronos_discord_api_rate_limits_total",
+            "Times Discord's API rate limited us and the request was retried",
+        )
+        self.outbox_queued = Counter(
+            "chronos_outbox_queued_total", "Messages queued to be sent"
+        )
+        self.outbox_sent = Counter(
+            "chronos_outbox_sent_total", "Messages sent from the queue"
+        )
+        self.outbox_merged = Counter(
+            "chronos_outbox_merged_total",
+            "Queued messages sent as part of an earlier one in the same channel",
+        )
+
+    def all(self) -> t.List[t.Union[Counter, Histogram]]:
+        return [
+            value
+            for value in vars(self).values()
+            if isinstance(value, (Counter, Histogram))
+        ]
+
+    def render(self) -> str:
+        "Render the metrics in the Prometheus text format"
+        return "\n".join(line for metric in self.all() for line in metric.render())
+
+    @contextmanager
+    def time(self, histogram: Histogram, **labels: t.Any) -> t.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start, **labels)
+
+    def instrument(self, client: discord.Client) -> None:
+        "Count the requests the client makes to Discord's API"
+
+        # The HTTP client isn't in discord.py's public API or its stubs
+        http = client.http  # type: ignore
+        request = http.request
+
+        async def counted_request(route: t.Any, **kwargs: t.Any) -> t.Any:
+            labels = {"method": route.method, "route": route.path}
+            self.api_requests.inc(**labels)
+            try:
+                return await request(route, **kwargs)
+            except discord.HTTPException as e:
+                self.api_errors.inc(status=e.status, **labels)
+                raise
+
+        http.request = counted_request
+
+        # discord.py retries rate limited requests itself, only logging them
+        logging.getLogger("discord.http").addHandler(_RateLimitHandler(self))
+
+
+class _RateLimitHandler(logging.Handler):
+    def __init__(self, metrics: Metrics) -> None:
+        super().__init__(logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if "rate limit" in record.getMessage():
+            self.metrics.api_rate_limits.inc()
+
+
+async def serve(metrics: Metrics, host: str, port: int) -> "web.AppRunner":
+    "Serve the metrics over HTTP at /metrics"
+
+    # aiohttp's server is only imported when metrics are served
+    from aiohttp import web
+
+    async def handle(_request: "web.Request") -> "web.Response":
+        return web.Response(
+            text=metrics.render() + "\n", content_type="text/plain", charset="utf-8"
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
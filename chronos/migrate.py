@@ -0,0 +1,66 @@
+"""Copy the storage kept in Discord into a SQLite database
+
+Run with the same environment as the bot, then switch it over with
+STORAGE_BACKEND=sqlite. The storage in Discord is left as it was, so it can
+still be switched back."""
+
+import argparse
+import sys
+
+import discord
+import structlog  # type: ignore
+
+from . import logs
+from .bot import Settings
+from .sqlstore import SQLiteStore
+from .storage import MessageStore
+
+
+async def migrate(client: discord.Client, settings: Settings, path: str) -> int:
+    "Copy every guild's storage into the database, returning how many there were"
+    assert settings.storage_channel is not None
+    source = MessageStore(client, settings.storage_channel, settings.storage_message)
+    storage = await source.load()
+
+    target = SQLiteStore(path)
+    try:
+        await target.save(storage, set(storage.guilds))
+    finally:
+        await target.close()
+    return len(storage.guilds)
+
+
+def main() -> None:
+    settings = Settings(storage_backend="discord")
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=settings.storage_path,
+        help=f"the database to write (default: {settings.storage_path})",
+    )
+    args = parser.parse_args()
+
+    logs.configure(settings.log_level, settings.log_sample_rates)
+    logger = structlog.get_logger().bind(path=args.path)
+    client = discord.Client(max_messages=None, fetch_offline_members=False)
+    failed = False
+
+    @client.event
+    async def on_ready() -> None:
+        nonlocal failed
+        try:
+            guilds = await migrate(client, settings, args.path)
+            logger.info("migrate.done", guilds=guilds)
+        except Exception as e:
+            logger.error("migrate.failed", error=e)
+            failed = True
+        finally:
+            await client.close()
+
+    client.run(settings.discord_token)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import typing as t
+import itertools
+
+import pydantic
+
+from . import zones
+
+# Versions are unique across all guilds' storage, so a copy or a reload never
+# reuses a version which was already seen
+_versions = itertools.count()
+
+
+class HallOfFameRequirements(pydantic.BaseModel):
+    reaction_emoji: str
+    reaction_count: int
+    hof_channel: int
+
+
+class HallOfFameBackfill(pydantic.BaseModel):
+    # IDs of the channels being scanned
+    channels: t.List[int]
+    # ID of the message every channel has been scanned up to, and whose
+    # qualifying messages have all been added to the hall of fame
+    after: int
+
+
+class Reminder(pydantic.BaseModel):
+    # UNIX timestamp of when the party should be reminded
+    due: int
+    channel: int
+    party: str
+    author: int
+    text: str = ""
+
+
+# per-guild storage
+class GuildStorage(pydantic.BaseModel):
+    # Kept out of the model's fields so it's never stored or compared
+    __slots__ = ("_party_index", "_version")
+
+    # party name -> member ID -> timezone key (see zones.py)
+    parties: t.Dict[str, t.Dict[int, str]] = {}
+    hall_of_fame: t.Optional[HallOfFameRequirements] = None
+    # IDs of the messages already added to the hall of fame by reactions or a
+    # backfill, which may be forgotten once they're past the reaction window
+    hall_of_fame_inducted: t.Set[int] = set()
+    # IDs of the messages added to the hall of fame with c!hof, never forgotten
+    hall_of_fame_manual: t.Set[int] = set()
+    # Progress of a scan of older messages for the hall of fame, if one is running
+    hall_of_fame_backfill: t.Optional[HallOfFameBackfill] = None
+    # member ID -> their weekly availability, as (start, length) in minutes
+    # since Monday 00:00 in their own timezone
+    availability: t.Dict[int, t.List[t.Tuple[int, int]]] = {}
+    # reminder ID -> reminder, for the reminders which haven't gone off yet
+    reminders: t.Dict[int, Reminder] = {}
+
+    # member ID -> name of the party they're in
+    _party_index: t.Dict[int, str]
+    _version: int
+
+    @pydantic.validator("parties", pre=True)
+    def _hours_to_zones(cls, parties: t.Any) -> t.Any:
+        # Parties used to hold each member's offset from UTC in whole hours
+        if not isinstance(parties, dict):
+            return parties
+        return {
+            partyname: {
+                member: zones.fixed_key(zone * 60) if isinstance(zone, int) else zone
+                for member, zone in party.items()
+            }
+            if isinstance(party, dict)
+            else party
+            for partyname, party in parties.items()
+        }
+
+    def reindex(self) -> t.Dict[int, str]:
+        "Rebuild the index of which party each member is in"
+        index = {
+            member: partyname
+            for partyname, party in self.parties.items()
+            for member in party
+        }
+        object.__setattr__(self, "_party_index", index)
+        return index
+
+    def _index(self) -> t.Dict[int, str]:
+        # Copies made by pydantic skip __init__, so build the index lazily
+        try:
+            return self._party_index
+        except AttributeError:
+            return self.reindex()
+
+    def version(self) -> int:
+        "Get a number which changes whenever the parties change"
+        try:
+            return self._version
+        except AttributeError:
+            return self._changed()
+
+    def _changed(self) -> int:
+        version = next(_versions)
+        object.__setattr__(self, "_version", version)
+        return version
+
+    def is_inducted(self, message_id: int) -> bool:
+        "Check whether a message is known to be in the hall of fame"
+        return (
+            message_id in self.hall_of_fame_inducted
+            or message_id in self.hall_of_fame_manual
+        )
+
+    def party_of(self, member: int) -> t.Optional[str]:
+        "Find the name of the party a member is in, if any"
+        return self._index().get(member)
+
+    def create_party(self, partyname: str) -> None:
+        self.parties[partyname] = {}
+        self._changed()
+
+    def delete_party(self, partyname: str) -> None:
+        index = self._index()
+        for member in self.parties.pop(partyname):
+            del index[member]
+        self._changed()
+
+    def add_member(self, partyname: str, member: int, zone: str) -> t.Optional[str]:
+        "Put a member in a party, returning the party they were in before if any"
+        index = self._index()
+        old_partyname = index.get(member)
+        if old_partyname is not None:
+            del self.parties[old_partyname][member]
+
+        self.parties[partyname][member] = zone
+        index[member] = partyname
+        self._changed()
+        return old_partyname
+
+
+class Storage(pydantic.BaseModel):
+    guilds: t.Dict[int, GuildStorage] = {}
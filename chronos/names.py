@@ -0,0 +1,103 @@
+import typing as t
+import bisect
+from collections import Counter
+
+# How many of the best pre-filtered candidates get scored by fuzzywuzzy
+MAX_CANDIDATES = 32
+
+
+def _normalize(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def _trigrams(name: str) -> t.Set[str]:
+    padded = f" {name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}  # noqa
+
+
+class NameIndex:
+    """An index of a guild's members by display name
+
+    Looking a name up only runs the (comparatively slow) fuzzy scorer over the
+    members whose names share a prefix or the most trigrams with it, instead
+    of over every member of the guild."""
+
+    def __init__(self, members: t.Iterable[t.Tuple[int, str]] = ()) -> None:
+        # member ID -> normalized display name
+        self._names: t.Dict[int, str] = {}
+        # trigram -> IDs of the members whose name contains it
+        self._trigrams: t.Dict[str, t.Set[int]] = {}
+        # (normalized display name, member ID), sorted for prefix searches
+        self._sorted: t.List[t.Tuple[str, int]] = []
+
+        for member_id, name in members:
+            self.add(member_id, name)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, member_id: int, name: str) -> None:
+        "Add a member to the index, or update their name if already in it"
+        self.remove(member_id)
+
+        name = _normalize(name)
+        self._names[member_id] = name
+        for trigram in _trigrams(name):
+            self._trigrams.setdefault(trigram, set()).add(member_id)
+        bisect.insort(self._sorted, (name, member_id))
+
+    def remove(self, member_id: int) -> None:
+        name = self._names.pop(member_id, None)
+        if name is None:
+            return
+
+        for trigram in _trigrams(name):
+            ids = self._trigrams[trigram]
+            ids.discard(member_id)
+            if not ids:
+                del self._trigrams[trigram]
+
+        i = bisect.bisect_left(self._sorted, (name, member_id))
+        del self._sorted[i]
+
+    def _candidates(self, query: str) -> t.Dict[int, str]:
+        candidates: t.Dict[int, str] = {}
+
+        # Members whose name starts with the query are always candidates
+        i = bisect.bisect_left(self._sorted, (query, -1))
+        while (
+            i < len(self._sorted)
+            and self._sorted[i][0].startswith(query)
+            and len(candidates) < MAX_CANDIDATES
+        ):
+            name, member_id = self._sorted[i]
+            candidates[member_id] = name
+            i += 1
+
+        # Then the members sharing the most trigrams with it
+        shared: t.Counter[int] = Counter()
+        for trigram in _trigrams(query):
+            shared.update(self._trigrams.get(trigram, ()))
+        for member_id, _count in shared.most_common(MAX_CANDIDATES):
+            candidates.setdefault(member_id, self._names[member_id])
+
+        return candidates
+
+    def find(self, query: str) -> t.Optional[t.Tuple[int, int]]:
+        "Find the member best matching a name, returning their ID and the score"
+        query = _normalize(query)
+        candidates = self._candidates(query)
+        if not candidates:
+            return None
+
+        # fuzzywuzzy is only imported once a name is first looked up, to keep
+        # it off the startup path
+        from fuzzywuzzy.process import extractOne as fuzzy_find  # type: ignore
+
+        # This is None if the query has nothing fuzzywuzzy can match on
+        match = fuzzy_find(query, candidates)
+        if match is None:
+            return None
+
+        _name, score, member_id = match
+        return t.cast(int, member_id), t.cast(int, score)
@@ -0,0 +1,227 @@
+"""Queued, rate limited sending of the bot's messages
+
+Each channel's messages are sent in order, at most CHANNEL_RATE per
+CHANNEL_PERIOD seconds, which is Discord's limit on messages per channel, and
+no more than GLOBAL_RATE messages go out per second across all channels. A
+message waiting on these limits doesn't hold up the command that queued it.
+While a channel's messages wait, consecutive plain text ones are merged into
+as few messages as fit, and when channels compete for the global limit,
+replies to commands go before lower priority messages like hall of fame posts.
+"""
+
+import typing as t
+import asyncio
+import itertools
+import time
+from collections import deque
+
+import discord
+import structlog  # type: ignore
+
+from .metrics import Metrics
+from .storage import MESSAGE_LIMIT
+
+CHANNEL_RATE = 5
+CHANNEL_PERIOD = 5.0
+GLOBAL_RATE = 50
+
+# How many times a message is retried after Discord rate limits it anyway
+MAX_RETRIES = 3
+
+# Priorities, lowest first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class _Item:
+    __slots__ = ("content", "embed", "file", "priority", "seq", "futures", "tries")
+
+    def __init__(
+        self,
+        content: t.Optional[str],
+        embed: t.Optional[discord.Embed],
+        file: t.Optional[discord.File],
+        priority: int,
+        seq: int,
+        future: "asyncio.Future[discord.Message]",
+    ) -> None:
+        self.content = content
+        self.embed = embed
+        self.file = file
+        self.priority = priority
+        self.seq = seq
+        self.futures = [future]
+        self.tries = 0
+
+    def merge(self, other: "_Item") -> bool:
+        "Append another plain text message to this one, if they fit in one"
+        if any(x is not None for x in (self.embed, self.file, other.embed, other.file)):
+            return False
+        if self.content is None or other.content is None:
+            return False
+        if len(self.content) + 1 + len(other.content) > MESSAGE_LIMIT:
+            return False
+        self.content = f"{self.content}\n{other.content}"
+        self.futures.extend(other.futures)
+        return True
+
+
+class _Channel:
+    def __init__(self, channel: discord.abc.Messageable) -> None:
+        self.channel = channel
+        # A queue of waiting messages for each priority
+        self.queues: t.List[t.Deque[_Item]] = [deque(), deque()]
+        # When the last few messages were sent
+        self.sent: t.Deque[float] = deque(maxlen=CHANNEL_RATE)
+        self.busy = False
+        self.blocked_until = 0.0
+
+    def waiting(self) -> bool:
+        return any(self.queues)
+
+    def ready_at(self) -> float:
+        "When the channel's limit next allows a message"
+        ready = self.blocked_until
+        if len(self.sent) == CHANNEL_RATE:
+            ready = max(ready, self.sent[0] + CHANNEL_PERIOD)
+        return ready
+
+    def head(self) -> t.Tuple[int, int]:
+        "The priority and order of the next message to send"
+        priority, queue = next((p, q) for p, q in enumerate(self.queues) if q)
+        return (priority, queue[0].seq)
+
+    def add(self, item: _Item) -> None:
+        queue = self.queues[item.priority]
+        # Only merge into messages still waiting, so the order is kept
+        if not (queue and queue[-1].merge(item)):
+            queue.append(item)
+
+    def take(self) -> _Item:
+        "Take the next message to send"
+        return next(queue for queue in self.queues if queue).popleft()
+
+
+class Outbox:
+    "Sends messages on behalf of the bot, within Discord's rate limits"
+
+    def __init__(self, metrics: t.Optional[Metrics] = None) -> None:
+        self.metrics = metrics or Metrics()
+        self._channels: t.Dict[int, _Channel] = {}
+        # When the messages sent in the last second were sent
+        self._sent: t.Deque[float] = deque()
+        self._seq = itertools.count()
+        self._wakeup: t.Optional[asyncio.TimerHandle] = None
+        self._pending: t.Set["asyncio.Future[discord.Message]"] = set()
+
+    def send(
+        self,
+        channel: discord.abc.Messageable,
+        content: t.Optional[str] = None,
+        *,
+        embed: t.Optional[discord.Embed] = None,
+        file: t.Optional[discord.File] = None,
+        priority: int = INTERACTIVE,
+    ) -> "asyncio.Future[discord.Message]":
+        """Queue a message, returning a future of the message once it's sent
+
+        Failures are logged, so the future needn't be awaited."""
+        future: "asyncio.Future[discord.Message]"
+        future = asyncio.get_event_loop().create_future()
+        future.add_done_callback(self._done)
+        self._pending.add(future)
+
+        key = channel.id  # type: ignore
+        state = self._channels.get(key)
+        if state is None:
+            state = self._channels[key] = _Channel(channel)
+        state.add(_Item(content, embed, file, priority, next(self._seq), future))
+        self.metrics.outbox_queued.inc(priority=priority)
+
+        self._pump()
+        return future
+
+    async def drain(self) -> None:
+        "Wait for every queued message to be sent or fail"
+        while self._pending:
+            await asyncio.wait(list(self._pending))
+
+    def _done(self, future: "asyncio.Future[discord.Message]") -> None:
+        self._pending.discard(future)
+        # Mark the exception as retrieved, since it was already logged
+        if not future.cancelled():
+            future.exception()
+
+    def _pump(self) -> None:
+        "Start sending the messages which the rate limits allow"
+        now = time.monotonic()
+        while self._sent and self._sent[0] <= now - 1.0:
+            self._sent.popleft()
+
+        ready = []
+        next_at = None
+        for key, state in list(self._channels.items()):
+            if state.busy:
+                continue
+            if not state.waiting():
+                if state.ready_at() <= now:
+                    # Forget idle channels once their limit has reset
+                    del self._channels[key]
+                continue
+            ready_at = state.ready_at()
+            if ready_at <= now:
+                ready.append(state)
+            elif next_at is None or ready_at < next_at:
+                next_at = ready_at
+
+        ready.sort(key=_Channel.head)
+        for state in ready:
+            if len(self._sent) >= GLOBAL_RATE:
+                next_at = self._sent[0] + 1.0
+                break
+            self._sent.append(now)
+            state.sent.append(now)
+            state.busy = True
+            asyncio.ensure_future(self._deliver(state, state.take()))
+
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        if next_at is not None:
+            self._wakeup = asyncio.get_event_loop().call_later(
+                next_at - now, self._pump
+            )
+
+    async def _deliver(self, state: _Channel, item: _Item) -> None:
+        logger = structlog.get_logger().bind(channel=state.channel.id)  # type: ignore
+
+        try:
+            message = await state.channel.send(
+                item.content, embed=item.embed, file=item.file
+            )
+        except discord.HTTPException as e:
+            if e.status == 429 and item.tries < MAX_RETRIES:
+                # discord.py already gave up retrying, so back off a whole period
+                logger.warning("outbox.rate_limited", tries=item.tries)
+                item.tries += 1
+                state.blocked_until = time.monotonic() + CHANNEL_PERIOD
+                state.queues[item.priority].appendleft(item)
+            else:
+                self._fail(logger, item, e)
+        except Exception as e:
+            self._fail(logger, item, e)
+        else:
+            self.metrics.outbox_sent.inc()
+            self.metrics.outbox_merged.inc(len(item.futures) - 1)
+            for future in item.futures:
+                if not future.done():
+                    future.set_result(message)
+        finally:
+            state.busy = False
+            self._pump()
+
+    def _fail(self, logger: t.Any, item: _Item, error: Exception) -> None:
+        logger.error("outbox.send_failed", error=error, messages=len(item.futures))
+        for future in item.futures:
+            if not future.done():
+                future.set_exception(error)
@@ -0,0 +1,284 @@
+"""Finding the times when a party's members are all free
+
+Each member's availability is a set of recurring weekly windows in their own
+timezone. Over the horizon being searched, it becomes a bitmap with a bit for
+each minute, kept in one Python integer so that shifting, intersecting and
+counting whole timelines each take a handful of big integer operations rather
+than a loop over every minute."""
+
+import typing as t
+import functools
+import re
+from datetime import datetime, timedelta, timezone
+
+from . import zones
+
+WEEK = 7 * 24 * 60
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+DAY_RANGES = {"daily": (0, 6), "weekdays": (0, 4), "weekends": (5, 6)}
+
+# (start, length) in minutes since Monday 00:00, in the member's timezone
+Window = t.Tuple[int, int]
+
+# Assumed for members who haven't set their availability
+DEFAULT_WINDOWS: t.List[Window] = [
+    (day * 24 * 60 + 9 * 60, 14 * 60) for day in range(7)
+]
+
+_TIME = r"(\d{1,2})(?::(\d{2}))?"
+_WINDOW_RE = re.compile(
+    rf"([a-z]+)(?:-([a-z]+))?\s+{_TIME}\s*-\s*{_TIME}", re.IGNORECASE
+)
+_DURATION_RE = re.compile(r"(?:(\d+)h)?\s*(?:(\d+)m)?", re.IGNORECASE)
+
+
+class Overlap(t.NamedTuple):
+    start: datetime
+    minutes: int
+    # Members of the party who aren't free for the whole window
+    missing: t.List[int]
+
+
+def _day(name: str) -> int:
+    try:
+        return DAYS.index(name.lower()[:3])
+    except ValueError:
+        raise ValueError(f"Unknown day {name!r}") from None
+
+
+def _minutes(hours: str, minutes: t.Optional[str]) -> int:
+    value = int(hours) * 60 + int(minutes or 0)
+    if int(minutes or 0) >= 60 or value > 24 * 60:
+        raise ValueError(f"Invalid time {hours}:{minutes or '00'}")
+    return value
+
+
+def parse_windows(text: str) -> t.List[Window]:
+    """Parse comma-separated weekly windows, like "mon-fri 18:00-23:00, sat 10-14"
+
+    A window ending before it starts goes on past midnight."""
+    windows = []
+    for part in text.split(","):
+        match = _WINDOW_RE.fullmatch(part.strip())
+        if match is None:
+            raise ValueError(f"Invalid availability window {part.strip()!r}")
+        first, last, start_h, start_m, end_h, end_m = match.groups()
+
+        if first.lower() in DAY_RANGES and last is None:
+            first_day, last_day = DAY_RANGES[first.lower()]
+        else:
+            first_day = _day(first)
+            last_day = _day(last) if last is not None else first_day
+
+        start = _minutes(start_h, start_m)
+        length = (_minutes(end_h, end_m) - start) % (24 * 60) or 24 * 60
+        day = first_day
+        while True:
+            windows.append((day * 24 * 60 + start, length))
+            if day == last_day:
+                break
+            day = (day + 1) % 7
+    return windows
+
+
+def format_windows(windows: t.Iterable[Window]) -> str:
+    def time(minute: int) -> str:
+        return f"{minute // 60 % 24:02}:{minute % 60:02}"
+
+    return ", ".join(
+        f"{DAYS[start // (24 * 60)]} {time(start)}-{time(start + length)}"
+        for start, length in sorted(windows)
+    )
+
+
+def format_duration(minutes: int) -> str:
+    hours, minutes = divmod(minutes, 60)
+    if not hours:
+        return f"{minutes}m"
+    return f"{hours}h{minutes:02}m" if minutes else f"{hours}h"
+
+
+def parse_duration(text: str) -> int:
+    "Parse a duration like 90m, 2h or 1h30m, or a number of hours, into minutes"
+    if text.isdigit():
+        minutes = int(text) * 60
+    else:
+        match = _DURATION_RE.fullmatch(text.strip())
+        if match is None or not any(match.groups()):
+            raise ValueError(f"Invalid duration {text!r}")
+        hours, mins = match.groups()
+        minutes = int(hours or 0) * 60 + int(mins or 0)
+    if minutes <= 0:
+        raise ValueError(f"Invalid duration {text!r}")
+    return minutes
+
+
+@functools.lru_cache(maxsize=1024)
+def _weekly(windows: t.Tuple[Window, ...]) -> int:
+    "A bitmap of a week, with the minutes in the windows set"
+    bitmap = 0
+    for start, length in windows:
+        bits = ((1 << length) - 1) << start
+        # Windows running past the end of the week wrap around to its start
+        bitmap |= (bits | bits >> WEEK) & ((1 << WEEK) - 1)
+    return bitmap
+
+
+@functools.lru_cache(maxsize=64)
+def _repeat(weeks: int) -> int:
+    "The number which repeats a week's bitmap when multiplied by it"
+    return sum(1 << (WEEK * week) for week in range(weeks))
+
+
+def _segments(
+    zone: str, start: datetime, minutes: int
+) -> t.List[t.Tuple[int, int, int]]:
+    "Split the horizon into (start, end, offset) spans over which the offset holds"
+
+    def offset_at(minute: int) -> int:
+        when = start + timedelta(minutes=minute)
+        return int(zones.utcoffset(zone, when).total_seconds()) // 60
+
+    segments = []
+    pos = 0
+    while pos < minutes:
+        offset = offset_at(pos)
+        end = minutes
+        if offset_at(end - 1) != offset:
+            # Find where it changes: offset_at(pos) is offset, offset_at(hi) isn't
+            lo, hi = pos, end - 1
+            while hi - lo > 1:
+                mid = (lo + hi) // 2
+                if offset_at(mid) == offset:
+                    lo = mid
+                else:
+                    hi = mid
+            end = hi
+        segments.append((pos, end, offset))
+        pos = end
+    return segments
+
+
+def timeline(
+    windows: t.Iterable[Window], zone: str, start: datetime, minutes: int
+) -> int:
+    "A bitmap with a bit for each minute from the start, set if the member is free"
+    weekly = _weekly(tuple(sorted(windows)))
+    utc_start = start.astimezone(timezone.utc)
+    # Minutes since the start of the week, in UTC
+    week_minute = utc_start.weekday() * 24 * 60 + utc_start.hour * 60 + utc_start.minute
+
+    bitmap = 0
+    for seg_start, seg_end, offset in _segments(zone, start, minutes):
+        length = seg_end - seg_start
+        local = (week_minute + seg_start + offset) % WEEK
+        repeated = weekly * _repeat(-(-(local + length) // WEEK))
+        bitmap |= ((repeated >> local) & ((1 << length) - 1)) << seg_start
+    return bitmap
+
+
+def _count(bitmaps: t.Iterable[int]) -> t.List[int]:
+    """Add up bitmaps minute by minute, into a number kept as bitmaps of its bits
+
+    This is a ripple-carry adder working on every minute at once."""
+    counters: t.List[int] = []
+    for carry in bitmaps:
+        i = 0
+        while carry:
+            if i == len(counters):
+                counters.append(carry)
+                break
+            counters[i], carry = counters[i] ^ carry, counters[i] & carry
+            i += 1
+    return counters
+
+
+def _at_least(counters: t.List[int], needed: int, full: int) -> int:
+    "The minutes whose count is at least the needed number"
+    if needed >= 1 << len(counters):
+        return 0
+    greater = 0
+    equal = full
+    for bit in reversed(range(len(counters))):
+        if needed >> bit & 1:
+            equal &= counters[bit]
+        else:
+            greater |= equal & counters[bit]
+            equal &= ~counters[bit]
+    return greater | equal
+
+
+def _lasting(bitmap: int, duration: int) -> int:
+    "The minutes starting a run of at least the duration in the bitmap"
+    covered = 1
+    while covered < duration:
+        step = min(covered, duration - covered)
+        bitmap &= bitmap >> step
+        covered += step
+    return bitmap
+
+
+def _runs(bitmap: int) -> t.Iterator[t.Tuple[int, int]]:
+    "The (start, length) of each run of set bits"
+    while bitmap:
+        start = (bitmap & -bitmap).bit_length() - 1
+        shifted = bitmap >> start
+        length = (~shifted & (shifted + 1)).bit_length() - 1
+        yield start, length
+        bitmap = (shifted >> length) << (start + length)
+
+
+def find(
+    party: t.Dict[int, str],
+    availability: t.Dict[int, t.List[Window]],
+    start: datetime,
+    minutes: int,
+    duration: int,
+    limit: int = 5,
+) -> t.List[Overlap]:
+    """Find the best windows of at least the duration in the horizon
+
+    These are the longest windows when everyone is free, or failing that when
+    as many members as possible are free."""
+    start = start.replace(second=0, microsecond=0)
+    bitmaps = {
+        member: timeline(
+            availability.get(member, DEFAULT_WINDOWS), zone, start, minutes
+        )
+        for member, zone in party.items()
+    }
+    full = (1 << minutes) - 1
+
+    common = full
+    for bitmap in bitmaps.values():
+        common &= bitmap
+    starts = _lasting(common, duration)
+
+    if not starts and len(bitmaps) > 1:
+        # Nobody's free together, so find the most members who are
+        counters = _count(bitmaps.values())
+        lo, hi = 0, len(bitmaps)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if _lasting(_at_least(counters, mid, full), duration):
+                lo = mid
+            else:
+                hi = mid
+        if lo == 0:
+            return []
+        common = _at_least(counters, lo, full)
+        starts = _lasting(common, duration)
+
+    found = []
+    for run_start, run_length in _runs(starts):
+        length = run_length + duration - 1
+        window = ((1 << length) - 1) << run_start
+        missing = [
+            member for member, bitmap in bitmaps.items() if bitmap & window != window
+        ]
+        found.append(Overlap(start + timedelta(minutes=run_start), length, missing))
+
+    found.sort(
+        key=lambda overlap: (len(overlap.missing), -overlap.minutes, overlap.start)
+    )
+    return found[:limit]
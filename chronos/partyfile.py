@@ -0,0 +1,93 @@
+"""Reading and writing parties as CSV or JSON files
+
+A party file lists a member identifier (an ID or a display name) and a
+timezone (see zones.py) for each member. CSV files have one member per row,
+optionally under a header row, and JSON files hold either a list of
+{"member": ..., "timezone": ...} objects or an object mapping members to
+timezones."""
+
+import typing as t
+import csv
+import io
+import json
+
+# The most members a single file may list
+MAX_ROWS = 1000
+
+# (row number, member identifier, timezone)
+Row = t.Tuple[int, str, str]
+
+
+def _read_csv(text: str) -> t.List[Row]:
+    rows = []
+    for line, fields in enumerate(csv.reader(io.StringIO(text)), start=1):
+        fields = [field.strip() for field in fields]
+        if not any(fields):
+            continue
+        if line == 1 and fields[0].lower() in ("member", "id", "name"):
+            continue
+        if len(fields) < 2:
+            raise ValueError(f"Row {line} needs a member and a timezone")
+        rows.append((line, fields[0], fields[1]))
+    return rows
+
+
+def _read_json(text: str) -> t.List[Row]:
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}") from None
+
+    if isinstance(data, dict):
+        return [
+            (i, str(member), str(zone))
+            for i, (member, zone) in enumerate(data.items(), start=1)
+        ]
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of members or an object")
+
+    rows = []
+    for i, item in enumerate(data, start=1):
+        if isinstance(item, dict) and "member" in item and "timezone" in item:
+            rows.append((i, str(item["member"]), str(item["timezone"])))
+        elif isinstance(item, list) and len(item) == 2:
+            rows.append((i, str(item[0]), str(item[1])))
+        else:
+            raise ValueError(f"Entry {i} needs a member and a timezone")
+    return rows
+
+
+def read(filename: str, data: bytes) -> t.List[Row]:
+    "Read a party file, raising ValueError if it's invalid"
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("The file isn't valid UTF-8") from None
+
+    if filename.lower().endswith(".json"):
+        rows = _read_json(text)
+    else:
+        rows = _read_csv(text)
+
+    if len(rows) > MAX_ROWS:
+        raise ValueError(f"A party file can list at most {MAX_ROWS} members")
+    return rows
+
+
+def write(members: t.Iterable[t.Tuple[int, str, str]], format: str = "csv") -> bytes:
+    "Write (member ID, timezone, name) rows as a party file"
+    if format == "json":
+        return json.dumps(
+            [
+                {"member": str(member), "timezone": zone, "name": name}
+                for member, zone, name in members
+            ],
+            indent=2,
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["member", "timezone", "name"])
+    writer.writerows(members)
+    return out.getvalue().encode("utf-8")
@@ -0,0 +1,84 @@
+import typing as t
+import asyncio
+import heapq
+import time
+
+import structlog  # type: ignore
+
+K = t.TypeVar("K")
+
+# The longest the scheduler sleeps before checking the clock again, so it
+# doesn't oversleep if the system clock jumps
+MAX_SLEEP = 3600.0
+
+
+class Scheduler(t.Generic[K]):
+    """Hands keys to a callback once they're due, from a single task
+
+    Pending keys are kept in a heap ordered by their due time, and one task
+    sleeps until the earliest of them is due, so any number of pending keys
+    costs one sleeping task. Keys which are due at once, like everything that
+    came due while the bot was down, are passed to the callback together."""
+
+    def __init__(
+        self, callback: t.Callable[[t.List[t.Tuple[float, K]]], t.Awaitable[None]]
+    ) -> None:
+        self.callback = callback
+        self._heap: t.List[t.Tuple[float, K]] = []
+        self._changed = asyncio.Event()
+        self._task: t.Optional["asyncio.Task[None]"] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, due: float, key: K) -> None:
+        "Schedule a key for a UNIX timestamp"
+        heapq.heappush(self._heap, (due, key))
+        if self._heap[0][0] >= due:
+            # The new key is the next one due, so the task must wake earlier
+            self._changed.set()
+
+    def extend(self, entries: t.Iterable[t.Tuple[float, K]]) -> None:
+        "Schedule many keys at once"
+        self._heap.extend(entries)
+        heapq.heapify(self._heap)
+        self._changed.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _pop_due(self, now: float) -> t.List[t.Tuple[float, K]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap))
+        return due
+
+    async def _run(self) -> None:
+        logger = structlog.get_logger().bind()
+
+        while True:
+            self._changed.clear()
+            now = time.time()
+            due = self._pop_due(now)
+            if due:
+                try:
+                    await self.callback(due)
+                except Exception as e:
+                    logger.error("scheduler.callback_failed", error=e, keys=len(due))
+                continue
+
+            timeout = min(self._heap[0][0] - now, MAX_SLEEP) if self._heap else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
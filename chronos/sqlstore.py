@@ -0,0 +1,357 @@
+"""Keeping the bot's storage in a local SQLite database
+
+Each part of a guild's storage is kept as rows of its own table, and the store
+remembers the rows it last wrote for each guild, so saving a changed guild
+only inserts, replaces or deletes the rows which differ."""
+
+import typing as t
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import structlog  # type: ignore
+
+from .models import (
+    GuildStorage,
+    HallOfFameBackfill,
+    HallOfFameRequirements,
+    Reminder,
+    Storage,
+)
+from .storage import ShardCountChanged, Store
+
+# Version 2 added the hof_backfill tables, version 3 the sharding table and
+# version 4 the hof_manual table. The schema only creates missing tables, so
+# opening an older database upgrades it
+SCHEMA_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS guilds (
+    guild_id INTEGER PRIMARY KEY,
+    hof_emoji TEXT,
+    hof_count INTEGER,
+    hof_channel INTEGER
+);
+CREATE TABLE IF NOT EXISTS parties (
+    guild_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (guild_id, name)
+);
+CREATE TABLE IF NOT EXISTS party_members (
+    guild_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    party TEXT NOT NULL,
+    zone TEXT NOT NULL,
+    PRIMARY KEY (guild_id, member_id)
+);
+CREATE INDEX IF NOT EXISTS party_members_by_party
+    ON party_members (guild_id, party);
+CREATE TABLE IF NOT EXISTS hof_inducted (
+    guild_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, message_id)
+);
+CREATE TABLE IF NOT EXISTS hof_manual (
+    guild_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, message_id)
+);
+CREATE TABLE IF NOT EXISTS hof_backfill (
+    guild_id INTEGER PRIMARY KEY,
+    after INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hof_backfill_channels (
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, channel_id)
+);
+CREATE TABLE IF NOT EXISTS availability (
+    guild_id INTEGER NOT NULL,
+    member_id INTEGER NOT NULL,
+    start INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (guild_id, member_id, start, length)
+);
+CREATE TABLE IF NOT EXISTS reminders (
+    guild_id INTEGER NOT NULL,
+    reminder_id INTEGER NOT NULL,
+    due INTEGER NOT NULL,
+    channel INTEGER NOT NULL,
+    party TEXT NOT NULL,
+    author INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (guild_id, reminder_id)
+);
+CREATE TABLE IF NOT EXISTS sharding (
+    shard_count INTEGER NOT NULL
+);
+"""
+
+# table -> (its columns, how many of the first columns make up its key)
+TABLES: t.Dict[str, t.Tuple[t.Tuple[str, ...], int]] = {
+    "guilds": (("guild_id", "hof_emoji", "hof_count", "hof_channel"), 1),
+    "parties": (("guild_id", "name"), 2),
+    "party_members": (("guild_id", "member_id", "party", "zone"), 2),
+    "hof_inducted": (("guild_id", "message_id"), 2),
+    "hof_manual": (("guild_id", "message_id"), 2),
+    "hof_backfill": (("guild_id", "after"), 1),
+    "hof_backfill_channels": (("guild_id", "channel_id"), 2),
+    "availability": (("guild_id", "member_id", "start", "length"), 4),
+    "reminders": (
+        ("guild_id", "reminder_id", "due", "channel", "party", "author", "text"),
+        2,
+    ),
+}
+
+Row = t.Tuple[t.Any, ...]
+# table -> key -> row
+Rows = t.Dict[str, t.Dict[Row, Row]]
+
+
+def _rows(guild_id: int, guild: GuildStorage) -> Rows:
+    "Turn a guild's storage into the rows of each table"
+    hof = guild.hall_of_fame
+    backfill = guild.hall_of_fame_backfill
+    backfill_channels = backfill.channels if backfill is not None else []
+    rows: t.Dict[str, t.List[Row]] = {
+        "guilds": [
+            (guild_id, hof.reaction_emoji, hof.reaction_count, hof.hof_channel)
+            if hof is not None
+            else (guild_id, None, None, None)
+        ],
+        "parties": [(guild_id, name) for name in guild.parties],
+        "party_members": [
+            (guild_id, member, name, zone)
+            for name, party in guild.parties.items()
+            for member, zone in party.items()
+        ],
+        "hof_inducted": [
+            (guild_id, message) for message in guild.hall_of_fame_inducted
+        ],
+        "hof_manual": [(guild_id, message) for message in guild.hall_of_fame_manual],
+        "hof_backfill": [(guild_id, backfill.after)] if backfill is not None else [],
+        "hof_backfill_channels": [(guild_id, channel) for channel in backfill_channels],
+        "availability": [
+            (guild_id, member, start, length)
+            for member, windows in guild.availability.items()
+            for start, length in windows
+        ],
+        "reminders": [
+            (guild_id, id_, r.due, r.channel, r.party, r.author, r.text)
+            for id_, r in guild.reminders.items()
+        ],
+    }
+    return {
+        table: {row[: TABLES[table][1]]: row for row in table_rows}
+        for table, table_rows in rows.items()
+    }
+
+
+def partition_path(path: str, partition: int) -> str:
+    "Find where a partition of the database at the given path is kept"
+    root, dot, ext = path.rpartition(".")
+    return f"{root}-{partition}.{ext}" if dot else f"{path}-{partition}"
+
+
+def _stored_shard_count(conn: sqlite3.Connection) -> t.Optional[int]:
+    "Read the shard count a partition's database was written for, if any"
+    try:
+        row = conn.execute("SELECT shard_count FROM sharding").fetchone()
+    except sqlite3.OperationalError:
+        # The database is older than the sharding table
+        return None
+    return None if row is None else int(row[0])
+
+
+def _load(conn: sqlite3.Connection) -> t.Tuple[Storage, t.Dict[int, Rows]]:
+    "Read every guild's storage, along with the rows it was read from"
+    rows: t.Dict[int, Rows] = {}
+    for table, (columns, key_length) in TABLES.items():
+        for row in conn.execute(f"SELECT {', '.join(columns)} FROM {table}"):
+            guild_rows = rows.setdefault(row[0], {table: {} for table in TABLES})
+            guild_rows[table][row[:key_length]] = row
+
+    storage = Storage()
+    for guild_id, guild_rows in rows.items():
+        # The rows were written from valid storage, so they aren't validated
+        fields: t.Dict[str, t.Any] = {
+            "parties": {name: {} for _guild, name in guild_rows["parties"]},
+            "hall_of_fame": None,
+            "hall_of_fame_inducted": {
+                message for _guild, message in guild_rows["hof_inducted"]
+            },
+            "hall_of_fame_manual": {
+                message for _guild, message in guild_rows["hof_manual"]
+            },
+            "hall_of_fame_backfill": None,
+            "availability": {},
+            "reminders": {},
+        }
+        for _guild, emoji, count, channel in guild_rows["guilds"].values():
+            if emoji is not None:
+                fields["hall_of_fame"] = HallOfFameRequirements.construct(
+                    reaction_emoji=emoji, reaction_count=count, hof_channel=channel
+                )
+        for _guild, after in guild_rows["hof_backfill"].values():
+            fields["hall_of_fame_backfill"] = HallOfFameBackfill.construct(
+                channels=sorted(
+                    channel for _guild, channel in guild_rows["hof_backfill_channels"]
+                ),
+                after=after,
+            )
+        for _guild, member, name, zone in guild_rows["party_members"].values():
+            fields["parties"].setdefault(name, {})[member] = zone
+        for _guild, member, start, length in sorted(
+            guild_rows["availability"].values()
+        ):
+            fields["availability"].setdefault(member, []).append((start, length))
+        for row in guild_rows["reminders"].values():
+            _guild, id_, due, channel, party, author, text = row
+            fields["reminders"][id_] = Reminder.construct(
+                due=due, channel=channel, party=party, author=author, text=text
+            )
+        storage.guilds[guild_id] = GuildStorage.construct(**fields)
+    return storage, rows
+
+
+class SQLiteStore(Store):
+    """Keeps the bot's storage in a SQLite database on disk
+
+    The database is only touched from one worker thread, so its writes never
+    block the event loop.
+
+    The database of a partition records the shard count it was written for.
+    One which doesn't yet checks the other partitions' databases, its
+    siblings, so it doesn't start out empty after the shard count changed."""
+
+    def __init__(
+        self,
+        path: str,
+        shard_count: t.Optional[int] = None,
+        siblings: t.Sequence[str] = (),
+    ) -> None:
+        self.path = path
+        self.shard_count = shard_count
+        self.siblings = siblings
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._conn: t.Optional[sqlite3.Connection] = None
+
+        # guild ID -> the rows last written for it
+        self._rows: t.Dict[int, Rows] = {}
+
+    async def _run(self, func: t.Callable[[sqlite3.Connection], t.Any]) -> t.Any:
+        def run() -> t.Any:
+            if self._conn is None:
+                self._conn = self._connect()
+            return func(self._conn)
+
+        return await asyncio.get_event_loop().run_in_executor(self._executor, run)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        # Readers don't block the writer, and commits only sync the log, which
+        # can lose the latest commits on power loss but never corrupts
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"{self.path} has schema version {version}, newer than this bot's"
+            )
+        with conn:
+            conn.executescript(SCHEMA)
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        if self.shard_count is not None:
+            try:
+                self._check_shard_count(conn)
+            except ShardCountChanged:
+                conn.close()
+                raise
+        return conn
+
+    def _check_shard_count(self, conn: sqlite3.Connection) -> None:
+        assert self.shard_count is not None
+        stored = _stored_shard_count(conn)
+        if stored is None:
+            for sibling in self.siblings:
+                if not os.path.exists(sibling):
+                    continue
+                sibling_conn = sqlite3.connect(sibling)
+                try:
+                    stored = _stored_shard_count(sibling_conn)
+                finally:
+                    sibling_conn.close()
+                if stored is not None and stored != self.shard_count:
+                    raise ShardCountChanged(stored, self.shard_count)
+            with conn:
+                conn.execute("INSERT INTO sharding VALUES (?)", (self.shard_count,))
+        elif stored != self.shard_count:
+            raise ShardCountChanged(stored, self.shard_count)
+
+    async def load(self) -> Storage:
+        logger = structlog.get_logger().bind(path=self.path)
+
+        storage: Storage
+        storage, self._rows = await self._run(_load)
+        logger.info("load.storage", guilds=len(storage.guilds))
+        return storage
+
+    async def save(self, storage: Storage, dirty: t.Set[int]) -> None:
+        "Write the rows of the given guilds which changed since the last save"
+
+        logger = structlog.get_logger().bind(path=self.path)
+
+        empty: Rows = {table: {} for table in TABLES}
+        changes = []
+        rows = {}
+        for guild_id in dirty:
+            guild = storage.guilds.get(guild_id)
+            old = self._rows.get(guild_id, empty)
+            new = _rows(guild_id, guild) if guild is not None else empty
+            rows[guild_id] = new
+            for table in TABLES:
+                deleted = [key for key in old[table] if key not in new[table]]
+                written = [
+                    row for key, row in new[table].items() if old[table].get(key) != row
+                ]
+                if deleted or written:
+                    changes.append((table, deleted, written))
+
+        if not changes:
+            return
+
+        def write(conn: sqlite3.Connection) -> None:
+            with conn:
+                for table, deleted, written in changes:
+                    columns, key_length = TABLES[table]
+                    where = " AND ".join(f"{c} = ?" for c in columns[:key_length])
+                    conn.executemany(f"DELETE FROM {table} WHERE {where}", deleted)
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO {table} "
+                        f"VALUES ({', '.join('?' * len(columns))})",
+                        written,
+                    )
+
+        await self._run(write)
+        for guild_id, guild_rows in rows.items():
+            if guild_id in storage.guilds:
+                self._rows[guild_id] = guild_rows
+            else:
+                self._rows.pop(guild_id, None)
+
+        logger.debug(
+            "store.saved",
+            guilds=len(dirty),
+            rows=sum(len(deleted) + len(written) for _t, deleted, written in changes),
+        )
+
+    async def close(self) -> None:
+        def close(conn: sqlite3.Connection) -> None:
+            conn.close()
+            self._conn = None
+
+        if self._conn is not None:
+            await self._run(close)
+        self._executor.shutdown()
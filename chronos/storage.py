@@ -0,0 +1,741 @@
+import typing as t
+import abc
+import asyncio
+
+import discord
+import structlog  # type: ignore
+import pydantic
+
+from . import codec
+from .metrics import Metrics
+from .models import GuildStorage, Storage
+
+MANIFEST_PREFIX = "chronos:manifest:"
+PARTITION_MANIFEST_PREFIX = "chronos:manifest@"
+SHARD_PREFIX = "chronos:shard:"
+JOURNAL_PREFIX = "chronos:journal:"
+# Every message the bot writes to storage starts with this
+PREFIX = "chronos:"
+
+# Discord's maximum message length
+MESSAGE_LIMIT = 2000
+# The largest ID a message can have, standing in for those not sent yet
+MAX_ID = (1 << 64) - 1
+
+
+class StorageTooLarge(Exception):
+    pass
+
+
+class ShardCountChanged(Exception):
+    """The storage was partitioned for another number of gateway shards
+
+    Guilds are partitioned by their shard, so running with another count would
+    lose every guild which moved to another shard."""
+
+    def __init__(self, stored: int, shard_count: int) -> None:
+        super().__init__(
+            f"Storage was partitioned for {stored} shards, not {shard_count}: "
+            f"run with SHARD_COUNT={stored}"
+        )
+        self.stored = stored
+        self.shard_count = shard_count
+
+
+class Store(abc.ABC):
+    """Somewhere the bot's storage is kept
+
+    Saving is told which guilds changed, so a store can write just those."""
+
+    @abc.abstractmethod
+    async def load(self) -> Storage:
+        ...
+
+    @abc.abstractmethod
+    async def save(self, storage: Storage, dirty: t.Set[int]) -> None:
+        "Write out the given guilds' storage"
+
+    async def close(self) -> None:
+        "Release whatever the store holds on to"
+
+    def check_fits(self, guild_id: int, guild: GuildStorage) -> None:
+        """Raise StorageTooLarge if the guild's storage couldn't be saved, so
+        changes can be checked before they're made. Stores without a size
+        limit accept anything"""
+
+
+class Manifest(pydantic.BaseModel):
+    # shard message ID -> IDs of the messages the shard carries on into, if it's
+    # too large for one. Shards are kept in the order they were created in
+    shards: t.Dict[int, t.List[int]] = {}
+    # The journal is made of the journal messages after this one, if any
+    journal_after: t.Optional[int] = None
+    # How many gateway shards a partition's storage was written for
+    shard_count: t.Optional[int] = None
+
+
+class MessageStore(Store):
+    """Keeps the bot's storage in a set of messages in the storage channel
+
+    The storage is split into shards, each holding the storage for some guilds
+    and each kept in its own message, so that no single message goes over
+    Discord's size limit. A guild too large for one message gets a shard of its
+    own, which carries on into as many more messages as it needs. A manifest
+    message lists the shards and their messages, and saving only rewrites the
+    shards that contain a changed guild.
+
+    In journal mode, saving instead sends a message with just the records
+    which changed, and every compact_after saves the journal is compacted by
+    rewriting the shards of the guilds in it and deleting its messages. Loading
+    replays whatever journal is left on top of the shards."""
+
+    def __init__(
+        self,
+        client: discord.Client,
+        channel_id: int,
+        manifest_id: t.Optional[int] = None,
+        metrics: t.Optional[Metrics] = None,
+        journal: bool = False,
+        compact_after: int = 50,
+        partition: t.Optional[int] = None,
+        shard_count: t.Optional[int] = None,
+    ) -> None:
+        self.client = client
+        self.channel_id = channel_id
+        self.manifest_id = manifest_id
+        self.metrics = metrics or Metrics()
+        self.journal = journal
+        self.compact_after = compact_after
+
+        # Partitions keep their messages apart by tagging their prefixes
+        self.partition = partition
+        self.shard_count = shard_count
+        tag = "" if partition is None else f"@{partition}"
+        self.manifest_prefix = f"{PREFIX}manifest{tag}:"
+        self.shard_prefix = f"{PREFIX}shard{tag}:"
+        self.journal_prefix = f"{PREFIX}journal{tag}:"
+
+        self._channel_cache: t.Optional[discord.TextChannel] = None
+
+        self._manifest = Manifest()
+        self._manifest_msg: t.Optional[discord.Message] = None
+        # Whether the manifest lists each shard's guilds, as it did before
+        # shards could carry on into more messages
+        self._manifest_outdated = False
+        # The messages of every shard, by their ID
+        self._shard_msgs: t.Dict[int, discord.Message] = {}
+
+        # shard ID -> IDs of the guilds stored in it, sorted
+        self._shard_guilds: t.Dict[int, t.List[int]] = {}
+        # guild ID -> ID of the shard it's stored in
+        self._guild_shard: t.Dict[int, int] = {}
+
+        # A storage message from before sharding, to be replaced on save
+        self._legacy_msg: t.Optional[discord.Message] = None
+        # The manifests of other partitions, seen while looking for this one's
+        self._partition_manifests: t.List[discord.Message] = []
+
+        # Guilds whose shards were written in an older format
+        self._outdated: t.Set[int] = set()
+
+        # The journal's messages, and the guilds they changed
+        self._journal: t.List[discord.Message] = []
+        self._journalled: t.Set[int] = set()
+        # guild ID -> its records as last saved, in journal mode
+        self._records: t.Dict[int, t.Dict[codec.RecordKey, bytes]] = {}
+
+    async def _channel(self) -> discord.TextChannel:
+        if self._channel_cache is None:
+            # Prefer the gateway's cache, and only go over HTTP if it's missing
+            chan = self.client.get_channel(self.channel_id)
+            if chan is None:
+                chan = await self.client.fetch_channel(self.channel_id)
+            assert isinstance(chan, discord.TextChannel)
+            self._channel_cache = chan
+        return self._channel_cache
+
+    async def _find_manifest(self, channel: discord.TextChannel) -> None:
+        "Look for the manifest, or failing that for a pre-sharding storage message"
+        logger = structlog.get_logger().bind()
+
+        if self.manifest_id is not None and self.partition is None:
+            try:
+                self._manifest_msg = await channel.fetch_message(self.manifest_id)
+                return
+            except discord.NotFound:
+                logger.error("load.configured_manifest_missing", id=self.manifest_id)
+
+        # The manifest is pinned when it's created, so look there next
+        for msg in await channel.pins():
+            if msg.author == self.client.user and msg.content.startswith(
+                self.manifest_prefix
+            ):
+                self._manifest_msg = msg
+                return
+
+        # Finally, fall back to searching the channel's history
+        async for msg in channel.history(limit=None):
+            if msg.author != self.client.user:
+                continue
+            if msg.content.startswith(self.manifest_prefix):
+                self._manifest_msg = msg
+                self._legacy_msg = None
+                return
+            if self.partition is not None and msg.content.startswith(
+                PARTITION_MANIFEST_PREFIX
+            ):
+                self._partition_manifests.append(msg)
+            if (
+                self._legacy_msg is None
+                and self.partition is None
+                and not msg.content.startswith(PREFIX)
+            ):
+                self._legacy_msg = msg
+
+    async def _fetch_shards(
+        self, channel: discord.TextChannel
+    ) -> t.Dict[int, discord.Message]:
+        "Fetch all the shard messages listed in the manifest"
+        wanted = {
+            msg_id
+            for shard_id, continuations in self._manifest.shards.items()
+            for msg_id in [shard_id, *continuations]
+        }
+        found: t.Dict[int, discord.Message] = {}
+        if not wanted:
+            return found
+
+        # Walking the history from the oldest shard fetches up to 100 messages
+        # per request, which beats fetching each shard by itself
+        oldest = discord.Object(id=min(wanted) - 1)
+        async for msg in channel.history(limit=None, after=oldest, oldest_first=True):
+            if msg.id in wanted:
+                found[msg.id] = msg
+                if len(found) == len(wanted):
+                    break
+        return found
+
+    async def load(self) -> Storage:
+        logger = structlog.get_logger().bind()
+
+        channel = await self._channel()
+        await self._find_manifest(channel)
+
+        if self._manifest_msg is None:
+            if self.partition is not None:
+                self._check_partitions()
+                return await self._load_unpartitioned()
+            if self._legacy_msg is None:
+                logger.debug("load.no_storage")
+                return Storage()
+
+            logger.info("load.legacy_storage", message=self._legacy_msg.id)
+            return codec.decode_storage(self._legacy_msg.content)
+
+        logger.info("load.found_manifest", message=self._manifest_msg.id)
+        content = self._manifest_msg.content[len(self.manifest_prefix) :]  # noqa
+        shards, journal_after, listed, shard_count = codec.decode_manifest(content)
+        self._check_shard_count(shard_count)
+        self._manifest = Manifest(
+            shards={shard_id: [] for shard_id in shards} if listed else shards,
+            journal_after=journal_after,
+            shard_count=shard_count,
+        )
+        self._manifest_outdated = listed
+        shard_msgs = await self._fetch_shards(channel)
+
+        storage = Storage()
+        for shard_id, continuations in self._manifest.shards.items():
+            msg_ids = [shard_id, *continuations]
+            if any(msg_id not in shard_msgs for msg_id in msg_ids):
+                logger.error("load.missing_shard", shard=shard_id)
+                continue
+
+            shard_content = "".join(
+                shard_msgs[msg_id].content[len(self.shard_prefix) :]  # noqa
+                for msg_id in msg_ids
+            )
+            shard = codec.decode_storage(shard_content)
+            for msg_id in msg_ids:
+                self._shard_msgs[msg_id] = shard_msgs[msg_id]
+
+            # An interrupted save may have left stale copies of guilds behind in
+            # the shard they were moving out of. Guilds only ever move to newer
+            # shards, so a later shard's copy wins, and older manifests say
+            # outright which guilds live in each shard
+            guild_ids = shards[shard_id] if listed else list(shard.guilds)
+            if not codec.is_encoded(shard_content):
+                self._outdated.update(guild_ids)
+            for guild_id in guild_ids:
+                if guild_id in shard.guilds:
+                    storage.guilds[guild_id] = shard.guilds[guild_id]
+                    self._guild_shard[guild_id] = shard_id
+        self._index_shards(self._guild_shard)
+
+        if self._manifest.journal_after is not None:
+            await self._replay_journal(channel, storage)
+        if self.journal:
+            self._records = {
+                guild_id: codec.guild_records(guild)
+                for guild_id, guild in storage.guilds.items()
+            }
+
+        logger.info(
+            "load.storage",
+            shards=len(self._manifest.shards),
+            journal=len(self._journal),
+            guilds=len(storage.guilds),
+        )
+        return storage
+
+    def _check_shard_count(self, shard_count: t.Optional[int]) -> None:
+        "Refuse storage written for another shard count than this partition's"
+        if (
+            shard_count is not None
+            and self.shard_count is not None
+            and shard_count != self.shard_count
+        ):
+            raise ShardCountChanged(shard_count, self.shard_count)
+
+    def _check_partitions(self) -> None:
+        """Make sure no other partition was written for another shard count
+
+        Otherwise, this partition has no storage of its own because the shard
+        count changed, and the storage from before partitioning is stale."""
+        for msg in self._partition_manifests:
+            _partition, _colon, content = msg.content[
+                len(PARTITION_MANIFEST_PREFIX) :  # noqa
+            ].partition(":")
+            try:
+                _shards, _journal, _listed, shard_count = codec.decode_manifest(content)
+            except codec.CodecError:
+                continue
+            self._check_shard_count(shard_count)
+
+    async def _load_unpartitioned(self) -> Storage:
+        """Start a new partition from the storage written without partitions
+
+        That storage is only read, and the partition's guilds are written to
+        its own shards on its first save."""
+        logger = structlog.get_logger().bind(partition=self.partition)
+
+        source = MessageStore(self.client, self.channel_id, self.manifest_id)
+        storage = await source.load()
+        self._outdated = set(storage.guilds)
+        logger.info("load.unpartitioned_storage", guilds=len(storage.guilds))
+        return storage
+
+    async def _replay_journal(
+        self, channel: discord.TextChannel, storage: Storage
+    ) -> None:
+        "Apply the journal's deltas to the storage loaded from the shards"
+        logger = structlog.get_logger().bind()
+
+        assert self._manifest.journal_after is not None
+        after = discord.Object(id=self._manifest.journal_after)
+        async for msg in channel.history(limit=None, after=after, oldest_first=True):
+            if msg.author != self.client.user or not msg.content.startswith(
+                self.journal_prefix
+            ):
+                continue
+            try:
+                changed = codec.apply_delta(
+                    storage, msg.content[len(self.journal_prefix) :]  # noqa
+                )
+            except codec.CodecError as e:
+                logger.error("load.invalid_journal", message=msg.id, error=e)
+                continue
+            self._journal.append(msg)
+            self._journalled.update(changed)
+
+    def _index_shards(self, guild_shard: t.Dict[int, int]) -> None:
+        "Keep track of which shard each guild is stored in"
+        self._guild_shard = guild_shard
+        self._shard_guilds = {shard_id: [] for shard_id in self._manifest.shards}
+        for guild_id, shard_id in sorted(guild_shard.items()):
+            self._shard_guilds.setdefault(shard_id, []).append(guild_id)
+
+    def _pack(
+        self, storage: Storage, guild_ids: t.List[int]
+    ) -> t.List[t.Tuple[t.List[str], t.List[int]]]:
+        """Encode the given guilds into as few shards as will fit, as the
+        contents of each shard's messages
+
+        A guild too large for one message is put in a shard by itself, which
+        carries on into as many messages as it needs."""
+        limit = MESSAGE_LIMIT - len(self.shard_prefix)
+        packed: t.List[t.Tuple[str, t.List[int]]] = []
+        current: t.Dict[int, GuildStorage] = {}
+        current_text = ""
+
+        for guild_id in guild_ids:
+            current[guild_id] = storage.guilds[guild_id]
+            text = codec.encode_storage(Storage(guilds=current))
+            if len(text) <= limit or len(current) == 1:
+                current_text = text
+                continue
+
+            del current[guild_id]
+            packed.append((current_text, list(current)))
+            current = {guild_id: storage.guilds[guild_id]}
+            current_text = codec.encode_storage(Storage(guilds=current))
+
+        if current:
+            packed.append((current_text, list(current)))
+        return [
+            (
+                [
+                    self.shard_prefix + text[i : i + limit]  # noqa
+                    for i in range(0, len(text), limit)
+                ],
+                shard_guilds,
+            )
+            for text, shard_guilds in packed
+        ]
+
+    def _check_manifest(self, manifest: Manifest, created: t.List[int]) -> None:
+        """Make sure the manifest still fits in a message once shards of the
+        given numbers of messages are added to it, before anything is written"""
+        shards = dict(manifest.shards)
+        for i, messages in enumerate(created):
+            shards[MAX_ID - i] = [MAX_ID] * (messages - 1)
+        # Uncompressed and with the largest IDs there are, this is as large as
+        # the manifest can turn out
+        content = self.manifest_prefix + codec.encode_manifest(
+            shards, MAX_ID, self.shard_count, compress=False
+        )
+        if len(content) > MESSAGE_LIMIT:
+            raise StorageTooLarge("Storage manifest is too large")
+
+    def check_fits(self, guild_id: int, guild: GuildStorage) -> None:
+        shards = dict(self._manifest.shards)
+        shard_id = self._guild_shard.get(guild_id)
+        if shard_id is not None and shards.get(shard_id):
+            # A shard which carries on into more messages only holds this
+            # guild, and would be replaced by the new one
+            del shards[shard_id]
+        limit = MESSAGE_LIMIT - len(self.shard_prefix)
+        text = codec.encode_storage(Storage(guilds={guild_id: guild}))
+        self._check_manifest(Manifest(shards=shards), [-(-len(text) // limit)])
+
+    async def save(self, storage: Storage, dirty: t.Set[int]) -> None:
+        "Write out the given guilds, to the journal or to their shards"
+        if (
+            self.journal
+            and self._manifest_msg is not None
+            and self._legacy_msg is None
+            and not self._outdated
+            and await self._append_journal(storage, dirty)
+        ):
+            return
+        await self._save_shards(storage, dirty)
+
+    async def _append_journal(self, storage: Storage, dirty: t.Set[int]) -> bool:
+        "Send the guilds' changed records to the journal, if it has room for them"
+
+        logger = structlog.get_logger().bind()
+
+        deltas = {}
+        records = {}
+        for guild_id in sorted(dirty):
+            guild = storage.guilds.get(guild_id)
+            if guild is None:
+                continue
+            new = records[guild_id] = codec.guild_records(guild)
+            old = self._records.get(guild_id, {})
+            written = {key: body for key, body in new.items() if old.get(key) != body}
+            removed = [key for key in old if key not in new]
+            if written or removed:
+                deltas[guild_id] = (written, removed)
+
+        if not deltas:
+            return True
+        if len(self._journal) >= self.compact_after:
+            return False
+        content = self.journal_prefix + codec.encode_delta(deltas)
+        if len(content) > MESSAGE_LIMIT:
+            return False
+
+        channel = await self._channel()
+        if self._manifest.journal_after is None:
+            # Record where the journal starts, so loading knows to replay it
+            assert self._manifest_msg is not None
+            manifest = self._manifest.copy()
+            manifest.journal_after = self._manifest_msg.id
+            manifest.shard_count = self.shard_count
+            await self._save_manifest(channel, manifest)
+
+        msg = await channel.send(content)
+        self.metrics.storage_payload.observe(len(content), kind="journal")
+        logger.info("store.journalled", message=msg.id, guilds=len(deltas))
+        self._journal.append(msg)
+        self._journalled.update(deltas)
+        self._records.update(records)
+        return True
+
+    async def _delete_journal(self, channel: discord.TextChannel) -> None:
+        logger = structlog.get_logger().bind()
+
+        journal, self._journal = self._journal, []
+        for i in range(0, len(journal), 100):
+            batch = journal[i : i + 100]  # noqa
+            try:
+                await channel.delete_messages(batch)
+            except discord.HTTPException:
+                # Bulk deletes fail for messages older than two weeks
+                for msg in batch:
+                    try:
+                        await msg.delete()
+                    except discord.NotFound:
+                        pass
+        logger.info("store.compacted_journal", messages=len(journal))
+
+    async def _save_shards(self, storage: Storage, dirty: t.Set[int]) -> None:
+        "Write out the shards containing the given guilds"
+
+        logger = structlog.get_logger().bind()
+
+        # Guilds changed by the journal are written too, so it can be deleted
+        dirty = dirty | self._journalled
+        if self._legacy_msg is not None:
+            dirty = set(storage.guilds)
+        elif self._outdated:
+            dirty = dirty | self._outdated
+
+        # Figure out which shards need rewriting and which guilds go in them,
+        # putting new guilds in the newest shard unless it carries on into more
+        # messages, since those are only ever rewritten as a whole
+        affected: t.Dict[t.Optional[int], t.List[int]] = {}
+        last_shard = next(reversed(self._manifest.shards), None)
+        if last_shard is not None and (
+            self._manifest.shards[last_shard] or last_shard not in self._shard_msgs
+        ):
+            last_shard = None
+        for guild_id in sorted(dirty):
+            if guild_id not in storage.guilds:
+                continue
+
+            shard_id = self._guild_shard.get(guild_id)
+            if shard_id is not None:
+                affected.setdefault(shard_id, list(self._shard_guilds[shard_id]))
+            elif last_shard is not None:
+                affected.setdefault(
+                    last_shard, list(self._shard_guilds[last_shard])
+                ).append(guild_id)
+            else:
+                affected.setdefault(None, []).append(guild_id)
+
+        # Each shard's guilds are kept sorted
+        for guild_ids in affected.values():
+            guild_ids.sort()
+
+        # Taken before yielding, since changes made during the save are saved
+        # again later and mustn't count as saved already
+        records = (
+            {
+                guild_id: codec.guild_records(storage.guilds[guild_id])
+                for guild_id in dirty
+                if guild_id in storage.guilds
+            }
+            if self.journal
+            else {}
+        )
+
+        if not affected:
+            return
+
+        manifest = Manifest(
+            shards=dict(self._manifest.shards),
+            journal_after=self._manifest.journal_after,
+            shard_count=self.shard_count,
+        )
+        guild_shard = dict(self._guild_shard)
+        edits: t.List[t.Tuple[int, str]] = []
+        # The contents of the shards to create, with their guilds
+        created: t.List[t.Tuple[t.List[str], t.List[int]]] = []
+        # The messages of shards replaced by newly created ones
+        replaced: t.List[int] = []
+
+        for shard_id, guild_ids in affected.items():
+            chunks = self._pack(storage, guild_ids)
+            if shard_id is not None:
+                contents, shard_guilds = chunks[0]
+                if len(contents) == 1 and not manifest.shards[shard_id]:
+                    # A shard of one message is edited in place
+                    chunks.pop(0)
+                    edits.append((shard_id, contents[0]))
+                    guild_shard.update(
+                        (guild_id, shard_id) for guild_id in shard_guilds
+                    )
+                else:
+                    # Messages can't be edited all at once, so a shard which
+                    # carries on into more of them is replaced as a whole
+                    replaced += [shard_id, *manifest.shards.pop(shard_id)]
+            created += chunks
+
+        self._check_manifest(manifest, [len(contents) for contents, _ in created])
+        for contents, _guilds in created:
+            for content in contents:
+                self.metrics.storage_payload.observe(len(content), kind="shard")
+        for _shard_id, content in edits:
+            self.metrics.storage_payload.observe(len(content), kind="shard")
+
+        # Create new shards before touching anything the manifest points to,
+        # so an interrupted save never leaves the manifest pointing at a shard
+        # which lost its guilds
+        channel = await self._channel()
+        for contents, shard_guilds in created:
+            msgs = [await channel.send(content) for content in contents]
+            logger.info("store.created_shard", shard=msgs[0].id, messages=len(msgs))
+            self._shard_msgs.update((msg.id, msg) for msg in msgs)
+            manifest.shards[msgs[0].id] = [msg.id for msg in msgs[1:]]
+            guild_shard.update((guild_id, msgs[0].id) for guild_id in shard_guilds)
+
+        if (
+            manifest != self._manifest
+            or self._manifest_msg is None
+            or self._manifest_outdated
+        ):
+            await self._save_manifest(channel, manifest)
+        self._index_shards(guild_shard)
+
+        for shard_id, content in edits:
+            try:
+                await self._shard_msgs[shard_id].edit(content=content)
+            except discord.NotFound:
+                # The shard was deleted out from under us, so make a new one
+                logger.error("store.missing_shard", shard=shard_id)
+                del self._shard_msgs[shard_id]
+                msg = await channel.send(content)
+                self._shard_msgs[msg.id] = msg
+                manifest = manifest.copy()
+                manifest.shards = dict(manifest.shards)
+                manifest.shards[msg.id] = manifest.shards.pop(shard_id)
+                await self._save_manifest(channel, manifest)
+                self._index_shards(
+                    {
+                        guild_id: msg.id if stored == shard_id else stored
+                        for guild_id, stored in self._guild_shard.items()
+                    }
+                )
+            else:
+                logger.info("store.edited_shard", shard=shard_id)
+
+        # The manifest no longer points to the replaced shards, so failing to
+        # delete them only leaves some messages behind
+        for msg_id in replaced:
+            try:
+                await self._shard_msgs.pop(msg_id).delete()
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                logger.warning("store.delete_failed", message=msg_id, error=e)
+        if replaced:
+            logger.info("store.replaced_shards", messages=len(replaced))
+
+        if self._journal:
+            # Only move the journal past its messages once the shards hold
+            # their changes, so an interrupted save replays them again
+            manifest = manifest.copy()
+            manifest.journal_after = self._journal[-1].id
+            await self._save_manifest(channel, manifest)
+            await self._delete_journal(channel)
+        self._journalled = set()
+        self._outdated = set()
+        self._records.update(records)
+
+        if self._legacy_msg is not None:
+            logger.info("store.migrated_legacy", message=self._legacy_msg.id)
+            await self._legacy_msg.delete()
+            self._legacy_msg = None
+
+    async def _save_manifest(
+        self, channel: discord.TextChannel, manifest: Manifest
+    ) -> None:
+        "Write out the manifest, only keeping it once it's been written"
+        content = self.manifest_prefix + codec.encode_manifest(
+            manifest.shards, manifest.journal_after, manifest.shard_count
+        )
+        if len(content) > MESSAGE_LIMIT:
+            raise StorageTooLarge("Storage manifest is too large")
+        self.metrics.storage_payload.observe(len(content), kind="manifest")
+
+        if self._manifest_msg is not None:
+            try:
+                await self._manifest_msg.edit(content=content)
+            except discord.NotFound:
+                self._manifest_msg = None
+
+        if self._manifest_msg is None:
+            self._manifest_msg = await channel.send(content)
+            logger = structlog.get_logger().bind(message=self._manifest_msg.id)
+            logger.info("store.created_manifest")
+
+            # Pin the manifest so the next load can find it without a history
+            # scan
+            try:
+                await self._manifest_msg.pin()
+            except discord.HTTPException as e:
+                logger.warning("store.pin_failed", error=e)
+
+        self._manifest = manifest
+        self._manifest_outdated = False
+
+
+def shard_of(guild_id: int, shard_count: int) -> int:
+    "Find which of Discord's gateway shards a guild belongs to"
+    return (guild_id >> 22) % shard_count
+
+
+class PartitionedStore(Store):
+    """Keeps the guilds of each gateway shard in a store of their own
+
+    Each process of a sharded bot only saves the guilds of its own shards, to
+    its own shards' stores, so processes never write over each other's data."""
+
+    def __init__(self, stores: t.Dict[int, Store], shard_count: int) -> None:
+        self.stores = stores
+        self.shard_count = shard_count
+
+    def _partition(self, storage: Storage, shard: int) -> Storage:
+        return Storage.construct(
+            guilds={
+                guild_id: guild
+                for guild_id, guild in storage.guilds.items()
+                if shard_of(guild_id, self.shard_count) == shard
+            }
+        )
+
+    async def load(self) -> Storage:
+        shards = list(self.stores)
+        loaded = await asyncio.gather(*(self.stores[shard].load() for shard in shards))
+
+        # A store may hold guilds from before it was partitioned, or from
+        # before the shard count changed, which other shards own now
+        storage = Storage()
+        for shard, part in zip(shards, loaded):
+            storage.guilds.update(self._partition(part, shard).guilds)
+        return storage
+
+    async def save(self, storage: Storage, dirty: t.Set[int]) -> None:
+        by_shard: t.Dict[int, t.Set[int]] = {}
+        for guild_id in dirty:
+            by_shard.setdefault(shard_of(guild_id, self.shard_count), set()).add(
+                guild_id
+            )
+        await asyncio.gather(
+            *(
+                self.stores[shard].save(self._partition(storage, shard), guild_ids)
+                for shard, guild_ids in by_shard.items()
+                if shard in self.stores
+            )
+        )
+
+    def check_fits(self, guild_id: int, guild: GuildStorage) -> None:
+        store = self.stores.get(shard_of(guild_id, self.shard_count))
+        if store is not None:
+            store.check_fits(guild_id, guild)
+
+    async def close(self) -> None:
+        for store in self.stores.values():
+            await store.close()
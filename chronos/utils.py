@@ -1,9 +1,14 @@
 import typing as t
-from datetime import timezone, timedelta
+from datetime import datetime
 
 
-def utc(offset: int) -> timezone:
-    return timezone(timedelta(hours=offset))
+def parse_time(text: str) -> datetime:
+    "Parse a time written by a human, with HumanTime"
+    # HumanTime is only imported once a time is first parsed, to keep it off
+    # the startup path
+    import HumanTime as human_time  # type: ignore
+
+    return t.cast(datetime, human_time.parseTime(text))
 
 
 class HasId(t.Protocol):
@@ -0,0 +1,109 @@
+"""Timezones of party members
+
+A member's timezone is stored as a key, which is either a fixed offset from UTC
+like "+05:30", or the name of an IANA zone like "America/St_Johns" whose offset
+follows daylight saving time. Each key is turned into a tzinfo object once and
+that object is reused, and a zone's offset is cached per day, since it only
+changes on the rare days with a transition."""
+
+import typing as t
+import functools
+import re
+import sys
+from datetime import date, datetime, timedelta, timezone, tzinfo
+
+if sys.version_info >= (3, 9):
+    import zoneinfo
+else:
+    from backports import zoneinfo
+
+# Offsets as users write them, like "5", "-3:30", "+0545" or "UTC+10"
+_OFFSET_RE = re.compile(r"(?:UTC|GMT)?\s*([+-]?)(\d{1,2})(?::?(\d{2}))?", re.IGNORECASE)
+
+# Real offsets range from UTC-12 to UTC+14
+MAX_OFFSET_MINUTES = 14 * 60
+
+_DAY = timedelta(days=1)
+_LAST_MICROSECOND = timedelta(microseconds=1)
+
+
+def fixed_key(minutes: int) -> str:
+    "Make the key of a fixed offset from UTC, given in minutes"
+    sign = "-" if minutes < 0 else "+"
+    hours, minutes = divmod(abs(minutes), 60)
+    return f"{sign}{hours:02}:{minutes:02}"
+
+
+def is_fixed(key: str) -> bool:
+    return key[0] in "+-"
+
+
+@functools.lru_cache(maxsize=None)
+def _zone_names() -> t.Dict[str, str]:
+    # Listing the IANA zones reads the whole database, so it's only done once
+    return {name.lower(): name for name in zoneinfo.available_timezones()}
+
+
+def parse(text: str) -> str:
+    "Turn a timezone written by a user into a key, raising ValueError if invalid"
+    match = _OFFSET_RE.fullmatch(text.strip())
+    if match is not None:
+        sign, hours, minutes = match.groups()
+        if minutes is not None and int(minutes) >= 60:
+            raise ValueError(f"Invalid UTC offset {text!r}")
+        offset = int(hours) * 60 + int(minutes or 0)
+        if offset > MAX_OFFSET_MINUTES:
+            raise ValueError(f"UTC offset {text!r} is out of range")
+        return fixed_key(-offset if sign == "-" else offset)
+
+    name = _zone_names().get(text.strip().lower())
+    if name is None:
+        raise ValueError(f"Unknown timezone {text!r}")
+    return name
+
+
+@functools.lru_cache(maxsize=None)
+def get(key: str) -> tzinfo:
+    "Get the (shared) tzinfo object for a key"
+    if is_fixed(key):
+        hours, minutes = key[1:].split(":")
+        offset = timedelta(hours=int(hours), minutes=int(minutes))
+        return timezone(-offset if key[0] == "-" else offset)
+    return zoneinfo.ZoneInfo(key)
+
+
+@functools.lru_cache(maxsize=4096)
+def _daily_offset(key: str, day: date) -> t.Optional[timedelta]:
+    "A zone's offset over a whole UTC day, or None if it changes that day"
+    tz = get(key)
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    first = start.astimezone(tz).utcoffset()
+    last = (start + _DAY - _LAST_MICROSECOND).astimezone(tz).utcoffset()
+    return first if first == last else None
+
+
+def utcoffset(key: str, when: datetime) -> timedelta:
+    "Get a zone's offset from UTC at an aware datetime"
+    when = when.astimezone(timezone.utc)
+    offset = _daily_offset(key, when.date())
+    if offset is None:
+        offset = t.cast(timedelta, when.astimezone(get(key)).utcoffset())
+    return offset
+
+
+def local_time(key: str, when: datetime) -> datetime:
+    "Get the (naive) local time in a zone at an aware datetime"
+    return when.astimezone(timezone.utc).replace(tzinfo=None) + utcoffset(key, when)
+
+
+@functools.lru_cache(maxsize=None)
+def _format_offset(offset: timedelta) -> str:
+    minutes = int(offset.total_seconds()) // 60
+    key = fixed_key(minutes)
+    return f"UTC{key[:3]}" if minutes % 60 == 0 else f"UTC{key}"
+
+
+def describe(key: str, when: datetime) -> str:
+    "Describe a zone, with its offset at an aware datetime"
+    offset = _format_offset(utcoffset(key, when))
+    return offset if is_fixed(key) else f"{key}, {offset}"